@@ -1,44 +1,169 @@
 from flask import Flask, render_template, redirect, url_for, flash, request, send_from_directory, jsonify, abort
+from flask import stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, SelectMultipleField, IntegerField
 from wtforms.validators import DataRequired, Length, ValidationError, Optional
-from extensions import db, login_manager, bcrypt
+from extensions import db, login_manager, cache, sql_metrics
 from models import *
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField
-from sqlalchemy import and_, or_, func
-import os
+from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField, BooleanField, HiddenField
+from sqlalchemy import and_, or_, func, event
+from sqlalchemy.orm import make_transient_to_detached
 from werkzeug.utils import secure_filename
-from PIL import Image
-import uuid
 from flask_migrate import Migrate
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
+import csv
+import os
+import mimetypes
+import click
+import time
+import database
+import search
+import facets
+import conditional
+import compression
+import fragments
+import server
+import covers
+import importer
+import exporter
+import enrichment
+import duplicates
+import library_stats
+import reading_activity
+import recommendations
+import library_batch
+import passwords
+import benchmarks
+import io
+from pagination import KeysetPagination, apply_order
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'tajny-klucz-123'  # 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///czytelnia.db'
-
+# baza: DATABASE_URL (domyślnie sqlite:///czytelnia.db), pula PostgreSQL: DB_POOL_SIZE,
+# DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE; PRAGMA SQLite: SQLITE_PRAGMAS - patrz database.py
+# 'keyset' - kursory next/prev bez COUNT(*); ?page=N nadal działa po staremu
+app.config['PAGINATION_MODE'] = 'keyset'
+app.config['PAGINATION_MAX_PER_PAGE'] = 100  # ?per_page=N jest przycinane do 1..100
+
+# 'memory' jest osobny w każdym workerze gunicorna; przy kilku workerach lepiej 'redis'
+app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['CACHE_DEFAULT_TTL'] = 300
+app.config['CACHE_MAX_ENTRIES'] = 4096  # backend 'memory'; karty książek to po jednym wpisie na książkę i wariant
+# {% cache %} w szablonach - karty książek kluczowane id i Book.updated_at
+app.config['FRAGMENT_CACHE_ENABLED'] = True
+app.config['FRAGMENT_CACHE_TTL'] = 3600
+# skompilowane szablony Jinja (domyślnie instance/jinja_cache); None wyłącza
+app.config['JINJA_BYTECODE_CACHE_DIR'] = os.environ.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+# liczniki zapytań SQL na endpoint, /metrics dla Prometheusa
+app.config['SQL_N_PLUS_ONE_THRESHOLD'] = 5
+# nagłówek Server-Timing (db/app) w każdej odpowiedzi; flask loadtest --url czyta z niego liczbę zapytań
+app.config['SQL_SERVER_TIMING'] = os.environ.get('SQL_SERVER_TIMING') == '1'
+app.config['METRICS_TOKEN'] = None  # jeśli ustawiony, /metrics wymaga 'Authorization: Bearer <token>'
+# gzip/br dla HTML i JSON od tego rozmiaru (bajty); br wymaga pakietu Brotli
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_GZIP_LEVEL'] = 6
+app.config['COMPRESS_BROTLI_QUALITY'] = 5
+# bcrypt w puli procesów (0 = w wątku żądania); zmiana BCRYPT_LOG_ROUNDS przelicza hash przy logowaniu
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['AUTH_HASH_WORKERS'] = 2
+app.config['AUTH_HASH_QUEUE'] = 8  # oczekujących ponad liczbę procesów; dalej 503
+app.config['USER_CACHE_TTL'] = 60  # s; 0 wyłącza cache użytkownika w load_user
+# flask serve / gunicorn -c gunicorn.conf.py wsgi:app; SERVER_WORKERS 0 = 2 x rdzenie + 1
+app.config['SERVER_BIND'] = os.environ.get('SERVER_BIND', '127.0.0.1:8000')
+app.config['SERVER_WORKERS'] = int(os.environ.get('WEB_CONCURRENCY', 0))
+app.config['SERVER_THREADS'] = 1  # > 1 przełącza workery na gthread
+app.config['SERVER_TIMEOUT'] = int(os.environ.get('SERVER_TIMEOUT', 30))  # s; dłużej zajęty worker jest zabijany
+# s na dokończenie żądań przy SIGTERM i przy wymianie workerów po SIGHUP
+app.config['SERVER_GRACEFUL_TIMEOUT'] = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+app.config['SERVER_KEEPALIVE'] = 5
+app.config['SERVER_MAX_REQUESTS'] = 0  # restart workera po tylu żądaniach (0 = nigdy)
+# kill -HUP $(cat plik) - łagodna wymiana workerów; nowy kod (aplikacja wczytana przed forkiem) wymaga USR2
+app.config['SERVER_PIDFILE'] = os.environ.get('SERVER_PIDFILE')
+app.config['SERVER_ACCESS_LOG'] = None  # '-' = stdout
+app.config['SERVER_WARMUP_URLS'] = ['/', '/books']
+
+database.configure(app)
 db.init_app(app)
+database.init_engine(app, db)
 login_manager.init_app(app)
+cache.init_app(app)
+sql_metrics.init_app(app)
+passwords.init_app(app)
+conditional.init_app(app)
+compression.init_app(app)
+fragments.init_app(app)
 login_manager.login_view = 'login'
 
-migrate = Migrate(app, db)
+def include_object(object, name, type_, reflected, compare_to):
+    # tabele indeksu pełnotekstowego tworzy i utrzymuje search.py
+    return not (type_ == 'table' and name.startswith(('books_fts', 'books_search')))
+
+migrate = Migrate(app, db, include_object=include_object)
+benchmarks.init_app(app)
+
+USER_CACHE_COLUMNS = ('id', 'username', 'is_moderator', 'date_joined')
+
+def _user_columns(user_id):
+    row = db.session.query(*[getattr(User, name) for name in USER_CACHE_COLUMNS]).filter(User.id == user_id).first()
+    return dict(zip(USER_CACHE_COLUMNS, row)) if row else None
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    if not app.config['USER_CACHE_TTL']:
+        return db.session.get(User, user_id)
+    # kolumny z cache'u zamiast SELECT-a na każde żądanie; hash hasła nie trafia do cache'u
+    # (nie załadowany atrybut doczyta się przy pierwszym użyciu, tak jak relacje)
+    columns = cache.get_or_set(f'user:{user_id}', lambda: _user_columns(user_id), app.config['USER_CACHE_TTL'])
+    if columns is None:
+        return None
+    user = User(**columns)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_user_cache(mapper, connection, target):
+    cache.delete(f'user:{target.id}')
+
+@app.errorhandler(passwords.Overloaded)
+def auth_overloaded(error):
+    return 'Zbyt wiele logowań naraz, spróbuj za chwilę.', 503, {'Retry-After': '5'}
 
 # files
 app.config['UPLOAD_FOLDER'] = 'static/uploads/covers'
 app.config['ALLOWED_EXTENSIONS'] = {'jpg', 'jpeg', 'png'}
 app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # 2MB limit
+app.config['IMPORT_CHUNK_SIZE'] = 1000
+app.config['EXPORT_BATCH_SIZE'] = 1000  # wierszy pobieranych z kursora i wysyłanych naraz przy eksporcie
+# indeks ISBN z lokalnego zrzutu metadanych (flask build-isbn-index); bez pliku import nic nie uzupełnia
+app.config['ISBN_INDEX_PATH'] = os.environ.get('ISBN_INDEX_PATH') or os.path.join(app.instance_path, 'isbn_index.db')
+app.config['DUPLICATE_THRESHOLD'] = 0.8  # podobieństwo Jaccarda trigramów tytułu i autora uznawane za duplikat
+app.config['DUPLICATE_REPORT_LIMIT'] = 200  # par w raporcie /duplicates
+app.config['READING_GOALS'] = {'year': 50, 'month': 5}
+app.config['LIBRARY_BATCH_MAX_ITEMS'] = 1000  # pozycji w jednym żądaniu /api/library/batch
+app.config['RECOMMENDATION_NEIGHBORS'] = 20  # sąsiedzi zapisywani dla każdej książki
+app.config['FACET_TAG_LIMIT'] = 10  # tagów na liście fasetek /books (wybrane są zawsze widoczne)
+app.config['FACET_ID_FILTER_LIMIT'] = 1000  # do tylu trafień filtr to Book.id IN (...) z indeksu fasetek
+app.config['COVER_WORKERS'] = 2
+app.config['COVER_RENDITIONS'] = {'card': 300, 'detail': 600}  # szerokość w px
+app.config['COVER_MAX_AGE'] = 365 * 24 * 3600
+# 'x-accel' - bajty okładek wysyła nginx; dla apache/lighttpd wystarczy USE_X_SENDFILE
+app.config['COVER_SENDFILE_MODE'] = None
+app.config['COVER_ACCEL_PREFIX'] = '/protected/covers'
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+@app.template_global()
+def cover_src(book, size='card', fmt='jpg'):
+    return covers.rendition_url(book.cover_url, size, fmt)
+
 # Forms
 class RegisterForm(FlaskForm):
     username = StringField('Nazwa użytkownika', validators=[DataRequired(), Length(min=3, max=50)])
@@ -77,6 +202,13 @@ class BookForm(FlaskForm):
     pages = IntegerField('Liczba stron', validators=[Optional()])
     submit = SubmitField('Dodaj książkę')
 
+class AddBookForm(BookForm):
+    allow_duplicate = BooleanField('To inna książka - dodaj mimo to')
+
+class MergeBooksForm(FlaskForm):
+    survivor_id = HiddenField(validators=[DataRequired()])
+    duplicate_id = HiddenField(validators=[DataRequired()])
+
 class ReviewForm(FlaskForm):
     rating = SelectField(
       'Ocena', 
@@ -101,43 +233,115 @@ class GenreForm(FlaskForm):
         if Genre.query.filter(func.lower(Genre.name) == func.lower(field.data)).first():
             raise ValidationError('Gatunek o tej nazwie już istnieje')
 
+BOOK_SORT_ORDERS = {
+    'title_asc': [(Book.title, False)],
+    'title_desc': [(Book.title, True)],
+    'author_asc': [(Book.author, False)],
+    'author_desc': [(Book.author, True)],
+    'newest': [(Book.date_added, True)],
+    'oldest': [(Book.date_added, False)],
+    'best_rated': [(Book.average_rating, True), (Book.rating_count, True)]
+}
+
+LIBRARY_SORT_ORDERS = {
+    'title_asc': [(Book.title, False)],
+    'title_desc': [(Book.title, True)],
+    'author_asc': [(Book.author, False)],
+    'author_desc': [(Book.author, True)],
+    'added_desc': [(UserLibrary.added_at, True)],
+    'added_asc': [(UserLibrary.added_at, False)]
+}
+
+def paginate_query(query, order, per_page):
+    per_page = max(per_page, 1)
+    max_per_page = app.config['PAGINATION_MAX_PER_PAGE']
+    if app.config['PAGINATION_MODE'] == 'keyset' and 'page' not in request.args:
+        return KeysetPagination(query, order, cursor=request.args.get('cursor'), per_page=per_page,
+                                max_per_page=max_per_page)
+    page = request.args.get('page', 1, type=int)
+    return apply_order(query, order).paginate(page=page, per_page=per_page, max_per_page=max_per_page,
+                                              error_out=False)
+
+def cached_book_ids(key, query):
+    return cache.get_or_set(key, lambda: [book_id for (book_id,) in query])
+
+def books_by_ids(*id_lists):
+    ids = {book_id for id_list in id_lists for book_id in id_list}
+    books = {book.id: book for book in Book.query.filter(Book.id.in_(ids))} if ids else {}
+    return [[books[book_id] for book_id in id_list if book_id in books] for id_list in id_lists]
+
+def invalidate_home_cache(*sections):
+    cache.delete(*[f'home:{section}' for section in sections])
+
 def calculate_reading_time(pages):
     if not pages:
         return 0
     return pages * 2  # 2 minutes per page
 
 def get_reading_stats(user_id):
-    total_minutes = db.session.query(
-        db.func.sum(Book.pages * 2)
-    ).join(UserLibrary).filter(
-        UserLibrary.user_id == user_id,
-        Book.pages.isnot(None)
-    ).scalar() or 0
-
-    last_month_minutes = db.session.query(
-        db.func.sum(Book.pages * 2)
-    ).join(UserLibrary).filter(
-        UserLibrary.user_id == user_id,
-        Book.pages.isnot(None),
-        UserLibrary.added_at >= datetime.utcnow() - timedelta(days=30)
-    ).scalar() or 0
-
-    last_year_minutes = db.session.query(
-        db.func.sum(Book.pages * 2)
-    ).join(UserLibrary).filter(
-        UserLibrary.user_id == user_id,
-        Book.pages.isnot(None),
-        UserLibrary.added_at >= datetime.utcnow() - timedelta(days=365)
-    ).scalar() or 0
-
+    activity = reading_activity.summary(user_id)
     return {
-        'total': total_minutes / 60,  # w godzinach
-        'last_month': last_month_minutes / 60,
-        'last_year': last_year_minutes / 60
-    }
+        'total': calculate_reading_time(activity['pages_total']) / 60,  # w godzinach
+        'last_month': calculate_reading_time(activity['pages_last_month']) / 60,
+        'last_year': calculate_reading_time(activity['pages_last_year']) / 60
+    }, activity
+
+def update_book_rating(book_id, rating, delta=1):
+    # jeden UPDATE - równoległe recenzje nie zgubią przyrostów;
+    # wykonywany w transakcji wywołującego
+    new_sum = Book.rating_sum + rating * delta
+    new_count = Book.rating_count + delta
+    histogram_column = getattr(Book, f'rating_{rating}')
+    Book.query.filter_by(id=book_id).update({
+        Book.rating_sum: new_sum,
+        Book.rating_count: new_count,
+        histogram_column: histogram_column + delta,
+        Book.average_rating: db.case(
+            (new_count > 0, db.cast(new_sum, db.Float) / new_count),
+            else_=0
+        )
+    }, synchronize_session=False)
+
+def recalculate_book_ratings():
+    stats = db.session.query(
+        Review.book_id,
+        Review.rating,
+        db.func.count(Review.id)
+    ).group_by(Review.book_id, Review.rating).all()
+
+    aggregates = {}
+    for book_id, rating, count in stats:
+        aggregates.setdefault(book_id, {i: 0 for i in range(1, 6)})[rating] = count
+
+    updated = 0
+    for book in Book.query.all():
+        histogram = aggregates.get(book.id, {i: 0 for i in range(1, 6)})
+        rating_count = sum(histogram.values())
+        rating_sum = sum(rating * count for rating, count in histogram.items())
+        values = {
+            'rating_sum': rating_sum,
+            'rating_count': rating_count,
+            'average_rating': rating_sum / rating_count if rating_count else 0
+        }
+        values.update({f'rating_{i}': histogram[i] for i in range(1, 6)})
+        if any(getattr(book, key) != value for key, value in values.items()):
+            for key, value in values.items():
+                setattr(book, key, value)
+            updated += 1
+    db.session.commit()
+    return updated
+
+@app.cli.command('recalc-ratings')
+def recalc_ratings_command():
+    """Przelicza zapisane średnie i histogramy ocen na podstawie recenzji."""
+    updated = recalculate_book_ratings()
+    click.echo(f'Zaktualizowano oceny {updated} książek.')
 
 class BulkAddBooksForm(FlaskForm):
-    books_data = TextAreaField('Dane książek (JSON)', validators=[DataRequired()])
+    books_data = TextAreaField('Dane książek (JSON)', validators=[Optional()])
+    books_file = FileField('Plik z książkami', validators=[
+        FileAllowed(['json', 'ndjson', 'jsonl', 'csv'], 'Tylko pliki JSON/NDJSON/CSV!')
+    ])
     submit = SubmitField('Dodaj książki')
 
 # Routes
@@ -145,7 +349,7 @@ class BulkAddBooksForm(FlaskForm):
 def register():
     form = RegisterForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = passwords.hash_password(form.password.data)
         user = User(username=form.username.data, password=hashed_password)
         default_shelves = [
             ('Do przeczytania', True),
@@ -173,7 +377,11 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and passwords.check_password(user.password, form.password.data):
+            if passwords.needs_rehash(user.password):
+                # hash ze starym współczynnikiem pracy - przeliczamy, póki znamy hasło
+                user.password = passwords.hash_password(form.password.data)
+                db.session.commit()
             login_user(user)
             return redirect(url_for('home'))  #
         else:
@@ -188,47 +396,52 @@ def logout():
 
 @app.route('/')
 def home():
-    # newest books
-    newest_books = Book.query.order_by(Book.date_added.desc()).limit(6).all()
-    
-    top_rated = db.session.query(
-        Book,
-        db.func.avg(Review.rating).label('average_rating'),
-        db.func.count(Review.id).label('review_count')
-    ).outerjoin(Review).group_by(Book.id).order_by(
-        db.desc('average_rating')
-    ).limit(6).all()
-
-    top_rated_books = []
-    for book, avg_rating, review_count in top_rated:
-        book.average_rating = avg_rating or 0
-        book.review_count = review_count
-        top_rated_books.append(book)
+    # sekcje wspólne dla wszystkich odwiedzających są w cache'u jako listy id, patrz invalidate_home_cache()
+    newest_ids = cached_book_ids(
+        'home:newest',
+        db.session.query(Book.id).order_by(Book.date_added.desc()).limit(6)
+    )
+    top_rated_ids = cached_book_ids(
+        'home:top_rated',
+        db.session.query(Book.id).order_by(
+            Book.average_rating.desc(),
+            Book.rating_count.desc()
+        ).limit(6)
+    )
+    newest_books, top_rated_books = books_by_ids(newest_ids, top_rated_ids)
     
     
     # recommended books
     recommended_books = []
     show_recommendations = False
     
+    has_library_books = False
     if current_user.is_authenticated:
-        if current_user.library_books:
-            user_authors = {entry.book.author for entry in current_user.library_books}
-            user_book_ids = {entry.book_id for entry in current_user.library_books}
-            
-            recommended_books = Book.query.filter(
-                Book.author.in_(user_authors),
-                ~Book.id.in_(user_book_ids)
-            ).limit(5).all()
+        # id i autorzy w jednym zapytaniu zamiast leniwego entry.book dla każdej pozycji
+        library = db.session.query(UserLibrary.book_id, Book.author)\
+            .join(Book, UserLibrary.book_id == Book.id)\
+            .filter(UserLibrary.user_id == current_user.id)\
+            .all()
+        has_library_books = bool(library)
+        if library:
+            # sąsiedzi z book_neighbors (recommendations.py); dopóki ich nie ma - ci sami autorzy
+            recommended_books, = books_by_ids(recommendations.for_user(current_user.id, limit=5))
+            if not recommended_books:
+                user_authors = {author for _, author in library}
+                user_book_ids = {book_id for book_id, _ in library}
+                recommended_books = Book.query.filter(
+                    Book.author.in_(user_authors),
+                    ~Book.id.in_(user_book_ids)
+                ).limit(5).all()
             show_recommendations = True
         else:
-            popular_books = db.session.query(
-                Book,
-                db.func.count(UserLibrary.id).label('user_count')
-            ).join(UserLibrary).group_by(Book.id).order_by(
-                db.desc('user_count')
-            ).limit(5).all()
-            
-            recommended_books = [book for book, count in popular_books]
+            popular_ids = cached_book_ids(
+                'home:popular',
+                db.session.query(Book.id).join(UserLibrary).group_by(Book.id).order_by(
+                    db.func.count(UserLibrary.id).desc()
+                ).limit(5)
+            )
+            recommended_books, = books_by_ids(popular_ids)
             show_recommendations = True
     
     return render_template(
@@ -237,7 +450,7 @@ def home():
         top_rated_books=top_rated_books,
         recommended_books=recommended_books,
         show_recommendations=show_recommendations,
-        has_library_books=current_user.is_authenticated and bool(current_user.library_books)
+        has_library_books=has_library_books
     )
 
 
@@ -248,22 +461,26 @@ def add_book():
         flash('Brak uprawnień!', 'danger')
         return redirect(url_for('home'))
 
-    form = BookForm()
+    form = AddBookForm()
     form.genres.choices = [(g.id, g.name) for g in Genre.query.order_by('name')]
     
     if form.validate_on_submit():
+        # sprawdzenie przed zapisem okładki: jedno zapytanie po indeksie kluczy, nie skan katalogu
+        matches = duplicates.find([{'title': form.title.data, 'author': form.author.data, 'isbn': form.isbn.data}],
+                                  app.config['DUPLICATE_THRESHOLD'])[0]
+        if matches and not form.allow_duplicate.data:
+            flash('Podobna książka jest już w katalogu', 'warning')
+            return render_template('add_book.html', form=form, duplicates=matches)
+
         cover_url = ''
         if form.cover.data:
             file = form.cover.data
             if file and allowed_file(file.filename):
-                filename = secure_filename(f"{uuid.uuid4().hex}.{file.filename.rsplit('.', 1)[1].lower()}")
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                img = Image.open(file_path)
-                img.thumbnail((300, 300))
-                img.save(file_path)
-                cover_url = f"/uploads/covers/{filename}"
+                try:
+                    cover_url = covers.save_upload(app, file)
+                except ValueError:
+                    flash('Nieprawidłowy plik obrazu', 'danger')
+                    return render_template('add_book.html', form=form)
 
         book = Book(
             title=form.title.data,
@@ -272,6 +489,13 @@ def add_book():
             isbn=form.isbn.data,
             cover_url=cover_url
         )
+        isbn_index = enrichment.open_index(app)
+        if isbn_index and book.isbn:
+            with isbn_index:
+                metadata = isbn_index.lookup(book.isbn) or {}
+            for field in enrichment.ENRICH_FIELDS:
+                if not getattr(book, field) and metadata.get(field):
+                    setattr(book, field, metadata[field])
         db.session.add(book)
         
         for genre_id in form.genres.data:
@@ -287,7 +511,13 @@ def add_book():
                     db.session.add(tag)
                 book.tags.append(tag)
         
+        db.session.flush()
+        search.index_book(book)
+        duplicates.add_books([(book.id, book.title, book.author, book.isbn)])
+        book_facets = {g.id: g.name for g in book.genres}, {t.id: t.name for t in book.tags}
         db.session.commit()
+        facets.index.set_book(book.id, *book_facets)
+        invalidate_home_cache('newest', 'top_rated')
         flash('Książka dodana!', 'success')
         return redirect(url_for('book_details', book_id=book.id))
     
@@ -295,58 +525,48 @@ def add_book():
 
 @app.route('/books')
 def book_list():
-    genre_id = request.args.get('genre', type=int)
-    tag_id = request.args.get('tag', type=int)
+    # ?genre=1&genre=2&tag=5 - gatunki łączone OR, tagi OR, obie fasetki AND
+    genre_ids = request.args.getlist('genre', type=int)
+    tag_ids = request.args.getlist('tag', type=int)
     search_query = request.args.get('search', '')
-    sort_by = request.args.get('sort_by', 'title_asc')
-    page = request.args.get('page', 1, type=int)
+    sort_by = request.args.get('sort_by', 'relevance' if search_query else 'title_asc')
     per_page = request.args.get('per_page', 6, type=int)
 
-    query = Book.query
-
-    if genre_id:
-        query = query.join(Book.genres).filter(Genre.id == genre_id)
+    # wersja katalogu: ostatnia zmiana książki (indeks ix_books_updated_at) i wersja fasetek - jednym zapytaniem
+    catalog_updated, facet_version = db.session.query(func.max(Book.updated_at), facets.version_query()).one()
+    facets.index.ensure_current(facet_version)
+    unchanged = conditional.not_modified(catalog_updated, facets.index.version, last_modified=catalog_updated)
+    if unchanged:
+        return unchanged
 
-    if tag_id:
-        query = query.join(Book.tags).filter(Tag.id == tag_id)
+    query = Book.query
+    search_match = None
+    search_books = None
 
     if search_query:
-        query = query.filter(
-            db.or_(
-                Book.title.ilike(f'%{search_query}%'),
-                Book.author.ilike(f'%{search_query}%')
-            )
-        )
+        search_match = search.match_subquery(search_query)
+        if search_match is not None:
+            query = query.join(search_match, search_match.c.book_id == Book.id)
+            search_books = db.session.query(search_match.c.book_id)
+        else:
+            query = query.filter(search.ilike_filter(Book, search_query))
+            search_books = db.session.query(Book.id).filter(search.ilike_filter(Book, search_query))
+
+    # liczniki gatunków i tagów z bitsetów w pamięci zamiast GROUP BY na każde żądanie
+    facet_result = facets.index.search(
+        genre_ids, tag_ids,
+        within=facets.bitset(book_id for book_id, in search_books) if search_books is not None else None,
+        tag_limit=app.config['FACET_TAG_LIMIT']
+    )
+    query = facets.filter_query(query, genre_ids, tag_ids, facet_result, app.config['FACET_ID_FILTER_LIMIT'])
 
-    if sort_by == 'title_asc':
-        query = query.order_by(Book.title.asc())
-    elif sort_by == 'title_desc':
-        query = query.order_by(Book.title.desc())
-    elif sort_by == 'author_asc':
-        query = query.order_by(Book.author.asc())
-    elif sort_by == 'author_desc':
-        query = query.order_by(Book.author.desc())
-    elif sort_by == 'newest':
-        query = query.order_by(Book.date_added.desc())
-    elif sort_by == 'oldest':
-        query = query.order_by(Book.date_added.asc())
-    elif sort_by == 'best_rated':
-        query = query.outerjoin(Review).group_by(Book.id).order_by(db.func.avg(Review.rating).desc())
-
-    books_pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-
-    all_genres = Genre.query.order_by(Genre.name).all()
-    
-    popular_tags = db.session.query(
-        Tag,
-        db.func.count(Book.id).label('book_count')
-    ).join(
-        Tag.books
-    ).group_by(
-        Tag.id
-    ).order_by(
-        db.desc('book_count')
-    ).limit(10).all()
+    if sort_by == 'relevance' and search_match is not None:
+        order = [(search_match.c.rank, False), (Book.title, False)]
+    else:
+        order = list(BOOK_SORT_ORDERS.get(sort_by, BOOK_SORT_ORDERS['title_asc']))
+    order.append((Book.id, False))
+
+    books_pagination = paginate_query(query, order, per_page)
 
     return render_template(
         'books.html',
@@ -355,20 +575,19 @@ def book_list():
         search_query=search_query,
         sort_by=sort_by,
         per_page=per_page,
-        all_genres=all_genres,
-        popular_tags=popular_tags,
-        selected_genre=genre_id,
-        selected_tag=tag_id
+        facets=facet_result,
+        toggle=facets.toggle,
+        selected_genres=genre_ids,
+        selected_tags=tag_ids
     )
 
 @app.route('/my_library')
 @login_required
 def my_library():
-    page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 12, type=int)
     shelf_id = request.args.get('shelf', type=int)
     search_query = request.args.get('search', '')
-    sort_by = request.args.get('sort_by', 'added_desc')
+    sort_by = request.args.get('sort_by', 'relevance' if search_query else 'added_desc')
 
     if not current_user.shelves.first():
         create_default_shelves(current_user)
@@ -377,55 +596,46 @@ def my_library():
         .order_by(Shelf.is_default.desc(), Shelf.name)\
         .all()
     
-    shelf_counts = {}
-    for shelf in shelves:
-        count = UserLibrary.query.filter_by(
-            user_id=current_user.id,
-            shelf_id=shelf.id
-        ).count()
-        shelf_counts[shelf.id] = count
+    shelf_counts = library_stats.shelf_counts(current_user.id)
 
+    # entry.book z tego samego JOIN-a, entry.shelf z wczytanych już półek (mapa tożsamości)
     query = db.session.query(UserLibrary, Book)\
         .join(Book, UserLibrary.book_id == Book.id)\
+        .options(db.contains_eager(UserLibrary.book))\
         .filter(UserLibrary.user_id == current_user.id)
     
     if shelf_id:
         query = query.filter(UserLibrary.shelf_id == shelf_id)
-        selected_shelf_name = Shelf.query.get(shelf_id).name
+        selected_shelf = next((shelf for shelf in shelves if shelf.id == shelf_id), None)
+        if selected_shelf is None:
+            abort(404)
+        selected_shelf_name = selected_shelf.name
     else:
         selected_shelf_name = "Wszystkie książki"
     
+    search_match = None
     if search_query:
-        query = query.filter(or_(
-            Book.title.ilike(f'%{search_query}%'),
-            Book.author.ilike(f'%{search_query}%')
-        ))
-    
-    if sort_by == 'title_asc':
-        query = query.order_by(Book.title.asc())
-    elif sort_by == 'title_desc':
-        query = query.order_by(Book.title.desc())
-    elif sort_by == 'author_asc':
-        query = query.order_by(Book.author.asc())
-    elif sort_by == 'author_desc':
-        query = query.order_by(Book.author.desc())
-    elif sort_by == 'added_desc':
-        query = query.order_by(UserLibrary.added_at.desc())
-    elif sort_by == 'added_asc':
-        query = query.order_by(UserLibrary.added_at.asc())
-    
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        search_match = search.match_subquery(search_query)
+        if search_match is not None:
+            query = query.join(search_match, search_match.c.book_id == Book.id)
+        else:
+            query = query.filter(search.ilike_filter(Book, search_query))
+    
+    if sort_by == 'relevance' and search_match is not None:
+        order = [(search_match.c.rank, False), (UserLibrary.added_at, True)]
+    else:
+        order = list(LIBRARY_SORT_ORDERS.get(sort_by, LIBRARY_SORT_ORDERS['added_desc']))
+    order.append((UserLibrary.id, False))
+    
+    pagination = paginate_query(query, order, per_page)
     
     user_books = pagination.items
     
-    total_books = UserLibrary.query.filter_by(user_id=current_user.id).count()
+    total_books = sum(shelf_counts.values())
     
-    reading_shelf = Shelf.query.filter_by(user_id=current_user.id, name='W trakcie czytania').first()
-    finished_shelf = Shelf.query.filter_by(user_id=current_user.id, name='Przeczytane').first()
-    finished_books = UserLibrary.query.filter_by(
-        user_id=current_user.id, 
-        shelf_id=finished_shelf.id
-    ).count() if finished_shelf else 0
+    reading_shelf = next((shelf for shelf in shelves if shelf.name == 'W trakcie czytania'), None)
+    finished_shelf = next((shelf for shelf in shelves if shelf.name == 'Przeczytane'), None)
+    finished_books = shelf_counts.get(finished_shelf.id, 0) if finished_shelf else 0
     
     return render_template(
         'my_library.html',
@@ -479,7 +689,9 @@ def add_to_library(book_id):
             book_id=book_id
         )
         db.session.add(new_entry)
+        library_stats.adjust(current_user.id, None, 1)
         db.session.commit()
+        invalidate_home_cache('popular')
         flash('Książka dodana do biblioteki!', 'success')
     
     return redirect(url_for('book_list'))
@@ -493,6 +705,8 @@ def move_to_shelf(entry_id, shelf_id):
     if entry.user_id != current_user.id:
         abort(403)
     
+    library_stats.move(current_user.id, entry.shelf_id, shelf.id)
+    reading_activity.on_shelf_change(entry, shelf)
     entry.shelf_id = shelf.id
     db.session.commit()
     
@@ -508,8 +722,11 @@ def remove_from_library(entry_id):
         flash('Brak uprawnień!', 'danger')
         return redirect(url_for('my_library'))
     
+    library_stats.adjust(current_user.id, entry.shelf_id, -1)
+    reading_activity.on_remove(entry)
     db.session.delete(entry)
     db.session.commit()
+    invalidate_home_cache('popular')
     flash('Książka została usunięta z biblioteki', 'success')
     return redirect(url_for('my_library'))
 
@@ -536,32 +753,65 @@ def add_review(book_id):
             book_id=book.id
         )
         db.session.add(review)
+        update_book_rating(book.id, review.rating)
         db.session.commit()
+        invalidate_home_cache('top_rated')
         flash('Recenzja dodana!', 'success')
         return redirect(url_for('book_details', book_id=book.id))
     
     return render_template('add_review.html', form=form, book=book)
 
+def book_page_version(book_id):
+    """Wszystko, od czego zależy strona książki, jednym lekkim zapytaniem (None - brak książki)."""
+    columns = [
+        Book.date_added, Book.updated_at,
+        db.select(func.max(Review.created_at)).where(Review.book_id == Book.id).scalar_subquery()
+    ]
+    if current_user.is_authenticated:
+        entry = db.select(UserLibrary).where(UserLibrary.user_id == current_user.id, UserLibrary.book_id == Book.id)
+        shelves = db.select(Shelf).where(Shelf.user_id == current_user.id)
+        columns += [
+            entry.with_only_columns(UserLibrary.id).scalar_subquery(),
+            entry.with_only_columns(func.coalesce(UserLibrary.shelf_id, 0)).scalar_subquery(),
+            shelves.with_only_columns(func.count(Shelf.id)).scalar_subquery(),
+            shelves.with_only_columns(func.max(Shelf.id)).scalar_subquery(),
+        ]
+    return db.session.query(*columns).filter(Book.id == book_id).first()
+
 @app.route('/book/<int:book_id>')
 def book_details(book_id):
-    page = request.args.get('page', 1, type=int)
+    version = book_page_version(book_id)
+    if version is None:
+        abort(404)
+    # aktualna kopia w przeglądarce - 304 bez wczytywania recenzji i renderowania
+    unchanged = conditional.not_modified(*version, last_modified=max(filter(None, version[:3])))
+    if unchanged:
+        return unchanged
+
     book = Book.query.options(
         db.joinedload(Book.genres),
         db.joinedload(Book.tags)
     ).get_or_404(book_id)
     
-    reviews_query = Review.query.filter_by(book_id=book.id).order_by(Review.created_at.desc())
-    reviews_pagination = reviews_query.paginate(page=page, per_page=5, error_out=False)
+    reviews_pagination = paginate_query(
+        Review.query.filter_by(book_id=book.id).options(db.joinedload(Review.review_user)),
+        [(Review.created_at, True), (Review.id, True)],
+        per_page=5
+    )
     
     current_user_review = None
+    library_entry = None
     if current_user.is_authenticated:
         current_user_review = Review.query.filter_by(
             book_id=book.id,
             user_id=current_user.id
         ).first()
+        library_entry = UserLibrary.query.options(db.joinedload(UserLibrary.shelf)).filter_by(
+            user_id=current_user.id,
+            book_id=book.id
+        ).first()
     
-    avg_rating = db.session.query(db.func.avg(Review.rating))\
-        .filter_by(book_id=book.id).scalar() or 0
+    avg_rating = book.average_rating or 0
     
     return render_template(
         'book_details.html',
@@ -569,12 +819,77 @@ def book_details(book_id):
         reviews=reviews_pagination.items,
         reviews_pagination=reviews_pagination,
         avg_rating=round(avg_rating, 1),
-        current_user_review=current_user_review
+        current_user_review=current_user_review,
+        library_entry=library_entry
     )
 
 @app.route('/uploads/covers/<filename>')
 def uploaded_cover(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    requested = secure_filename(filename)
+    filename = covers.resolve_file(app, requested)
+    if not filename:
+        abort(404)
+
+    # nazwy plików wynikają z treści, więc można je cache'ować na zawsze;
+    # oryginał podany zamiast brakującej jeszcze rendycji - tylko chwilę
+    immutable = filename == requested
+    max_age = app.config['COVER_MAX_AGE'] if immutable else 60
+
+    if app.config['COVER_SENDFILE_MODE'] == 'x-accel':
+        response = app.response_class(mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['X-Accel-Redirect'] = f"{app.config['COVER_ACCEL_PREFIX']}/{filename}"
+        response.set_etag(filename)
+        response = response.make_conditional(request)
+    else:
+        # obsługuje If-None-Match/If-Modified-Since (304) i nagłówek Range (206)
+        response = send_from_directory(
+            covers.upload_folder(app),
+            filename,
+            max_age=max_age,
+            etag=filename,
+            conditional=True
+        )
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = immutable
+    return response
+
+@app.route('/api/cache_stats')
+@login_required
+def cache_stats():
+    if not current_user.is_moderator:
+        abort(403)
+    return jsonify(cache.stats())
+
+@app.route('/api/sql_stats')
+@login_required
+def sql_stats():
+    if not current_user.is_moderator:
+        abort(403)
+    return jsonify(sql_metrics.stats())
+
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    cache_stats = cache.stats()
+    compression_stats = compression.stats()
+    body = sql_metrics.render_prometheus(extra=[
+        ('czytelnia_cache_hits_total', 'counter', 'Cache hits.', cache_stats['hits']),
+        ('czytelnia_cache_misses_total', 'counter', 'Cache misses.', cache_stats['misses']),
+        ('czytelnia_cache_errors_total', 'counter', 'Cache backend errors.', cache_stats['errors']),
+        ('czytelnia_http_not_modified_total', 'counter', 'Responses answered with 304 Not Modified.',
+         conditional.not_modified_count),
+        ('czytelnia_compression_input_bytes_total', 'counter', 'Response bytes before compression.',
+         compression_stats['bytes_in']),
+        ('czytelnia_compression_output_bytes_total', 'counter', 'Response bytes after compression.',
+         compression_stats['bytes_out']),
+        ('czytelnia_compression_cpu_seconds_total', 'counter', 'CPU time spent compressing responses.',
+         f"{compression_stats['cpu_seconds']:.6f}")
+    ])
+    return app.response_class(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/manage/genres')
 @login_required
@@ -595,6 +910,7 @@ def add_genre():
         genre = Genre(name=form.name.data)
         db.session.add(genre)
         db.session.commit()
+        facets.index.invalidate()
         flash('Gatunek został dodany', 'success')
     else:
         flash('Błąd podczas dodawania gatunku', 'danger')
@@ -606,8 +922,12 @@ def delete_genre(genre_id):
     if not current_user.is_moderator:
         abort(403)
     genre = Genre.query.get_or_404(genre_id)
+    # książki tracą gatunek tylko w tabeli powiązań - nowa wersja ich stron i kart
+    Book.query.filter(Book.genres.any(Genre.id == genre.id))\
+        .update({Book.updated_at: datetime.utcnow()}, synchronize_session=False)
     db.session.delete(genre)
     db.session.commit()
+    facets.index.invalidate()
     flash('Gatunek został usunięty', 'success')
     return redirect(url_for('manage_genres'))
 
@@ -636,19 +956,13 @@ def edit_book(book_id):
             if form.cover.data:
                 file = form.cover.data
                 if file and allowed_file(file.filename):
-                    if book.cover_url:
-                        old_file_path = os.path.join('static', book.cover_url.lstrip('/'))
-                        if os.path.exists(old_file_path):
-                            os.remove(old_file_path)
-                    
-                    filename = secure_filename(f"{uuid.uuid4().hex}.{file.filename.rsplit('.', 1)[1].lower()}")
-                    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-                    img = Image.open(file_path)
-                    img.thumbnail((300, 300))
-                    img.save(file_path)
-                    book.cover_url = f"/uploads/covers/{filename}"
+                    old_cover_url = book.cover_url
+                    book.cover_url = covers.save_upload(app, file)
+                    # okładki są współdzielone przez książki z tym samym plikiem
+                    if old_cover_url and old_cover_url != book.cover_url and not Book.query.filter(
+                        Book.cover_url == old_cover_url, Book.id != book.id
+                    ).first():
+                        covers.remove_cover(app, old_cover_url)
 
             book.genres = []
             for genre_id in form.genres.data:
@@ -665,7 +979,16 @@ def edit_book(book_id):
                         db.session.add(tag)
                     book.tags.append(tag)
 
+            # zmiana samych gatunków lub tagów dotyczy tylko tabel powiązań, więc onupdate
+            # nie zadziała - a od updated_at zależą ETag strony książki i karty w cache'u
+            book.updated_at = datetime.utcnow()
+            db.session.flush()
+            search.index_book(book)
+            duplicates.index_books([(book.id, book.title, book.author, book.isbn)])
+            book_facets = {g.id: g.name for g in book.genres}, {t.id: t.name for t in book.tags}
             db.session.commit()
+            facets.index.set_book(book.id, *book_facets)
+            invalidate_home_cache('newest', 'top_rated', 'popular')
             flash('Książka została zaktualizowana!', 'success')
             return redirect(url_for('book_details', book_id=book.id))
         except Exception as e:
@@ -689,13 +1012,7 @@ def my_shelves():
             .order_by(Shelf.is_default.desc(), Shelf.name)\
             .all()
     
-    shelf_counts = {}
-    for shelf in shelves:
-        count = UserLibrary.query.filter_by(
-            user_id=current_user.id,
-            shelf_id=shelf.id
-        ).count()
-        shelf_counts[shelf.id] = count
+    shelf_counts = library_stats.shelf_counts(current_user.id)
     
     return render_template('shelves.html', shelves=shelves, shelf_counts=shelf_counts)
 
@@ -711,16 +1028,21 @@ def add_to_shelf(book_id, shelf_id):
     ).first()
     
     if library_entry:
+        library_stats.move(current_user.id, library_entry.shelf_id, shelf_id)
+        reading_activity.on_shelf_change(library_entry, shelf)
         library_entry.shelf_id = shelf_id
     else:
         library_entry = UserLibrary(
             user_id=current_user.id,
-            book_id=book_id,
-            shelf_id=shelf_id
+            book_id=book_id
         )
+        reading_activity.on_shelf_change(library_entry, shelf)
+        library_entry.shelf_id = shelf_id
         db.session.add(library_entry)
+        library_stats.adjust(current_user.id, shelf_id, 1)
     
     db.session.commit()
+    invalidate_home_cache('popular')
     flash(f'Książka "{book.title}" dodana do półki "{shelf.name}"', 'success')
     return redirect(request.referrer or url_for('book_details', book_id=book_id))
 
@@ -749,17 +1071,16 @@ def create_shelf():
 def shelf_books(shelf_id):
     shelf = Shelf.query.filter_by(id=shelf_id, user_id=current_user.id).first_or_404()
     
-    page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 12, type=int)
     
-    books_pagination = Book.query.join(
-        UserLibrary
-    ).filter(
-        UserLibrary.user_id == current_user.id,
-        UserLibrary.shelf_id == shelf_id
-    ).order_by(
-        UserLibrary.added_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    books_pagination = paginate_query(
+        Book.query.join(UserLibrary).filter(
+            UserLibrary.user_id == current_user.id,
+            UserLibrary.shelf_id == shelf_id
+        ),
+        [(UserLibrary.added_at, True), (UserLibrary.id, True)],
+        per_page
+    )
     
     return render_template(
         'shelf_books.html',
@@ -786,11 +1107,14 @@ def manage_shelf_books(shelf_id, book_id):
             
         new_entry = UserLibrary(
             user_id=current_user.id,
-            book_id=book_id,
-            shelf_id=shelf_id
+            book_id=book_id
         )
+        reading_activity.on_shelf_change(new_entry, shelf)
+        new_entry.shelf_id = shelf_id
         db.session.add(new_entry)
+        library_stats.adjust(current_user.id, shelf_id, 1)
         db.session.commit()
+        invalidate_home_cache('popular')
         
         return jsonify({
             'success': True,
@@ -805,14 +1129,67 @@ def manage_shelf_books(shelf_id, book_id):
             shelf_id=shelf_id
         ).first_or_404()
         
+        reading_activity.on_remove(entry)
         db.session.delete(entry)
+        library_stats.adjust(current_user.id, shelf_id, -1)
         db.session.commit()
+        invalidate_home_cache('popular')
         
         return jsonify({
             'success': True,
             'message': f'Usunięto "{book.title}" z półki "{shelf.name}"'
         })
 
+@app.route('/api/library/batch', methods=['POST'])
+@login_required
+def library_batch_api():
+    """Wiele książek w jednym żądaniu i jednej transakcji.
+
+    {"action": "add" | "add_to_shelf", "book_ids": [...], "shelf_id": ...}
+    {"action": "move", "entry_ids": [...], "shelf_id": ... | null}
+    {"action": "remove", "entry_ids": [...]}
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action not in library_batch.ACTIONS:
+        return jsonify({'success': False, 'message': 'Nieznana akcja'}), 400
+
+    ids = data.get('book_ids' if action in ('add', 'add_to_shelf') else 'entry_ids')
+    shelf_id = data.get('shelf_id')
+    if not isinstance(ids, list) or not all(type(item) is int for item in ids):
+        return jsonify({'success': False, 'message': 'Oczekiwano listy identyfikatorów'}), 400
+    if len(ids) > app.config['LIBRARY_BATCH_MAX_ITEMS']:
+        return jsonify({
+            'success': False,
+            'message': f"Maksymalnie {app.config['LIBRARY_BATCH_MAX_ITEMS']} pozycji w jednym żądaniu"
+        }), 400
+    if (shelf_id is not None and type(shelf_id) is not int) or (action == 'add_to_shelf' and shelf_id is None):
+        return jsonify({'success': False, 'message': 'Nieprawidłowa półka'}), 400
+
+    batch = library_batch.Batch(current_user.id)
+    try:
+        if action == 'add':
+            results = batch.add(ids, shelf_id)
+        elif action == 'add_to_shelf':
+            results = batch.add_to_shelf(ids, shelf_id)
+        elif action == 'move':
+            results = batch.move(ids, shelf_id)
+        else:
+            results = batch.remove(ids)
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 404
+
+    batch.flush()
+    db.session.commit()
+    if batch.library_changed:
+        invalidate_home_cache('popular')
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return jsonify({'success': True, 'results': results, 'counts': counts})
+
 @app.route('/delete_shelf/<int:shelf_id>', methods=['POST'])
 @login_required
 def delete_shelf(shelf_id):
@@ -823,13 +1200,23 @@ def delete_shelf(shelf_id):
         name='Do przeczytania'
     ).first()
     
+    if reading_activity.tracks(shelf):
+        for entry in UserLibrary.query.filter_by(shelf_id=shelf.id):
+            if default_shelf:
+                reading_activity.on_shelf_change(entry, default_shelf)
+            else:
+                reading_activity.on_remove(entry)
+    
     if default_shelf:
         UserLibrary.query.filter_by(shelf_id=shelf.id).update({'shelf_id': default_shelf.id})
+        library_stats.drop_shelf(current_user.id, shelf.id, default_shelf.id)
     else:
         UserLibrary.query.filter_by(shelf_id=shelf.id).delete()
+        library_stats.drop_shelf(current_user.id, shelf.id)
     
     db.session.delete(shelf)
     db.session.commit()
+    invalidate_home_cache('popular')
     
     flash(f'Usunięto półkę "{shelf.name}"', 'success')
     return redirect(url_for('my_library'))
@@ -842,25 +1229,45 @@ def remove_from_shelf(entry_id):
     if entry.user_id != current_user.id:
         abort(403)
     
+    library_stats.move(current_user.id, entry.shelf_id, None)
+    reading_activity.on_shelf_change(entry, None)
     entry.shelf_id = None
     db.session.commit()
     
     flash(f'Usunięto książkę "{entry.book.title}" z bieżącej półki', 'success')
     return redirect(request.referrer or url_for('my_library'))
 
+def export_response(chunks, fmt, filename):
+    # generator w kontekście żądania: sesja bazy żyje do końca wysyłania
+    response = app.response_class(stream_with_context(chunks), mimetype=exporter.MIMETYPES[fmt])
+    response.headers.set('Content-Disposition', 'attachment', filename=f'{filename}.{fmt}')
+    return response
+
+@app.route('/export/library.<any(csv, json, ndjson):fmt>')
+@login_required
+def export_library(fmt):
+    chunks = exporter.export_library(current_user.id, fmt, app.config['EXPORT_BATCH_SIZE'])
+    return export_response(chunks, fmt, f'biblioteka-{current_user.username}')
+
+@app.route('/export/catalog.<any(csv, json, ndjson):fmt>')
+@login_required
+def export_catalog(fmt):
+    if not current_user.is_moderator:
+        abort(403)
+    return export_response(exporter.export_catalog(fmt, app.config['EXPORT_BATCH_SIZE']), fmt, 'katalog')
+
 @app.route('/profile')
 @login_required
 def profile():
+    shelf_counts = library_stats.shelf_counts(current_user.id)
+    shelf_ids = {name: shelf_id for shelf_id, name in db.session.query(Shelf.id, Shelf.name).filter(
+        Shelf.user_id == current_user.id,
+        Shelf.name.in_(['Przeczytane', 'W trakcie czytania'])
+    )}
     reading_stats = {
-        'total_books': UserLibrary.query.filter_by(user_id=current_user.id).count(),
-        'read_books': UserLibrary.query.join(Shelf).filter(
-            UserLibrary.user_id == current_user.id,
-            Shelf.name == 'Przeczytane'
-        ).count(),
-        'reading_books': UserLibrary.query.join(Shelf).filter(
-            UserLibrary.user_id == current_user.id,
-            Shelf.name == 'W trakcie czytania'
-        ).count()
+        'total_books': sum(shelf_counts.values()),
+        'read_books': shelf_counts.get(shelf_ids.get('Przeczytane'), 0),
+        'reading_books': shelf_counts.get(shelf_ids.get('W trakcie czytania'), 0)
     }
 
     favorite_genres = db.session.query(
@@ -900,11 +1307,12 @@ def profile():
         .limit(5)\
         .all()
     
-    reading_time_stats = get_reading_stats(current_user.id)
+    reading_time_stats, activity = get_reading_stats(current_user.id)
 
+    goals = app.config['READING_GOALS']
     reading_goals = {
-        'year': {'target': 50, 'current': 23},
-        'month': {'target': 5, 'current': 3}
+        'year': {'target': goals['year'], 'current': activity['finished_this_year']},
+        'month': {'target': goals['month'], 'current': activity['finished_this_month']}
     }
 
     return render_template(
@@ -926,73 +1334,443 @@ def bulk_add_books():
     form = BulkAddBooksForm()
     
     if form.validate_on_submit():
+        if form.books_file.data:
+            file = form.books_file.data
+            fmt = importer.detect_format(file.filename)
+            stream = importer.open_text(file.stream)
+        elif form.books_data.data:
+            fmt = 'json'
+            stream = io.StringIO(form.books_data.data)
+        else:
+            flash('Wklej dane JSON albo wybierz plik', 'danger')
+            return render_template('bulk_add_books.html', form=form)
+
+        isbn_index = enrichment.open_index(app)
         try:
-            books = json.loads(form.books_data.data)
-            added_count = 0
-            
-            for book_data in books:
-                book = Book(
-                    title=book_data.get('title'),
-                    author=book_data.get('author'),
-                    description=book_data.get('description', ''),
-                    pages=book_data.get('pages'),
-                    isbn=book_data.get('isbn', '')
-                )
-
-                if 'genres' in book_data:
-                    for genre_name in book_data['genres']:
-                        genre = Genre.query.filter_by(name=genre_name).first()
-                        if not genre:
-                            genre = Genre(name=genre_name)
-                            db.session.add(genre)
-                        book.genres.append(genre)
-                
-                db.session.add(book)
-                added_count += 1
-            
-            db.session.commit()
-            flash(f'Dodano {added_count} książek!', 'success')
+            result = importer.import_books(stream, fmt, chunk_size=app.config['IMPORT_CHUNK_SIZE'],
+                                           isbn_index=isbn_index,
+                                           duplicate_threshold=app.config['DUPLICATE_THRESHOLD'])
+        except (ValueError, csv.Error):
+            flash('Nieprawidłowy format pliku', 'danger')
+        else:
+            invalidate_home_cache('newest', 'top_rated')
+            flash(f'Dodano {result.added} książek!', 'success')
+            if result.enriched:
+                flash(f'Uzupełniono dane {result.enriched} książek z indeksu ISBN', 'info')
+            if result.errors:
+                details = '; '.join(f'wiersz {line}: {message}' for line, message in result.errors[:5])
+                flash(f'Pominięto {len(result.errors)} wierszy ({details})', 'warning')
             return redirect(url_for('book_list'))
-            
-        except json.JSONDecodeError:
-            flash('Nieprawidłowy format JSON', 'danger')
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Wystąpił błąd: {str(e)}', 'danger')
+        finally:
+            if isbn_index:
+                isbn_index.close()
     
     return render_template('bulk_add_books.html', form=form)
 
+@app.route('/duplicates')
+@login_required
+def duplicate_report():
+    if not current_user.is_moderator:
+        abort(403)
+    pairs = duplicates.report(app.config['DUPLICATE_THRESHOLD'], app.config['DUPLICATE_REPORT_LIMIT'])
+    usage = duplicates.usage({book.id for pair in pairs for book in pair[:2]})
+    return render_template('duplicates.html', pairs=pairs, usage=usage, form=MergeBooksForm())
+
+def merge_books(survivor, duplicate):
+    """Scala duplicate w survivor i sprząta to, co żyje poza transakcją: fasetki, cache, plik okładki."""
+    old_cover_url = duplicate.cover_url
+    stats = duplicates.merge(survivor, duplicate)
+    if old_cover_url and old_cover_url != survivor.cover_url and not Book.query.filter(
+        Book.cover_url == old_cover_url
+    ).first():
+        covers.remove_cover(app, old_cover_url)
+    facets.index.invalidate()
+    invalidate_home_cache('newest', 'top_rated', 'popular')
+    return stats
+
+@app.route('/duplicates/merge', methods=['POST'])
+@login_required
+def merge_duplicate():
+    if not current_user.is_moderator:
+        abort(403)
+    form = MergeBooksForm()
+    if not form.validate_on_submit():
+        abort(400)
+    survivor = Book.query.get_or_404(int(form.survivor_id.data))
+    duplicate = Book.query.get_or_404(int(form.duplicate_id.data))
+    if survivor.id == duplicate.id:
+        abort(400)
+    title = duplicate.title
+    try:
+        stats = merge_books(survivor, duplicate)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error merging books: {str(e)}")
+        flash('Wystąpił błąd podczas scalania książek', 'danger')
+    else:
+        flash(f'Scalono "{title}" z "{survivor.title}": przeniesiono {stats["entries_moved"]} wpisów '
+              f'i {stats["reviews_moved"]} recenzji, usunięto {stats["entries_dropped"] + stats["reviews_dropped"]} '
+              f'powtórzonych', 'success')
+    return redirect(url_for('duplicate_report'))
+
 #
 
-with app.app_context():
-    db.create_all()
+@app.cli.command('library-stats')
+@click.option('--rebuild', is_flag=True, help='Przelicz liczniki od zera.')
+@click.option('--user-id', type=int, default=None)
+def library_stats_command(rebuild, user_id):
+    """Sprawdza (lub odbudowuje) zapisane liczniki półek użytkowników."""
+    if rebuild:
+        rows = library_stats.rebuild(user_id)
+        click.echo(f'Odbudowano {rows} liczników.')
+        return
+    mismatches = library_stats.check(user_id)
+    for uid, shelf_id, stored, actual in mismatches:
+        click.echo(f'użytkownik {uid}, półka {shelf_id}: zapisane {stored}, faktycznie {actual}')
+    click.echo(f'Rozbieżności: {len(mismatches)}')
+    if mismatches:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-reading-activity')
+def rebuild_reading_activity_command():
+    """Odtwarza dzienne i miesięczne podsumowania czytania z bibliotek."""
+    days = reading_activity.rebuild()
+    click.echo(f'Odtworzono {days} dni aktywności.')
+
+@app.cli.command('recommendations')
+@click.option('--rebuild', is_flag=True, help='Przelicz sąsiadów wszystkich książek.')
+def recommendations_command(rebuild):
+    """Odświeża macierz podobieństwa książek (np. z crona co godzinę, --rebuild co noc)."""
+    k = app.config['RECOMMENDATION_NEIGHBORS']
+    started = time.perf_counter()
+    books = recommendations.rebuild(k) if rebuild else recommendations.refresh(k)
+    click.echo(f'Przeliczono sąsiadów {books} książek w {time.perf_counter() - started:.2f} s.')
+
+@app.cli.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Wypisz plany wszystkich zapytań.')
+def check_query_plans_command(verbose):
+    """Sprawdza plany zapytań wykonywanych przez trasy - kończy się błędem przy pełnym skanie tabeli."""
+    import query_plans
+    if verbose:
+        for name, statement, parameters in query_plans.hot_queries():
+            click.echo(f'{name}: {" ".join(statement.split())[:160]}')
+            for line in query_plans.explain(statement, parameters):
+                click.echo(f'    {line}')
+    problems = query_plans.check()
+    db.session.rollback()
+    for name, statement, scans, plan in problems:
+        click.echo(f'{name}: pełny skan {", ".join(scans)}', err=True)
+        click.echo(f'    {" ".join(statement.split())[:160]}', err=True)
+        for line in plan:
+            click.echo(f'    {line}', err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo('Wszystkie zapytania korzystają z indeksów.')
+
+@app.cli.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv', 'json']), default=None,
+              help='Domyślnie na podstawie rozszerzenia pliku.')
+@click.option('--chunk-size', default=1000, show_default=True)
+@click.option('--no-enrich', is_flag=True, help='Nie uzupełniaj pustych pól z indeksu ISBN.')
+@click.option('--allow-duplicates', is_flag=True, help='Importuj także duplikaty książek z katalogu.')
+def import_books_command(path, fmt, chunk_size, no_enrich, allow_duplicates):
+    """Importuje książki z pliku NDJSON/CSV/JSON porcjami."""
+    fmt = fmt or importer.detect_format(path)
+    isbn_index = None if no_enrich else enrichment.open_index(app)
+    start = time.perf_counter()
+
+    def progress(result):
+        click.echo(f'  {result.processed} wierszy, dodano {result.added}, uzupełniono {result.enriched}, '
+                   f'duplikatów {result.duplicates}, błędów {len(result.errors)}')
+
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        result = importer.import_books(stream, fmt, chunk_size=chunk_size, progress=progress,
+                                       isbn_index=isbn_index,
+                                       duplicate_threshold=None if allow_duplicates else app.config['DUPLICATE_THRESHOLD'])
+    if isbn_index:
+        isbn_index.close()
+
+    elapsed = time.perf_counter() - start
+    for line, message in result.errors:
+        click.echo(f'wiersz {line}: {message}', err=True)
+    click.echo(f'Dodano {result.added} z {result.processed} książek w {elapsed:.1f}s.')
+
+@app.cli.command('find-duplicates')
+@click.option('--threshold', type=float, default=None, help='Domyślnie DUPLICATE_THRESHOLD.')
+@click.option('--limit', default=200, show_default=True)
+def find_duplicates_command(threshold, limit):
+    """Wypisuje pary prawdopodobnych duplikatów w katalogu (ISBN i podobny tytuł z autorem)."""
+    threshold = threshold or app.config['DUPLICATE_THRESHOLD']
+    pairs = duplicates.report(threshold, limit)
+    for a, b, score, reason in pairs:
+        click.echo(f'{score:4.2f} {reason:5} #{a.id} {a.title} ({a.author})  ~  #{b.id} {b.title} ({b.author})')
+    click.echo(f'Par: {len(pairs)}')
+
+@app.cli.command('merge-books')
+@click.argument('survivor_id', type=int)
+@click.argument('duplicate_id', type=int)
+def merge_books_command(survivor_id, duplicate_id):
+    """Scala książkę DUPLICATE_ID w SURVIVOR_ID (biblioteki, recenzje, gatunki, tagi) i ją usuwa."""
+    survivor = db.session.get(Book, survivor_id)
+    duplicate = db.session.get(Book, duplicate_id)
+    if survivor is None or duplicate is None or survivor_id == duplicate_id:
+        raise click.ClickException('Podaj id dwóch różnych, istniejących książek')
+    stats = merge_books(survivor, duplicate)
+    click.echo(', '.join(f'{key}: {value}' for key, value in stats.items()))
+
+@app.cli.command('rebuild-duplicate-index')
+def rebuild_duplicate_index_command():
+    """Przelicza klucze wykrywania duplikatów dla całego katalogu."""
+    start = time.perf_counter()
+    indexed = duplicates.rebuild()
+    click.echo(f'Zindeksowano {indexed} książek w {time.perf_counter() - start:.1f}s.')
+
+@app.cli.command('build-isbn-index')
+@click.argument('dump', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', default=None, help='Domyślnie ISBN_INDEX_PATH.')
+def build_isbn_index_command(dump, output):
+    """Indeksuje zrzut metadanych (JSONL lub TSV Open Library, także .gz) do pliku wyszukiwania po ISBN."""
+    output = output or app.config['ISBN_INDEX_PATH']
+    start = time.perf_counter()
+    lines, entries = enrichment.build_index(dump, output, progress=lambda lines: click.echo(f'  {lines} wierszy'))
+    size = os.path.getsize(output)
+    click.echo(f'{entries} numerów ISBN z {lines} wierszy w {time.perf_counter() - start:.1f}s, '
+               f'{size / 2 ** 20:.1f} MB ({size / max(entries, 1):.0f} B/ISBN) -> {output}')
+
+@app.cli.command('enrich-books')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Tylko policz, co zostałoby uzupełnione.')
+def enrich_books_command(batch_size, dry_run):
+    """Uzupełnia puste opisy, liczby stron i okładki istniejących książek z indeksu ISBN."""
+    isbn_index = enrichment.open_index(app)
+    if isbn_index is None:
+        raise click.ClickException(f"Brak indeksu {app.config['ISBN_INDEX_PATH']} - uruchom flask build-isbn-index")
+    start = time.perf_counter()
+    with isbn_index:
+        checked, enriched = enrichment.enrich_catalog(
+            isbn_index, batch_size, dry_run,
+            progress=lambda checked, enriched: click.echo(f'  sprawdzono {checked}, uzupełniono {enriched}'))
+    click.echo(f"{'Do uzupełnienia' if dry_run else 'Uzupełniono'} {enriched} z {checked} książek "
+               f"z brakującymi danymi w {time.perf_counter() - start:.1f}s.")
+
+def write_export(chunks, output):
+    rows = 0
+    for chunk in chunks:
+        output.write(chunk.encode('utf-8'))
+        rows += chunk.count('\n')
+    return rows
+
+@app.cli.command('export-library')
+@click.argument('username')
+@click.option('--format', 'fmt', type=click.Choice(list(exporter.MIMETYPES)), default=None,
+              help='Domyślnie na podstawie rozszerzenia pliku.')
+@click.option('--output', type=click.File('wb'), default='-', help="Plik wynikowy; '-' = stdout.")
+def export_library_command(username, fmt, output):
+    """Eksportuje bibliotekę użytkownika (półki, oceny, recenzje, daty) do CSV/JSON/NDJSON."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'Nie ma użytkownika {username}')
+    fmt = fmt or importer.detect_format(output.name)
+    lines = write_export(exporter.export_library(user.id, fmt, app.config['EXPORT_BATCH_SIZE']), output)
+    click.echo(f'Zapisano {lines} linii ({fmt}).', err=True)
+
+@app.cli.command('export-catalog')
+@click.option('--format', 'fmt', type=click.Choice(list(exporter.MIMETYPES)), default=None,
+              help='Domyślnie na podstawie rozszerzenia pliku.')
+@click.option('--output', type=click.File('wb'), default='-', help="Plik wynikowy; '-' = stdout.")
+def export_catalog_command(fmt, output):
+    """Eksportuje cały katalog z gatunkami i tagami - format zgodny z flask import-books."""
+    fmt = fmt or importer.detect_format(output.name)
+    lines = write_export(exporter.export_catalog(fmt, app.config['EXPORT_BATCH_SIZE']), output)
+    click.echo(f'Zapisano {lines} linii ({fmt}).', err=True)
+
+@app.cli.command('seed-dataset')
+@click.option('--books', default=10000, show_default=True)
+@click.option('--users', default=1000, show_default=True)
+@click.option('--library-size', default=40, show_default=True, help='Średnia liczba książek w bibliotece.')
+@click.option('--review-rate', default=0.3, show_default=True, help='Część przeczytanych książek z recenzją.')
+@click.option('--genres', default=30, show_default=True)
+@click.option('--tags', default=300, show_default=True)
+@click.option('--zipf', default=1.1, show_default=True, help='Wykładnik rozkładu popularności.')
+@click.option('--seed', default=42, show_default=True)
+def seed_dataset_command(books, users, library_size, review_rate, genres, tags, zipf, seed):
+    """Generuje duży, skośny zbiór danych do testów obciążeniowych (najlepiej w osobnej bazie - DATABASE_URL)."""
+    import dataset
+    start = time.perf_counter()
+    counts = dataset.generate(books=books, users=users, library_size=library_size, review_rate=review_rate,
+                              genres=genres, tags=tags, zipf=zipf, seed=seed,
+                              neighbors=app.config['RECOMMENDATION_NEIGHBORS'], progress=click.echo)
+    invalidate_home_cache('newest', 'top_rated', 'popular')
+    click.echo(', '.join(f'{name}: {count}' for name, count in counts.items()))
+    click.echo(f'Gotowe w {time.perf_counter() - start:.1f}s. Hasło użytkowników: {dataset.PASSWORD}')
+
+@app.cli.command('loadtest')
+@click.option('--url', default=None, help='Adres działającego serwera; bez tego - klient testowy w procesie.')
+@click.option('--requests', default=100, show_default=True, help='Żądań na scenariusz.')
+@click.option('--concurrency', default=4, show_default=True)
+@click.option('--scenario', 'names', multiple=True, help='Tylko scenariusze zaczynające się od tej nazwy.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Zapisz wyniki jako JSON.')
+@click.option('--compare', 'previous', type=click.File('r'), help='Porównaj z wcześniejszym plikiem JSON.')
+def loadtest_command(url, requests, concurrency, names, output, previous):
+    """Mierzy p50/p95/p99, przepustowość i liczbę zapytań na żądanie dla głównych tras.
+
+    Wymaga danych z 'flask seed-dataset'. Przy --url serwer musi używać tej samej
+    bazy; liczba zapytań pochodzi wtedy z nagłówka Server-Timing (SQL_SERVER_TIMING).
+    """
+    import dataset
+    import loadtest
+    scenario_list = [scenario for scenario in loadtest.scenarios()
+                     if not names or scenario.name.startswith(names)]
+    if not User.query.filter_by(username=dataset.MODERATOR).first():
+        raise click.ClickException('Brak danych testowych - uruchom najpierw flask seed-dataset')
+
+    if url:
+        make_client = lambda credentials: loadtest.HttpClient(url, credentials)
+    else:
+        app.config['WTF_CSRF_ENABLED'] = False
+        make_client = lambda credentials: loadtest.InProcessClient(app, credentials)
+
+    def progress(name, stats):
+        queries = stats['queries_per_request']
+        click.echo(f"{name:32} p50 {stats['p50_ms']:7.1f}  p95 {stats['p95_ms']:7.1f}  p99 {stats['p99_ms']:7.1f} ms"
+                   f"  {stats['throughput']:7.1f} req/s  zapytania {queries if queries is None else round(queries, 1)}"
+                   f"  błędy {stats['errors']}")
+
+    results = loadtest.run(make_client, scenario_list, requests=requests, concurrency=concurrency,
+                           progress=progress)
+    current = loadtest.report(results, 'http' if url else 'in-process', url, requests, concurrency)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        click.echo(f'Zapisano {output}')
+    if previous:
+        click.echo('Porównanie p95 (ms) i zapytań na żądanie:')
+        for name, old_p95, p95, change, old_queries, queries in loadtest.compare(json.load(previous), current):
+            click.echo(f'{name:32} {old_p95:7.1f} -> {p95:7.1f} ({change:+.0f}%)  zapytania {old_queries} -> {queries}')
+
+@app.cli.command('process-covers')
+def process_covers_command():
+    """Generuje brakujące rendycje (WebP + JPEG) dla zapisanych okładek."""
+    created = covers.process_existing(app)
+    click.echo(f'Utworzono {created} plików.')
+
+@app.cli.command('rebuild-search-index')
+@click.option('--batch-size', default=500, show_default=True)
+def rebuild_search_index_command(batch_size):
+    """Buduje od nowa indeks wyszukiwania pełnotekstowego."""
+    search.ensure_search_index()
+    indexed = search.rebuild_index(batch_size=batch_size)
+    click.echo(f'Zaindeksowano {indexed} książek.')
+
+@app.cli.command('serve')
+@click.option('--bind', default=None, help='Adres:port (domyślnie SERVER_BIND).')
+@click.option('--workers', type=int, default=None, help='Procesów (domyślnie SERVER_WORKERS, 0 = 2 x rdzenie + 1).')
+@click.option('--threads', type=int, default=None, help='Wątków na worker (domyślnie SERVER_THREADS).')
+@click.option('--timeout', type=int, default=None, help='Sekund na żądanie, potem restart workera.')
+@click.option('--graceful-timeout', type=int, default=None, help='Sekund na dokończenie żądań przy zatrzymaniu i SIGHUP.')
+@click.option('--max-requests', type=int, default=None, help='Restart workera po tylu żądaniach.')
+@click.option('--pidfile', default=None, help='Plik z PID procesu głównego (kill -HUP - nowe workery).')
+@click.option('--access-log', default=None, help="Log dostępu; '-' = stdout.")
+def serve_command(bind, workers, threads, timeout, graceful_timeout, max_requests, pidfile, access_log):
+    """Serwer produkcyjny: gunicorn z workerami prefork (wymaga pakietu gunicorn)."""
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        raise click.ClickException('Brak pakietu gunicorn - pip install gunicorn')
+    options = server.gunicorn_options(app.config)
+    if workers == 0:
+        workers = server.default_workers()
+    overrides = {'bind': bind, 'workers': workers, 'threads': threads, 'timeout': timeout,
+                 'graceful_timeout': graceful_timeout, 'max_requests': max_requests,
+                 'pidfile': pidfile, 'accesslog': access_log}
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    if max_requests is not None:
+        options['max_requests_jitter'] = max_requests // 10
+    click.echo(f"gunicorn: {options['bind']}, workerów {options['workers']}, wątków {options['threads']}, "
+               f"timeout {options['timeout']} s")
+    server.run(app, **options)
+
+def _schema_matches_models(inspector):
+    # brakujące tabele doda create_all; migracje są potrzebne tylko dla brakujących kolumn
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        if not {column.name for column in table.columns} <= columns:
+            return False
+    return True
+
+def migrate_database():
+    """Doprowadza schemat do najnowszej migracji.
+
+    Pusta baza powstaje z modeli i dostaje znacznik najnowszej migracji, tak
+    samo baza założona wcześniej przez create_all (kolumny z modeli, bez
+    alembic_version). Pozostałe przechodzą przez flask db upgrade.
+    """
+    import flask_migrate
+
+    inspector = db.inspect(db.engine)
+    if inspector.has_table('alembic_version'):
+        flask_migrate.upgrade()
+    elif not inspector.has_table('books') or _schema_matches_models(inspector):
+        db.create_all()
+        flask_migrate.stamp()
+    else:
+        # baza sprzed migracji (np. instance/czytelnia.db z repozytorium)
+        flask_migrate.upgrade()
 
-    admin = User.query.filter_by(username='admin').first()
-    if not admin:
-        hashed_password = bcrypt.generate_password_hash('admin123').decode('utf-8')
-        admin = User(
-            username='admin',
-            password=hashed_password,
-            is_moderator=True
-        )
-        db.session.add(admin)
-        
-        default_shelves = [
-            ('Do przeczytania', True),
-            ('W trakcie czytania', True),
-            ('Przeczytane', True),
-            ('Ulubione', False)
-        ]
-        
-        for name, is_default in default_shelves:
-            shelf = Shelf(
-                user_id=admin.id,
-                name=name,
-                is_default=is_default
-            )
-            db.session.add(shelf)
-        
-        db.session.commit()
+def init_database():
+    """Tabele, indeks wyszukiwania i tabele pochodne - dawniej przy każdym imporcie app.py.
+
+    Migracje zmieniają tylko schemat; indeks pełnotekstowy i puste tabele
+    pochodne (liczniki półek, aktywność czytania, sąsiedzi, klucze duplikatów)
+    są tu tworzone i wypełniane z danych źródłowych.
+    """
+    db.create_all()
+    search.ensure_search_index()
+    if not UserLibraryStats.query.first() and UserLibrary.query.first():
+        library_stats.rebuild()
+    if not ReadingActivityDaily.query.first() and UserLibrary.query.filter(
+            or_(UserLibrary.started_at.isnot(None), UserLibrary.finished_at.isnot(None))).first():
+        reading_activity.rebuild()
+    if not BookNeighbor.query.first() and UserLibrary.query.first():
+        recommendations.rebuild(app.config['RECOMMENDATION_NEIGHBORS'])
+    if not DuplicateKey.query.first() and Book.query.first():
+        duplicates.rebuild()
+
+def seed_admin(username, password):
+    """Tworzy moderatora z domyślnymi półkami; zwraca False, jeśli konto już istnieje."""
+    if User.query.filter_by(username=username).first():
+        return False
+    admin = User(
+        username=username,
+        password=passwords.hash_password(password),
+        is_moderator=True
+    )
+    db.session.add(admin)
+    db.session.flush()  # admin.id dla półek
+    create_default_shelves(admin)
+    return True
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Zakłada albo aktualizuje bazę: migracje, indeks wyszukiwania i tabele pochodne."""
+    migrate_database()
+    init_database()
+    click.echo('Baza gotowa.')
+
+@app.cli.command('seed-admin')
+@click.option('--username', default='admin', show_default=True)
+@click.option('--password', default='admin123', envvar='ADMIN_PASSWORD', show_default=True,
+              help='Można też podać w zmiennej ADMIN_PASSWORD.')
+def seed_admin_command(username, password):
+    """Zakłada konto moderatora z domyślnymi półkami."""
+    if seed_admin(username, password):
+        click.echo(f'Utworzono moderatora {username}.')
+    else:
+        click.echo(f'Użytkownik {username} już istnieje.')
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,718 @@
+"""Pomiary wydajności: flask benchmark <nazwa>, np. flask benchmark import.
+
+Osobna grupa poleceń zamiast kolejnych komend w app.py. Większość wymaga
+danych z flask seed-dataset (najlepiej w osobnej bazie - DATABASE_URL).
+Polecenia wypisują wyniki; błędem kończy się tylko benchmark export
+po przekroczeniu limitu pamięci.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app, before_render_template, template_rendered
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import func
+from extensions import db, cache
+from models import (Book, Genre, Tag, Review, Shelf, User, UserLibrary, UserLibraryStats, DuplicateKey,
+                    ReadingActivityDaily, ReadingActivityMonthly, book_genres, book_tags)
+import compression
+import database
+import duplicates
+import enrichment
+import exporter
+import facets
+import importer
+import library_stats
+import passwords
+import search
+
+benchmark = AppGroup('benchmark', help='Pomiary wydajności.')
+
+
+def init_app(app):
+    app.cli.add_command(benchmark)
+
+
+@benchmark.command('export')
+@click.option('--rows', default=1000000, show_default=True, help='Pozycji w bibliotece testowego użytkownika.')
+@click.option('--format', 'fmt', type=click.Choice(list(exporter.MIMETYPES)), default='ndjson', show_default=True)
+@click.option('--max-rss', default=200, show_default=True, help='Limit szczytowej pamięci anonimowej (RSS bez mmap pliku bazy) procesu eksportu, MB.')
+@click.option('--naive', is_flag=True, help='Porównaj z wczytaniem całej biblioteki przez ORM (dużo pamięci).')
+def export_command(rows, fmt, max_rss, naive):
+    """Eksport biblioteki z N pozycjami w osobnym procesie: czas i szczytowe RSS przy 1% i 100% wierszy."""
+    import loadtest
+    from app import create_default_shelves
+    app = current_app._get_current_object()
+    book_ids = [book_id for book_id, in db.session.query(Book.id).order_by(Book.id)]
+    if not book_ids:
+        raise click.ClickException('Brak książek - uruchom najpierw flask seed-dataset')
+    sizes = {'export-benchmark-small': max(rows // 100, 1), 'export-benchmark': rows}
+    start = time.perf_counter()
+    for username, count in sizes.items():
+        # konto bez możliwości logowania - hasło to nie jest hash bcrypt
+        user = User(username=username, password='!')
+        db.session.add(user)
+        db.session.flush()
+        create_default_shelves(user)
+        shelf_ids = [shelf_id for shelf_id, in db.session.query(Shelf.id).filter_by(user_id=user.id)]
+        added = datetime.utcnow() - timedelta(days=365)
+        for offset in range(0, count, 10000):
+            db.session.execute(db.insert(UserLibrary), [
+                {'user_id': user.id, 'book_id': book_ids[i % len(book_ids)], 'shelf_id': shelf_ids[i % len(shelf_ids)],
+                 'added_at': added + timedelta(seconds=i)}
+                for i in range(offset, min(offset + 10000, count))
+            ])
+        db.session.execute(db.insert(Review), [
+            {'user_id': user.id, 'book_id': book_id, 'rating': 1 + book_id % 5, 'text': f'Recenzja testowa {book_id}'}
+            for book_id in book_ids[:count]
+        ])
+        db.session.commit()
+    click.echo(f'Dane testowe: {rows} pozycji w {time.perf_counter() - start:.1f}s')
+
+    try:
+        results = {}
+        for username, count in sizes.items():
+            results[f'{fmt} {count} wierszy'] = loadtest.export_memory(
+                app.root_path, username, fmt, app.config['EXPORT_BATCH_SIZE'])
+        if naive:
+            results[f'ORM .all() {rows} wierszy'] = loadtest.export_memory(app.root_path, 'export-benchmark',
+                                                                        kind='naive')
+    finally:
+        user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.username.in_(sizes))]
+        for model in (Review, UserLibrary, Shelf):
+            model.query.filter(model.user_id.in_(user_ids)).delete(synchronize_session=False)
+        User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+    # RSS bez stron pliku: SQLite mapuje plik bazy (mmap_size) i te strony liczą się do RSS,
+    # choć jądro zwolni je w każdej chwili - limit dotyczy pamięci anonimowej (sterta, cache stron SQLite)
+    click.echo('(czas, MB tekstu, pamięć anonimowa po imporcie aplikacji -> szczyt, szczyt całego RSS)')
+    for name, result in results.items():
+        click.echo(f"{name:28} {result['seconds']:6.1f}s {result['chars'] / 2 ** 20:7.1f} MB  "
+                   f"anon {result['baseline_kb'] / 1024:6.1f} -> {result['peak_anon_kb'] / 1024:6.1f} MB  "
+                   f"RSS {result['peak_kb'] / 1024:6.1f} MB")
+    peak = results[f'{fmt} {rows} wierszy']['peak_anon_kb'] / 1024
+    if peak > max_rss:
+        raise click.ClickException(f'Szczytowa pamięć anonimowa {peak:.0f} MB przekracza limit {max_rss} MB')
+    click.echo(f'Szczytowa pamięć anonimowa {peak:.0f} MB mieści się w limicie {max_rss} MB')
+
+
+@benchmark.command('enrichment')
+@click.option('--books', default=100000, show_default=True, help='Wydań w syntetycznym zrzucie i książek w imporcie.')
+@click.option('--hit-rate', default=0.8, show_default=True, help='Część importowanych książek obecnych w zrzucie.')
+def enrichment_command(books, hit_rate):
+    """Buduje indeks ISBN z syntetycznego zrzutu i mierzy koszt uzupełniania importu: porcjami i pojedynczo."""
+    app = current_app._get_current_object()
+    def isbn13(number):
+        digits = f'978{number:09d}'
+        return digits + str((10 - sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(digits)) % 10) % 10)
+
+    def isbn10(number):
+        digits = f'{number:09d}'
+        check = (11 - sum((10 - i) * int(c) for i, c in enumerate(digits)) % 11) % 11
+        return digits + ('X' if check == 10 else str(check))
+
+    with tempfile.TemporaryDirectory() as directory:
+        dump_path = os.path.join(directory, 'editions.jsonl')
+        index_path = os.path.join(directory, 'isbn_index.db')
+        with open(dump_path, 'w', encoding='utf-8') as dump:
+            for i in range(books):
+                # jak w Open Library: część wydań ma tylko ISBN-10 i opis jako obiekt
+                edition = {'number_of_pages': 100 + i % 700, 'covers': [i + 1],
+                           'description': {'type': '/type/text', 'value': f'Opis wydania {i}. ' * 10}}
+                if i % 3 == 0:
+                    edition['isbn_10'] = [isbn10(i)]
+                else:
+                    edition['isbn_13'] = [isbn13(i)]
+                dump.write(json.dumps(edition) + '\n')
+
+        start = time.perf_counter()
+        lines, entries = enrichment.build_index(dump_path, index_path)
+        build = time.perf_counter() - start
+        size = os.path.getsize(index_path)
+        click.echo(f'Indeks: {entries} ISBN w {build:.1f}s ({lines / build:.0f} wierszy/s), '
+                   f'{size / 2 ** 20:.1f} MB = {size / entries:.0f} B/ISBN '
+                   f'(zrzut {os.path.getsize(dump_path) / 2 ** 20:.1f} MB)')
+
+        # numery spoza zrzutu: od books w górę
+        misses = round(books * (1 - hit_rate))
+        isbns = [isbn13(i) for i in random.sample(range(books), books - misses)]
+        isbns += [isbn13(books + i) for i in range(misses)]
+        random.shuffle(isbns)
+        chunk_size = app.config['IMPORT_CHUNK_SIZE']
+
+        with enrichment.IsbnIndex(index_path) as isbn_index:
+            rows = [{'isbn': isbn, 'description': '', 'pages': None, 'cover_url': None} for isbn in isbns]
+            start = time.perf_counter()
+            enriched = sum(len(isbn_index.fill(rows[i:i + chunk_size])) for i in range(0, len(rows), chunk_size))
+            batched = time.perf_counter() - start
+
+            sample = isbns[:10000]
+            start = time.perf_counter()
+            for isbn in sample:
+                isbn_index.lookup(isbn)
+            single = (time.perf_counter() - start) / len(sample)
+
+    click.echo(f'Import {books} książek, porcje po {chunk_size}: uzupełniono {enriched} w {batched:.2f}s '
+               f'= {batched / books * 1e6:.1f} µs/książkę')
+    click.echo(f'Pojedyncze wyszukiwanie (add_book): {single * 1e6:.1f} µs')
+
+
+@benchmark.command('duplicates')
+@click.option('--samples', default=200, show_default=True, help='Książek z katalogu dodawanych ponownie w zmienionej postaci.')
+@click.option('--scan-samples', default=5, show_default=True, help='Ile z nich sprawdzić pełnym skanem dla porównania.')
+def duplicates_command(samples, scan_samples):
+    """Czas sprawdzenia duplikatów przy dodaniu jednej książki i trafność na zmienionych tytułach."""
+    app = current_app._get_current_object()
+    rng = random.Random(1)
+    book_ids = [book_id for book_id, in db.session.query(Book.id)]
+    if not book_ids:
+        raise click.ClickException('Brak książek - uruchom najpierw flask seed-dataset')
+    threshold = app.config['DUPLICATE_THRESHOLD']
+
+    def typo(text):
+        positions = [i for i, c in enumerate(text) if c.isalpha()]
+        i = rng.choice(positions) if positions else 0
+        return text[:i] + text[i + 1:]
+
+    # tak wyglądają duplikaty z formularza i importu: wielkość liter, ogonki, kolejność, literówka
+    variations = [
+        lambda title, author: (title.upper() + '.', author),
+        lambda title, author: (search.fold(title), search.fold(author)),
+        lambda title, author: (title, ' '.join(reversed(author.split()))),
+        lambda title, author: (typo(title), author),
+    ]
+    latencies, found = [], 0
+    originals = db.session.query(Book.id, Book.title, Book.author).filter(
+        Book.id.in_(rng.sample(book_ids, min(samples, len(book_ids))))).all()
+    for number, (book_id, title, author) in enumerate(originals):
+        new_title, new_author = variations[number % len(variations)](title, author)
+        start = time.perf_counter()
+        matches = duplicates.find([{'title': new_title, 'author': new_author, 'isbn': None}], threshold)[0]
+        latencies.append(time.perf_counter() - start)
+        found += any(match.book_id == book_id for match in matches)
+
+    start = time.perf_counter()
+    for book_id, title, author in originals[:scan_samples]:
+        profile = duplicates.Profile(title + '.', author)
+        [other for other in db.session.query(Book.title, Book.author, Book.isbn)
+         if profile.compare(duplicates.Profile(*other), threshold)]
+    scan = (time.perf_counter() - start) / max(min(scan_samples, len(originals)), 1)
+
+    latencies.sort()
+    click.echo(f'Katalog: {len(book_ids)} książek, {DuplicateKey.query.count()} kluczy')
+    click.echo(f'Sprawdzenie jednej książki: mediana {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+               f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms; pełny skan: {scan * 1000:.0f} ms')
+    click.echo(f'Znalezione duplikaty: {found}/{len(originals)}')
+
+
+@benchmark.command('import')
+@click.option('--rows', default=100000, show_default=True)
+@click.option('--chunk-size', default=1000, show_default=True)
+@click.option('--keep', is_flag=True, help='Nie usuwaj zaimportowanych książek.')
+def import_command(rows, chunk_size, keep):
+    """Mierzy przepustowość importera (wiersze/s) na syntetycznych danych."""
+    genres = [f'benchmark-gatunek-{i}' for i in range(30)]
+    tags = [f'benchmark-tag-{i}' for i in range(200)]
+
+    def synthetic():
+        for i in range(rows):
+            yield i + 1, {
+                'title': f'Książka testowa {i}',
+                'author': f'Autor {i % 5000}',
+                'description': 'Syntetyczny opis książki do testów wydajności.',
+                'pages': random.randint(80, 900),
+                'genres': random.sample(genres, 2),
+                'tags': random.sample(tags, 3)
+            }
+
+    start = time.perf_counter()
+    result = importer.BookImporter(chunk_size=chunk_size).run(synthetic())
+    elapsed = time.perf_counter() - start
+    click.echo(f'{result.added} wierszy w {elapsed:.2f}s = {result.added / elapsed:.0f} wierszy/s')
+
+    if not keep:
+        for i in range(0, len(result.book_ids), chunk_size):
+            ids = result.book_ids[i:i + chunk_size]
+            db.session.execute(book_genres.delete().where(book_genres.c.book_id.in_(ids)))
+            db.session.execute(book_tags.delete().where(book_tags.c.book_id.in_(ids)))
+            search.remove_books(ids)
+            duplicates.remove_books(ids)
+            Book.query.filter(Book.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        Genre.query.filter(Genre.name.in_(genres)).delete(synchronize_session=False)
+        Tag.query.filter(Tag.name.in_(tags)).delete(synchronize_session=False)
+        db.session.commit()
+        facets.index.invalidate()
+
+
+@benchmark.command('library-batch')
+@click.option('--books', default=500, show_default=True)
+def library_batch_command(books):
+    """Porównuje pojedyncze trasy biblioteki z /api/library/batch (dodanie, przeniesienie, usunięcie)."""
+    from app import create_default_shelves
+    app = current_app._get_current_object()
+    created_ids = []
+    book_ids = [book_id for book_id, in db.session.query(Book.id).order_by(Book.id).limit(books)]
+    if len(book_ids) < books:
+        created_ids = db.session.scalars(
+            db.insert(Book).returning(Book.id, sort_by_parameter_order=True),
+            [{'title': f'benchmark-książka-{i}', 'author': 'benchmark'} for i in range(books - len(book_ids))]
+        ).all()
+        db.session.commit()
+        book_ids += created_ids
+
+    password = 'benchmark123'
+    user = User(username='benchmark-biblioteka',
+                password=passwords.hash_password(password))
+    db.session.add(user)
+    db.session.commit()
+    create_default_shelves(user)
+    user_id = user.id
+    shelf_id = Shelf.query.filter_by(user_id=user_id, name='Przeczytane').first().id
+
+    csrf = app.config.get('WTF_CSRF_ENABLED', True)
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    client.post('/login', data={'username': user.username, 'password': password})
+
+    def entry_ids():
+        return [entry_id for entry_id, in db.session.query(UserLibrary.id).filter_by(user_id=user_id)]
+
+    def timed(run):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        db.session.expire_all()
+        return elapsed
+
+    def single():
+        timings = [timed(lambda: [client.post(f'/add_to_library/{book_id}') for book_id in book_ids])]
+        ids = entry_ids()
+        timings.append(timed(lambda: [client.post(f'/move_to_shelf/{entry_id}/{shelf_id}') for entry_id in ids]))
+        timings.append(timed(lambda: [client.post(f'/remove_from_library/{entry_id}') for entry_id in ids]))
+        return timings
+
+    def batch():
+        def post(payload):
+            response = client.post('/api/library/batch', json=payload)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        timings = [timed(lambda: post({'action': 'add', 'book_ids': book_ids}))]
+        ids = entry_ids()
+        timings.append(timed(lambda: post({'action': 'move', 'entry_ids': ids, 'shelf_id': shelf_id})))
+        timings.append(timed(lambda: post({'action': 'remove', 'entry_ids': ids})))
+        return timings
+
+    try:
+        results = {'pojedynczo': single(), 'batch': batch()}
+        mismatches = library_stats.check(user_id)
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = csrf
+        UserLibrary.query.filter_by(user_id=user_id).delete()
+        UserLibraryStats.query.filter_by(user_id=user_id).delete()
+        ReadingActivityDaily.query.filter_by(user_id=user_id).delete()
+        ReadingActivityMonthly.query.filter_by(user_id=user_id).delete()
+        Shelf.query.filter_by(user_id=user_id).delete()
+        User.query.filter_by(id=user_id).delete()
+        if created_ids:
+            Book.query.filter(Book.id.in_(created_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+    click.echo(f'{len(book_ids)} książek')
+    for i, phase in enumerate(['dodanie', 'przeniesienie', 'usunięcie']):
+        one, many = results['pojedynczo'][i], results['batch'][i]
+        click.echo(f'{phase:14} pojedynczo {one:7.3f}s   batch {many:7.3f}s   x{one / many:.0f}')
+    click.echo(f'Rozbieżności liczników półek: {len(mismatches)}')
+
+
+@benchmark.command('db-concurrency')
+@click.option('--seconds', default=5, show_default=True)
+@click.option('--readers', default=4, show_default=True)
+@click.option('--writers', default=2, show_default=True)
+@click.option('--timeout', default=5.0, show_default=True, help='Timeout blokady pysqlite (s) w obu wariantach.')
+def db_concurrency_command(seconds, readers, writers, timeout):
+    """Równoległe odczyty i zapisy SQLite: dawne ustawienia kontra SQLITE_PRAGMAS (WAL)."""
+    app = current_app._get_current_object()
+    variants = [('domyślne', None), ('SQLITE_PRAGMAS', app.config['SQLITE_PRAGMAS'])]
+    for name, pragmas in variants:
+        with tempfile.TemporaryDirectory() as folder:
+            result = database.benchmark_concurrency(os.path.join(folder, 'bench.db'), pragmas,
+                                                    seconds, readers, writers, timeout)
+        click.echo(f"{name:15} odczyty {result['reads_per_s']:8.0f}/s (p99 {result['read_p99_ms']:6.1f} ms)   "
+                   f"zapisy {result['writes_per_s']:6.0f}/s (p99 {result['write_p99_ms']:6.1f} ms)   "
+                   f"database is locked: {result['locked']}")
+
+
+@benchmark.command('auth')
+@click.option('--logins', default=48, show_default=True)
+@click.option('--concurrency', default=8, show_default=True, help='Równoległych logowań.')
+@click.option('--requests', default=300, show_default=True, help='Żądań strony w pomiarze load_user.')
+def auth_command(logins, concurrency, requests):
+    """Logowania/s i opóźnienie strony w trakcie fali logowań (bcrypt w wątku kontra pula procesów)
+    oraz koszt zalogowanego żądania z cache'em użytkownika i bez niego."""
+    import loadtest
+    app = current_app._get_current_object()
+    page = '/my_shelves'
+    password = 'benchmark123'
+    user = User(username='benchmark-auth', password=passwords.hash_password(password))
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    credentials = (user.username, password)
+    saved = {key: app.config[key] for key in ('WTF_CSRF_ENABLED', 'AUTH_HASH_WORKERS', 'USER_CACHE_TTL')
+             if key in app.config}
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    def percentiles(values):
+        values = sorted(values) or [0]
+        return values[len(values) // 2] * 1000, values[min(len(values) - 1, int(len(values) * 0.95))] * 1000
+
+    def login_burst(workers):
+        app.config['AUTH_HASH_WORKERS'] = workers
+        passwords.shutdown()
+        passwords.init_app(app)
+        passwords.check_password(user.password, password)  # start puli poza pomiarem
+        reader = loadtest.InProcessClient(app, credentials)
+        counter = iter(range(logins))
+        lock = threading.Lock()
+        failed, page_latencies = [], []
+        running = True
+
+        def login_worker():
+            client = app.test_client()
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                response = client.post('/login', data={'username': credentials[0], 'password': password})
+                if response.status_code != 302:
+                    with lock:
+                        failed.append(response.status_code)
+
+        def page_worker():
+            while running:
+                start = time.perf_counter()
+                reader.request('GET', page)
+                page_latencies.append(time.perf_counter() - start)
+
+        pager = threading.Thread(target=page_worker)
+        pager.start()
+        threads = [threading.Thread(target=login_worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        running = False
+        pager.join()
+        return logins / elapsed, percentiles(page_latencies), len(failed)
+
+    def page_overhead(ttl):
+        app.config['USER_CACHE_TTL'] = ttl
+        cache.delete(f'user:{user_id}')
+        client = loadtest.InProcessClient(app, credentials)
+        latencies, queries = [], []
+
+        def run():
+            # osobny wątek: każde żądanie dostaje własny kontekst aplikacji i sesję, jak na serwerze
+            for _ in range(requests):
+                start = time.perf_counter()
+                status, count = client.request('GET', page)
+                latencies.append(time.perf_counter() - start)
+                queries.append(count)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        return percentiles(latencies), sum(queries) / requests
+
+    try:
+        pool_workers = saved['AUTH_HASH_WORKERS'] or 2
+        bursts = {'w wątku żądania': login_burst(0), f'pula {pool_workers} proc.': login_burst(pool_workers)}
+        overhead = {'bez cache': page_overhead(0), 'cache użytkownika': page_overhead(saved['USER_CACHE_TTL'] or 60)}
+    finally:
+        app.config.update(saved)
+        passwords.shutdown()
+        passwords.init_app(app)
+        Shelf.query.filter_by(user_id=user_id).delete()
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+        cache.delete(f'user:{user_id}')
+
+    click.echo(f'{logins} logowań, {concurrency} równolegle, BCRYPT_LOG_ROUNDS={app.config["BCRYPT_LOG_ROUNDS"]}; '
+               f'w tle {page}:')
+    for name, (rate, (p50, p95), failed) in bursts.items():
+        click.echo(f'{name:20} {rate:6.1f} logowań/s   strona p50 {p50:7.1f}  p95 {p95:7.1f} ms   błędy {failed}')
+    click.echo(f'{page}, {requests} żądań po kolei:')
+    for name, ((p50, p95), queries) in overhead.items():
+        click.echo(f'{name:20} p50 {p50:6.2f}  p95 {p95:6.2f} ms   zapytań/żądanie {queries:.1f}')
+
+
+@benchmark.command('search')
+@click.argument('phrases', nargs=-1)
+@click.option('--repeat', default=50, show_default=True)
+def search_command(phrases, repeat):
+    """Porównuje czas wyszukiwania przez indeks z dotychczasowym ILIKE."""
+    phrases = phrases or ('tolkien', 'wiedzmin', 'lalka', 'pan tadeusz')
+
+    def run(build_query):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for phrase in phrases:
+                build_query(phrase).limit(24).all()
+        return (time.perf_counter() - start) / (repeat * len(phrases)) * 1000
+
+    def indexed_query(phrase):
+        match = search.match_subquery(phrase)
+        return Book.query.join(match, match.c.book_id == Book.id).order_by(match.c.rank)
+
+    def ilike_query(phrase):
+        return Book.query.filter(search.ilike_filter(Book, phrase)).order_by(Book.title)
+
+    click.echo(f'ILIKE:  {run(ilike_query):.3f} ms/zapytanie')
+    click.echo(f'Indeks: {run(indexed_query):.3f} ms/zapytanie')
+
+
+@benchmark.command('http-cache')
+@click.option('--repeat', default=50, show_default=True, help='Powtórzeń każdej strony.')
+def http_cache_command(repeat):
+    """Bajty i czas CPU przy ponownym wejściu na stronę: pełna odpowiedź, gzip/br i 304."""
+    app = current_app._get_current_object()
+    book_id = db.session.query(Book.id).order_by(Book.rating_count.desc()).limit(1).scalar()
+    genre_id = db.session.query(Genre.id).order_by(Genre.id).limit(1).scalar()
+    if book_id is None:
+        raise click.ClickException('Brak książek - uruchom najpierw flask seed-dataset')
+    pages = ['/books', f'/books?genre={genre_id}', f'/book/{book_id}']
+    results = {}
+
+    def run():
+        # osobny wątek: każde żądanie ma własną sesję bazy, jak na serwerze
+        client = app.test_client()
+        for page in pages:
+            client.get(page)  # rozgrzewka: indeks fasetek, cache szablonów
+            row = results[page] = {}
+            for encoding in ['identity'] + compression.encodings():
+                start = time.process_time()
+                for _ in range(repeat):
+                    response = client.get(page, headers={'Accept-Encoding': encoding})
+                row[encoding] = (len(response.get_data()), (time.process_time() - start) / repeat * 1000)
+            etag = response.headers['ETag']
+            start = time.process_time()
+            for _ in range(repeat):
+                response = client.get(page, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+            row['304'] = (len(response.get_data()), (time.process_time() - start) / repeat * 1000)
+            row['status'] = response.status_code
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+    click.echo(f'{repeat} powtórzeń na stronę (bajty treści / CPU ms na żądanie)')
+    for page, row in results.items():
+        click.echo(page)
+        for name, value in row.items():
+            if name != 'status':
+                size, cpu = value
+                click.echo(f'    {name:9} {size:8} B  {cpu:7.2f} ms')
+        full_size, full_cpu = row['identity']
+        best_size = min(row[encoding][0] for encoding in compression.encodings())
+        click.echo(f'    kompresja: -{(1 - best_size / full_size) * 100:.0f}% bajtów; '
+                   f'304 (HTTP {row["status"]}): -{full_size * repeat} B i '
+                   f'-{(full_cpu - row["304"][1]) * repeat:.0f} ms CPU na {repeat} wejść')
+
+
+@benchmark.command('fragments')
+@click.option('--repeat', default=50, show_default=True, help='Powtórzeń strony.')
+@click.option('--per-page', default=48, show_default=True, help='Kart książek na stronie /books.')
+def fragments_command(repeat, per_page):
+    """Renderowanie /books z cache'em kart książek i bez; kompilacja szablonów z cache'em bajtkodu i bez."""
+    app = current_app._get_current_object()
+    if db.session.query(Book.id).limit(1).scalar() is None:
+        raise click.ClickException('Brak książek - uruchom najpierw flask seed-dataset')
+    page = f'/books?per_page={per_page}'
+    results = {}
+    render_times = []
+
+    def before_render(sender, template, context, **extra):
+        render_times.append(-time.perf_counter())
+
+    def rendered(sender, template, context, **extra):
+        render_times[-1] += time.perf_counter()
+
+    def run():
+        # osobny wątek: każde żądanie ma własną sesję bazy, jak na serwerze
+        client = app.test_client()
+        for enabled in (False, True):
+            app.config['FRAGMENT_CACHE_ENABLED'] = enabled
+            client.get(page)  # rozgrzewka: indeks fasetek, szablony, karty w cache'u
+            render_times.clear()
+            start = time.process_time()
+            for _ in range(repeat):
+                client.get(page, headers={'Accept-Encoding': 'identity'})
+            results[enabled] = ((time.process_time() - start) / repeat * 1000,
+                                sum(render_times) / len(render_times) * 1000)
+
+    enabled = app.config['FRAGMENT_CACHE_ENABLED']
+    before_render_template.connect(before_render, app)
+    template_rendered.connect(rendered, app)
+    try:
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+    finally:
+        before_render_template.disconnect(before_render, app)
+        template_rendered.disconnect(rendered, app)
+        app.config['FRAGMENT_CACHE_ENABLED'] = enabled
+
+    click.echo(f'{page}, {repeat} powtórzeń (CPU ms na żądanie / ms renderowania szablonu)')
+    for enabled, label in ((False, 'bez cache kart'), (True, 'cache kart')):
+        cpu, render = results[enabled]
+        click.echo(f'    {label:15} {cpu:7.2f} ms  {render:7.2f} ms')
+    click.echo(f'    renderowanie: -{(1 - results[True][1] / results[False][1]) * 100:.0f}%')
+
+    # kompilacja wszystkich szablonów jak w świeżym workerze: bez cache'u, z cache'em bajtkodu
+    names = app.jinja_env.list_templates()
+    with tempfile.TemporaryDirectory() as directory:
+        timings = []
+        for bytecode_cache in (None, FileSystemBytecodeCache(directory), FileSystemBytecodeCache(directory)):
+            env = app.jinja_env.overlay(bytecode_cache=bytecode_cache, cache_size=0)
+            start = time.perf_counter()
+            for name in names:
+                env.get_template(name)
+            timings.append((time.perf_counter() - start) * 1000)
+    click.echo(f'Wczytanie {len(names)} szablonów: kompilacja {timings[0]:.1f} ms, '
+               f'zapis bajtkodu {timings[1]:.1f} ms, z cache\'u bajtkodu {timings[2]:.1f} ms')
+
+
+@benchmark.command('facets')
+@click.option('--filters', default=50, show_default=True, help='Losowych kombinacji gatunków i tagów.')
+def facets_command(filters):
+    """Liczniki fasetek /books: GROUP BY w bazie kontra bitsety w pamięci; sprawdza zgodność wyników."""
+    rng = random.Random(0)
+    genre_ids = [genre_id for genre_id, in db.session.query(Genre.id)]
+    tag_ids = [tag_id for tag_id, in db.session.query(Tag.id)]
+    if not genre_ids or not tag_ids:
+        raise click.ClickException('Brak gatunków lub tagów - uruchom najpierw flask seed-dataset')
+    cases = [(rng.sample(genre_ids, rng.randint(0, min(2, len(genre_ids)))),
+              rng.sample(tag_ids, rng.randint(0, min(2, len(tag_ids)))))
+             for _ in range(filters)]
+
+    def sql_counts(genres, tags):
+        in_genres = db.select(book_genres.c.book_id).where(book_genres.c.genre_id.in_(genres))
+        in_tags = db.select(book_tags.c.book_id).where(book_tags.c.tag_id.in_(tags))
+        genre_query = db.session.query(book_genres.c.genre_id, func.count(book_genres.c.book_id))
+        tag_query = db.session.query(book_tags.c.tag_id, func.count(book_tags.c.book_id))
+        total_query = db.session.query(func.count(Book.id))
+        if tags:
+            genre_query = genre_query.filter(book_genres.c.book_id.in_(in_tags))
+            total_query = total_query.filter(Book.id.in_(in_tags))
+        if genres:
+            tag_query = tag_query.filter(book_tags.c.book_id.in_(in_genres))
+            total_query = total_query.filter(Book.id.in_(in_genres))
+        return (dict(genre_query.group_by(book_genres.c.genre_id)),
+                dict(tag_query.group_by(book_tags.c.tag_id)),
+                total_query.scalar())
+
+    def memory_counts(genres, tags):
+        result = facets.index.search(genres, tags, tag_limit=len(tag_ids))
+        return ({genre_id: count for genre_id, name, count in result.genres if count},
+                {tag_id: count for tag_id, name, count in result.tags if count},
+                result.total)
+
+    start = time.perf_counter()
+    facets.index.load()
+    load_time = time.perf_counter() - start
+
+    timings, results = {}, {}
+    for name, counts in (('GROUP BY', sql_counts), ('bitsety', memory_counts)):
+        start = time.perf_counter()
+        results[name] = [counts(genres, tags) for genres, tags in cases]
+        timings[name] = (time.perf_counter() - start) / filters * 1000
+
+    mismatches = sum(1 for sql, memory in zip(results['GROUP BY'], results['bitsety']) if sql != memory)
+    click.echo(f'{len(genre_ids)} gatunków, {len(tag_ids)} tagów; wczytanie indeksu {load_time:.2f}s')
+    for name, elapsed in timings.items():
+        click.echo(f'{name:10} {elapsed:8.3f} ms/filtr')
+    click.echo(f'Niezgodnych wyników: {mismatches}')
+
+
+@benchmark.command('serve')
+@click.option('--requests', default=300, show_default=True, help='Żądań na scenariusz.')
+@click.option('--concurrency', default=8, show_default=True)
+@click.option('--workers', type=int, default=None, help='Workerów gunicorna (domyślnie jak w flask serve).')
+@click.option('--scenario', 'names', multiple=True, default=['home (anonim)', 'books sort_by=newest', 'book_details'],
+              show_default=True, help='Scenariusze z flask loadtest (prefiks nazwy).')
+def serve_command(requests, concurrency, workers, names):
+    """Przepustowość: serwer deweloperski (flask run --debug, jak app.run) kontra flask serve."""
+    import loadtest
+    app = current_app._get_current_object()
+    names = tuple(names)
+    scenario_list = [scenario for scenario in loadtest.scenarios()
+                     if scenario.name.startswith(names) and scenario.user is None]
+    if not scenario_list or db.session.query(Book.id).limit(1).scalar() is None:
+        raise click.ClickException('Brak danych testowych - uruchom najpierw flask seed-dataset')
+    db.session.remove()
+
+    servers = {}
+    port = loadtest.free_port()
+    servers['dev (flask run --debug)'] = (port, [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+                                                 '--debug', '--port', str(port)])
+    port = loadtest.free_port()
+    command = [sys.executable, '-m', 'flask', '--app', 'app', 'serve', '--bind', f'127.0.0.1:{port}']
+    if workers is not None:
+        command += ['--workers', str(workers)]
+    servers['flask serve (gunicorn)'] = (port, command)
+
+    results = {}
+    for label, (port, command) in servers.items():
+        base_url = f'http://127.0.0.1:{port}'
+        with loadtest.server_process(command, base_url, app.root_path):
+            results[label] = loadtest.run(lambda credentials: loadtest.HttpClient(base_url, credentials),
+                                          scenario_list, requests=requests, concurrency=concurrency)
+
+    click.echo(f'{requests} żądań na scenariusz, {concurrency} równoległych klientów (req/s, p95 ms, błędy)')
+    dev, prod = results.values()
+    for scenario in scenario_list:
+        click.echo(scenario.name)
+        for label, result in results.items():
+            stats = result[scenario.name]
+            click.echo(f"    {label:26} {stats['throughput']:8.1f} {stats['p95_ms']:8.1f} {stats['errors']:5}")
+        before, after = dev[scenario.name]['throughput'], prod[scenario.name]['throughput']
+        if before:
+            click.echo(f'    przepustowość x{after / before:.1f}')
+
+
+@benchmark.command('boot')
+@click.option('--runs', default=10, show_default=True, help='Zimnych startów w osobnych procesach.')
+@click.option('--url', default='/', show_default=True, help='Pierwsze żądanie po imporcie.')
+@click.option('--modules', 'show_modules', is_flag=True, help='Najdroższe importy według python -X importtime.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Zapisz wyniki jako JSON.')
+@click.option('--compare', 'previous', type=click.File('r'), help='Porównaj z wcześniejszym plikiem JSON.')
+def boot_command(runs, url, show_modules, output, previous):
+    """Czas zimnego startu workera: interpreter, import app.py i pierwsze żądanie."""
+    import loadtest
+    app = current_app._get_current_object()
+    current = loadtest.boot_report(loadtest.boot(app.root_path, url, runs), url)
+    click.echo(f'{runs} startów, pierwsze żądanie {url}, {current["modules"]} modułów (p50 / max ms)')
+    for key, label in (('total_ms', 'proces razem'), ('import_ms', 'import app'), ('first_request_ms', 'pierwsze żądanie')):
+        click.echo(f'    {label:17} {current[key]["p50"]:7.1f} {current[key]["max"]:7.1f}')
+    if show_modules:
+        for name, elapsed in loadtest.import_profile(app.root_path):
+            click.echo(f'    {name:30} {elapsed:7.1f} ms')
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        click.echo(f'Zapisano {output}')
+    if previous:
+        old = json.load(previous)
+        for key in ('total_ms', 'import_ms', 'first_request_ms'):
+            before, after = old[key]['p50'], current[key]['p50']
+            click.echo(f'{key:17} {before:7.1f} -> {after:7.1f} ({(after - before) / before * 100:+.0f}%)')
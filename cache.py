@@ -0,0 +1,226 @@
+import os
+import pickle
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+
+class MemoryBackend:
+    """Cache w pamięci procesu: TTL + wyrzucanie najdawniej używanych (LRU)."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Minimalny klient protokołu Redis (RESP) - bez dodatkowych zależności.
+
+    Działa z Redisem i z kompatybilnymi zamiennikami (KeyDB, Dragonfly itp.).
+    Każdy wątek ma własne połączenie; proces po forku (worker gunicorna)
+    nie używa gniazda odziedziczonego po procesie głównym.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='czytelnia:', timeout=0.5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn[2] != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = (sock, sock.makefile('rb'), os.getpid())
+            self._local.conn = conn
+            if self.password:
+                self._command('AUTH', self.password)
+            if self.db:
+                self._command('SELECT', str(self.db))
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn:
+            conn[1].close()
+            conn[0].close()
+
+    def _command(self, *args):
+        sock, reader, _ = self._connection()
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('utf-8')
+            parts.append(f'${len(arg)}\r\n'.encode() + arg + b'\r\n')
+        try:
+            sock.sendall(b''.join(parts))
+            return self._read_reply(reader)
+        except OSError:
+            self._reset()
+            raise
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Redis closed the connection')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RuntimeError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            return [self._read_reply(reader) for _ in range(int(payload))]
+        raise RuntimeError(f'Unexpected Redis reply: {line!r}')
+
+    def get(self, key):
+        data = self._command('GET', self.prefix + key)
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key, value, ttl=None):
+        args = ['SET', self.prefix + key, pickle.dumps(value)]
+        if ttl:
+            args += ['EX', str(int(ttl))]
+        self._command(*args)
+
+    def delete(self, *keys):
+        if keys:
+            self._command('DEL', *[self.prefix + key for key in keys])
+
+    def clear(self):
+        cursor = '0'
+        while True:
+            cursor, keys = self._command('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', '500')
+            cursor = cursor.decode()
+            if keys:
+                self._command('DEL', *keys)
+            if cursor == '0':
+                break
+
+
+class Cache:
+    """Fasada nad backendem z licznikami trafień.
+
+    Błąd backendu (np. niedostępny Redis) traktowany jest jak brak wpisu,
+    żeby awaria cache'u nie wyłączała strony.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.default_ttl = 300
+        self.logger = None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'memory')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('CACHE_KEY_PREFIX', 'czytelnia:')
+
+        if app.config['CACHE_BACKEND'] == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'], prefix=app.config['CACHE_KEY_PREFIX'])
+        else:
+            self.backend = MemoryBackend(max_entries=app.config['CACHE_MAX_ENTRIES'])
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self.logger = app.logger
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _failed(self, operation, error):
+        self._count('errors')
+        if self.logger:
+            self.logger.warning(f'Cache {operation} failed: {error}')
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self._failed('get', e)
+            value = None
+        self._count('misses' if value is None else 'hits')
+        return value
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.backend.set(key, value, ttl or self.default_ttl)
+        except Exception as e:
+            self._failed('set', e)
+
+    def delete(self, *keys):
+        try:
+            self.backend.delete(*keys)
+        except Exception as e:
+            self._failed('delete', e)
+
+    def clear(self):
+        try:
+            self.backend.clear()
+        except Exception as e:
+            self._failed('clear', e)
+
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_rate': self.hits / total if total else 0
+        }
@@ -0,0 +1,68 @@
+import gzip
+import threading
+import time
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pakiet Brotli jest opcjonalny - bez niego tylko gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'application/json',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+}
+
+_lock = threading.Lock()
+_stats = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0}
+
+
+def encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=5):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    # mtime=0: ta sama treść daje te same bajty
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+    result['ratio'] = result['bytes_out'] / result['bytes_in'] if result['bytes_in'] else 0
+    return result
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+
+    @app.after_request
+    def compress_response(response):
+        if (not app.config['COMPRESS_ENABLED'] or response.direct_passthrough or response.is_streamed
+                or response.status_code != 200 or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(encodings())
+        data = response.get_data()
+        if not encoding or len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        start = time.process_time()
+        compressed = compress(data, encoding, app.config['COMPRESS_GZIP_LEVEL'],
+                              app.config['COMPRESS_BROTLI_QUALITY'])
+        elapsed = time.process_time() - start
+        with _lock:
+            _stats['responses'] += 1
+            _stats['bytes_in'] += len(data)
+            _stats['bytes_out'] += len(compressed)
+            _stats['cpu_seconds'] += elapsed
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
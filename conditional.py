@@ -0,0 +1,64 @@
+import hashlib
+from flask import g, request, session, make_response
+from flask_login import current_user
+
+not_modified_count = 0
+
+
+def _viewer():
+    # strona zawiera pasek nawigacji i przyciski zależne od zalogowanego użytkownika
+    if current_user.is_authenticated:
+        return current_user.id, bool(current_user.is_moderator)
+    return None
+
+
+def not_modified(*versions, last_modified=None):
+    """Sprawdza If-None-Match/If-Modified-Since przed wczytaniem danych i renderowaniem.
+
+    versions - wartości, od których zależy treść strony (daty zmian, wersja
+    katalogu, argumenty zapytania). Zwraca gotową odpowiedź 304 albo None;
+    w drugim przypadku walidatory trafią do odpowiedzi 200 w after_request.
+    """
+    if session.get('_flashes'):
+        # komunikat flash musi zostać wyrenderowany i zdjęty z sesji
+        return None
+    viewer = _viewer()
+    digest = hashlib.sha1(repr((request.full_path, viewer) + versions).encode('utf-8')).hexdigest()[:32]
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0)
+    g.conditional = (digest, last_modified)
+
+    if request.if_none_match:
+        matches = request.if_none_match.contains_weak(digest)
+    elif last_modified is not None and request.if_modified_since and viewer is None:
+        # sama data nie obejmuje zmiany zalogowanego użytkownika - tylko dla anonimowych
+        matches = last_modified <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        matches = False
+    if not matches:
+        return None
+    global not_modified_count
+    not_modified_count += 1
+    response = make_response('', 304)
+    _set_validators(response, digest, last_modified)
+    return response
+
+
+def _set_validators(response, digest, last_modified):
+    # słaby ETag: ta sama treść po kompresji gzip/br to nadal ta sama wersja strony
+    response.set_etag(digest, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # przeglądarka może trzymać kopię, ale musi ją za każdym razem zweryfikować
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+
+
+def init_app(app):
+    @app.after_request
+    def add_validators(response):
+        validators = g.pop('conditional', None)
+        if validators and response.status_code == 200:
+            _set_validators(response, *validators)
+        return response
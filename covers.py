@@ -0,0 +1,139 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+COVER_URL_PREFIX = '/uploads/covers/'
+RENDITION_RE = re.compile(r'^(?P<stem>[\w-]+?)-(?P<size>[a-z]+)\.(?P<fmt>webp|jpg)$')
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config['COVER_WORKERS'],
+            thread_name_prefix='covers'
+        )
+    return _executor
+
+
+def upload_folder(app):
+    return os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+
+
+def save_upload(app, file):
+    """Zapisuje oryginał pod nazwą z jego skrótu SHA-256 i zleca rendycje w tle.
+
+    Ten sam plik wgrany drugi raz nie jest zapisywany ponownie.
+    Zwraca cover_url do zapisania w Book.
+    """
+    # PIL dopiero przy wgrywaniu okładki - nie przy starcie każdego workera
+    from PIL import Image, UnidentifiedImageError
+    data = file.read()
+    try:
+        # tylko nagłówek - dekodowanie całego obrazu odbywa się w tle
+        Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        raise ValueError('Nieprawidłowy plik obrazu')
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    stem = hashlib.sha256(data).hexdigest()
+    folder = upload_folder(app)
+    os.makedirs(folder, exist_ok=True)
+
+    path = os.path.join(folder, f'{stem}.{extension}')
+    if not os.path.exists(path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    with _pending_lock:
+        if path in _pending:
+            return f'{COVER_URL_PREFIX}{stem}.{extension}'
+        _pending.add(path)
+
+    def done(future):
+        with _pending_lock:
+            _pending.discard(path)
+        if future.exception():
+            app.logger.error(f'Cover processing failed for {path}: {future.exception()}')
+
+    _get_executor(app).submit(make_renditions, path, app.config['COVER_RENDITIONS']).add_done_callback(done)
+    return f'{COVER_URL_PREFIX}{stem}.{extension}'
+
+
+def make_renditions(path, renditions):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    folder = os.path.dirname(path)
+    targets = [(size, width, fmt) for size, width in renditions.items() for fmt in FORMATS
+               if not os.path.exists(os.path.join(folder, f'{stem}-{size}.{fmt}'))]
+    if not targets:
+        return 0
+
+    from PIL import Image
+    with Image.open(path) as original:
+        original.load()
+        for size, width, fmt in targets:
+            img = original.copy()
+            img.thumbnail((width, width * 3 // 2))
+            if fmt == 'jpg' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            target = os.path.join(folder, f'{stem}-{size}.{fmt}')
+            tmp_target = f'{target}.{threading.get_ident()}.tmp'
+            img.save(tmp_target, FORMATS[fmt], quality=82)
+            os.replace(tmp_target, target)
+    return len(targets)
+
+
+def rendition_url(cover_url, size, fmt):
+    if not cover_url or not cover_url.startswith(COVER_URL_PREFIX):
+        return cover_url
+    stem = os.path.splitext(cover_url[len(COVER_URL_PREFIX):])[0]
+    return f'{COVER_URL_PREFIX}{stem}-{size}.{fmt}'
+
+
+def resolve_file(app, filename):
+    """Nazwa pliku do wysłania: rendycja, a dopóki nie powstanie - oryginał."""
+    folder = upload_folder(app)
+    if os.path.exists(os.path.join(folder, filename)):
+        return filename
+    match = RENDITION_RE.match(filename)
+    if match:
+        for extension in app.config['ALLOWED_EXTENSIONS']:
+            original = f"{match.group('stem')}.{extension}"
+            if os.path.exists(os.path.join(folder, original)):
+                return original
+    return None
+
+
+def remove_cover(app, cover_url):
+    if not cover_url or not cover_url.startswith(COVER_URL_PREFIX):
+        return
+    folder = upload_folder(app)
+    filename = cover_url[len(COVER_URL_PREFIX):]
+    stem = os.path.splitext(filename)[0]
+    paths = [os.path.join(folder, filename)]
+    paths += [os.path.join(folder, f'{stem}-{size}.{fmt}')
+              for size in app.config['COVER_RENDITIONS'] for fmt in FORMATS]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def process_existing(app):
+    folder = upload_folder(app)
+    if not os.path.isdir(folder):
+        return 0
+    created = 0
+    for filename in os.listdir(folder):
+        stem, extension = os.path.splitext(filename)
+        if extension.lstrip('.').lower() in app.config['ALLOWED_EXTENSIONS'] and not RENDITION_RE.match(filename):
+            created += make_renditions(os.path.join(folder, filename), app.config['COVER_RENDITIONS'])
+    return created
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from sqlalchemy import create_engine, event, exc, text
+
+# WAL: czytelnicy nie czekają na zapis; NORMAL w WAL nie grozi uszkodzeniem bazy,
+# a oszczędza fsync przy każdym commicie
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,  # ms czekania na blokadę zamiast natychmiastowego "database is locked"
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # ujemne = KiB, czyli ~64 MB na połączenie
+    'temp_store': 'MEMORY',
+}
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def configure(app):
+    """Adres bazy i opcje silnika z konfiguracji lub zmiennych środowiskowych.
+
+    Wywoływane przed db.init_app(). Wartości ustawione wcześniej
+    w app.config mają pierwszeństwo przed środowiskiem.
+    """
+    config = app.config
+    config.setdefault('SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', 'sqlite:///czytelnia.db'))
+    # Heroku i starsze narzędzia podają jeszcze schemat postgres://
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
+        config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://' + config['SQLALCHEMY_DATABASE_URI'][len('postgres://'):]
+
+    config.setdefault('DB_POOL_SIZE', _env_int('DB_POOL_SIZE', 10))
+    config.setdefault('DB_MAX_OVERFLOW', _env_int('DB_MAX_OVERFLOW', 20))
+    config.setdefault('DB_POOL_TIMEOUT', _env_int('DB_POOL_TIMEOUT', 30))
+    config.setdefault('DB_POOL_RECYCLE', _env_int('DB_POOL_RECYCLE', 1800))
+    config.setdefault('SQLITE_PRAGMAS', dict(SQLITE_PRAGMAS))
+
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # blokady obsługuje busy_timeout z PRAGMA; timeout pysqlite ustawiamy tak samo
+        connect_args = options.setdefault('connect_args', {})
+        connect_args.setdefault('timeout', config['SQLITE_PRAGMAS'].get('busy_timeout', 5000) / 1000)
+    else:
+        options.setdefault('pool_size', config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+        # połączenia zerwane przez serwer/PgBouncer/firewall są wykrywane przed użyciem
+        options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+        options.setdefault('pool_pre_ping', True)
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Ustawia PRAGMA na każdym nowym połączeniu SQLite."""
+    if engine.dialect.name != 'sqlite':
+        return
+    in_memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if name == 'journal_mode' and in_memory:
+                continue
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def init_engine(app, db):
+    """Wywoływane po db.init_app() - podpina zdarzenia pod utworzony silnik."""
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+
+
+def benchmark_concurrency(path, pragmas, seconds=5, readers=4, writers=2, timeout=5.0):
+    """Czytelnicy i piszący na osobnym pliku SQLite; zwraca przepustowość i opóźnienia.
+
+    pragmas=None odpowiada dawnej konfiguracji (dziennik rollback, domyślne PRAGMA).
+    """
+    engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': timeout},
+                           pool_size=readers + writers)
+    if pragmas:
+        apply_sqlite_pragmas(engine, pragmas)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE IF NOT EXISTS bench (id INTEGER PRIMARY KEY, title TEXT, added REAL)'))
+        conn.execute(text('INSERT INTO bench (title, added) VALUES (:title, :added)'),
+                     [{'title': f'książka {i}', 'added': i} for i in range(20000)])
+
+    stop = time.perf_counter() + seconds
+    lock = threading.Lock()
+    stats = {'reads': 0, 'writes': 0, 'locked': 0, 'read_latency': [], 'write_latency': []}
+
+    def worker(write):
+        counter, latencies = ('writes', 'write_latency') if write else ('reads', 'read_latency')
+        local, errors, times = 0, 0, []
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                if write:
+                    with engine.begin() as conn:
+                        conn.execute(text('INSERT INTO bench (title, added) VALUES (:title, :added)'),
+                                     {'title': 'nowa', 'added': start})
+                else:
+                    with engine.connect() as conn:
+                        conn.execute(text('SELECT id, title FROM bench ORDER BY id DESC LIMIT 20')).all()
+                        conn.execute(text('SELECT count(*) FROM bench')).scalar()
+                local += 1
+                times.append(time.perf_counter() - start)
+            except exc.OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                errors += 1
+        with lock:
+            stats[counter] += local
+            stats['locked'] += errors
+            stats[latencies] += times
+
+    threads = [threading.Thread(target=worker, args=(i < writers,)) for i in range(readers + writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    def p99(values):
+        return sorted(values)[int(len(values) * 0.99)] * 1000 if values else 0
+
+    return {
+        'reads_per_s': stats['reads'] / seconds,
+        'writes_per_s': stats['writes'] / seconds,
+        'read_p99_ms': p99(stats['read_latency']),
+        'write_p99_ms': p99(stats['write_latency']),
+        'locked': stats['locked'],
+    }
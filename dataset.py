@@ -0,0 +1,147 @@
+import bisect
+import itertools
+import random
+from datetime import datetime, timedelta
+from extensions import db
+from models import User, Shelf, UserLibrary, Review
+import importer
+import passwords
+import library_stats
+import reading_activity
+import recommendations
+
+USER_PREFIX = 'load-user-'
+MODERATOR = 'load-moderator'
+PASSWORD = 'load1234'
+DEFAULT_SHELVES = [('Do przeczytania', True), ('W trakcie czytania', True), ('Przeczytane', True), ('Ulubione', False)]
+EXTRA_SHELVES = ['Kryminały na lato', 'Do kupienia', 'Pożyczone', 'Klasyka', 'Na prezent']
+CHUNK = 5000
+
+
+class Zipf:
+    """Losowanie z rozkładu Zipfa: element o randze r ma wagę 1 / r^s."""
+
+    def __init__(self, items, s, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)  # popularność nie zależy od kolejności id
+        self.rng = rng
+        self.cum_weights = list(itertools.accumulate(1 / (rank ** s) for rank in range(1, len(self.items) + 1)))
+
+    def choice(self):
+        return self.items[bisect.bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])]
+
+    def sample(self, k):
+        """k różnych elementów, popularne częściej."""
+        k = min(k, len(self.items))
+        chosen = {}
+        while len(chosen) < k:
+            item = self.choice()
+            chosen[item] = True
+            if len(chosen) < k and len(chosen) > len(self.items) * 0.8:
+                # ogon rozkładu - reszta po kolei, żeby nie losować w nieskończoność
+                for item in self.items:
+                    chosen[item] = True
+                    if len(chosen) == k:
+                        break
+        return list(chosen)
+
+
+def _library_size(rng, mean, limit):
+    # rozkład log-normalny: większość ma kilkanaście książek, nieliczni - setki
+    return max(1, min(limit, int(rng.lognormvariate(0, 1) * mean / 1.65)))
+
+
+def _insert_returning(model, rows):
+    ids = []
+    for start in range(0, len(rows), CHUNK):
+        ids += db.session.scalars(
+            db.insert(model).returning(model.id, sort_by_parameter_order=True),
+            rows[start:start + CHUNK]
+        ).all()
+    return ids
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(db.insert(model), rows[start:start + CHUNK])
+
+
+def generate(books=10000, users=1000, library_size=40, review_rate=0.3, genres=30, tags=300,
+             zipf=1.1, seed=42, neighbors=20, progress=None):
+    """Zapełnia bazę syntetycznymi danymi o skośnym (Zipfowskim) rozkładzie popularności.
+
+    Użytkownicy to load-user-N oraz moderator load-moderator, wszyscy z hasłem PASSWORD.
+    Zwraca słownik z liczbą utworzonych wierszy.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    log = progress or (lambda message: None)
+
+    genre_names = Zipf([f'Gatunek {i}' for i in range(genres)], zipf, rng)
+    tag_names = Zipf([f'tag-{i}' for i in range(tags)], zipf, rng)
+    authors = Zipf([f'Autor {i}' for i in range(max(1, books // 8))], zipf, rng)
+
+    def records():
+        for i in range(books):
+            yield i + 1, {
+                'title': f'Książka {i} {rng.choice(["o", "i", "w", "bez"])} {rng.randrange(10 ** 6)}',
+                'author': authors.choice(),
+                'description': 'Syntetyczny opis książki. ' * rng.randint(1, 8),
+                'pages': rng.randint(60, 1200),
+                'isbn': f'978{rng.randrange(10 ** 10):010d}',
+                'genres': genre_names.sample(rng.randint(1, 3)),
+                'tags': tag_names.sample(rng.randint(0, 5))
+            }
+
+    log(f'Książki: {books}')
+    book_ids = importer.BookImporter(chunk_size=2000).run(records()).book_ids
+    popularity = Zipf(book_ids, zipf, rng)
+
+    log(f'Użytkownicy: {users}')
+    password = passwords.hash_password(PASSWORD)
+    user_rows = [{'username': f'{USER_PREFIX}{i}', 'password': password, 'is_moderator': False,
+                  'date_joined': now - timedelta(days=rng.randint(0, 1500))} for i in range(users)]
+    user_rows.append({'username': MODERATOR, 'password': password, 'is_moderator': True, 'date_joined': now})
+    user_ids = _insert_returning(User, user_rows)
+
+    shelf_rows = []
+    for user_id in user_ids:
+        names = DEFAULT_SHELVES + [(name, False) for name in rng.sample(EXTRA_SHELVES, rng.randint(0, 2))]
+        shelf_rows += [{'user_id': user_id, 'name': name, 'is_default': is_default} for name, is_default in names]
+    shelf_ids = _insert_returning(Shelf, shelf_rows)
+    shelves = {}
+    for shelf_id, row in zip(shelf_ids, shelf_rows):
+        shelves.setdefault(row['user_id'], []).append((shelf_id, row['name']))
+
+    log('Biblioteki i recenzje')
+    entries, reviews = [], []
+    for user_id in user_ids:
+        user_shelves = shelves[user_id]
+        for book_id in popularity.sample(_library_size(rng, library_size, len(book_ids))):
+            shelf_id, shelf_name = rng.choice(user_shelves + [(None, None)])
+            added_at = now - timedelta(days=rng.randint(0, 720), seconds=rng.randrange(86400))
+            entry = {'user_id': user_id, 'book_id': book_id, 'shelf_id': shelf_id, 'added_at': added_at,
+                     'started_at': None, 'finished_at': None}
+            if shelf_name in (reading_activity.READING_SHELF, reading_activity.FINISHED_SHELF):
+                entry['started_at'] = added_at + timedelta(days=rng.randint(0, 30))
+            if shelf_name == reading_activity.FINISHED_SHELF:
+                entry['finished_at'] = min(now, entry['started_at'] + timedelta(days=rng.randint(1, 60)))
+                if rng.random() < review_rate:
+                    reviews.append({'user_id': user_id, 'book_id': book_id,
+                                    'rating': rng.choices([1, 2, 3, 4, 5], weights=[1, 2, 5, 9, 7])[0],
+                                    'text': 'Syntetyczna recenzja.' if rng.random() < 0.5 else None,
+                                    'created_at': entry['finished_at']})
+            entries.append(entry)
+    _insert(UserLibrary, entries)
+    _insert(Review, reviews)
+    db.session.commit()
+
+    log('Dane pochodne: oceny, liczniki półek, aktywność, rekomendacje')
+    from app import recalculate_book_ratings
+    recalculate_book_ratings()
+    library_stats.rebuild()
+    reading_activity.rebuild()
+    recommendations.rebuild(neighbors)
+
+    return {'books': len(book_ids), 'users': len(user_ids), 'shelves': len(shelf_ids),
+            'library_entries': len(entries), 'reviews': len(reviews)}
@@ -0,0 +1,310 @@
+import functools
+import hashlib
+import struct
+from collections import namedtuple
+from datetime import datetime
+from extensions import db
+from models import Book, BookNeighbor, DuplicateKey, Review, UserLibrary, book_genres, book_tags
+import enrichment
+import library_stats
+import reading_activity
+import search
+
+# 72 skróty MinHash w 12 pasmach po 6: para o podobieństwie 0.8 trafia do wspólnego
+# pasma z prawdopodobieństwem 97%, para o 0.4 - 5%, o 0.2 - 0.08%
+HASHES = 72
+BANDS = 12
+ROWS = HASHES // BANDS
+SIGNATURE = struct.Struct(f'<{HASHES}I')
+# pasmo wspólne dla tylu książek nic nie mówi (wszystkie minima z trigramów obecnych
+# prawie wszędzie, np. "ksiazka") - pomijane; klucze ISBN zawsze się liczą
+MAX_BUCKET = 50
+
+Match = namedtuple('Match', 'book_id title author score reason')
+
+
+def _key(data):
+    # 8 bajtów BLAKE2b jako BIGINT ze znakiem
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True)
+
+
+@functools.lru_cache(maxsize=100000)
+def _shingles(prefix, token):
+    padded = f' {token} '
+    return frozenset(prefix + padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+@functools.lru_cache(maxsize=100000)
+def _token_signature(prefix, token):
+    # słowa powtarzają się w większości tytułów i nazwisk - trigramy i MinHash liczone są raz
+    rows = [SIGNATURE.unpack(hashlib.shake_128(shingle.encode('utf-8')).digest(SIGNATURE.size))
+            for shingle in _shingles(prefix, token)]
+    return tuple(map(min, zip(*rows)))
+
+
+class Profile:
+    """Znormalizowany tytuł z autorem: trigramy słów, liczby w tytule i ISBN-13."""
+    __slots__ = ('tokens', 'shingles', 'numbers', 'isbn')
+
+    def __init__(self, title, author, isbn=None):
+        title_tokens = set(search.tokenize(title))
+        # "Tom 1" i "Tom 2" różnią się jednym trigramem, a to różne książki
+        self.numbers = frozenset(token for token in title_tokens if token.isdigit())
+        # trigramy w obrębie słów: kolejność słów i interpunkcja nie mają znaczenia
+        self.tokens = [('t', token) for token in title_tokens]
+        self.tokens.extend(('a', token) for token in set(search.tokenize(author)))
+        self.shingles = set().union(*(_shingles(prefix, token) for prefix, token in self.tokens))
+        self.isbn = enrichment.normalize_isbn(isbn)
+
+    def signature(self):
+        """MinHash: dla każdej z HASHES niezależnych funkcji skrótu minimum po trigramach.
+
+        SHAKE-128 daje z jednego wywołania dowolnie długi skrót, więc wszystkie
+        funkcje to kolejne 4 bajty tego samego wyniku. Minimum po trigramach
+        to minimum po minimach słów (_token_signature).
+        """
+        if not self.tokens:
+            return ()
+        return tuple(map(min, zip(*(_token_signature(prefix, token) for prefix, token in self.tokens))))
+
+    def isbn_key(self):
+        return _key(f'isbn:{self.isbn}'.encode()) if self.isbn else None
+
+    def keys(self):
+        signature = self.signature()
+        keys = set()
+        if signature:
+            packed = SIGNATURE.pack(*signature)
+            width = ROWS * 4
+            keys.update(_key(bytes((band,)) + packed[band * width:(band + 1) * width]) for band in range(BANDS))
+        if self.isbn:
+            keys.add(self.isbn_key())
+        return keys
+
+    def compare(self, other, threshold):
+        """(podobieństwo, powód) albo None, gdy to nie ten sam tytuł."""
+        if self.isbn and other.isbn:
+            # dwa poprawne, różne ISBN to różne wydania - nie scalamy po samym tytule
+            return (1.0, 'isbn') if self.isbn == other.isbn else None
+        if self.numbers != other.numbers or not self.shingles or not other.shingles:
+            return None
+        score = len(self.shingles & other.shingles) / len(self.shingles | other.shingles)
+        return (score, 'title') if score >= threshold else None
+
+
+def _books_by_keys(keys):
+    found = {}
+    keys = list(keys)
+    for start in range(0, len(keys), enrichment.LOOKUP_CHUNK):
+        rows = db.session.query(DuplicateKey.key, DuplicateKey.book_id)\
+            .filter(DuplicateKey.key.in_(keys[start:start + enrichment.LOOKUP_CHUNK]))
+        for key, book_id in rows:
+            found.setdefault(key, set()).add(book_id)
+    return found
+
+
+def _load_books(book_ids):
+    books = {}
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), enrichment.LOOKUP_CHUNK):
+        rows = db.session.query(Book.id, Book.title, Book.author, Book.isbn)\
+            .filter(Book.id.in_(book_ids[start:start + enrichment.LOOKUP_CHUNK]))
+        for book_id, title, author, isbn in rows:
+            books[book_id] = (title, author, Profile(title, author, isbn))
+    return books
+
+
+def find(records, threshold, exclude=()):
+    """Duplikaty dla rekordów (słowniki z title, author, isbn) - lista Match na rekord.
+
+    Kandydaci to książki ze wspólnym kluczem (jedno zapytanie po indeksie
+    na porcję rekordów, niezależnie od rozmiaru katalogu; bez przepełnionych
+    pasm, więc najwyżej BANDS * MAX_BUCKET książek na rekord) i wcześniejsze
+    rekordy tej samej porcji (Match z book_id None); wszyscy sprawdzani dokładnie.
+    """
+    profiles = [Profile(record['title'], record['author'], record.get('isbn')) for record in records]
+    record_keys = [profile.keys() for profile in profiles]
+    by_key = _books_by_keys(set().union(*record_keys)) if records else {}
+    isbn_keys = {profile.isbn_key() for profile in profiles}
+    by_key = {key: ids for key, ids in by_key.items() if len(ids) <= MAX_BUCKET or key in isbn_keys}
+    candidates = [set().union(*(by_key.get(key, ()) for key in keys)) - set(exclude) for keys in record_keys]
+    books = _load_books(set().union(*candidates)) if records else {}
+
+    matches = []
+    earlier = {}
+    for index, (record, profile, keys) in enumerate(zip(records, profiles, record_keys)):
+        found = []
+        for book_id in candidates[index]:
+            title, author, other = books.get(book_id, (None, None, None))
+            result = other and profile.compare(other, threshold)
+            if result:
+                found.append(Match(book_id, title, author, *result))
+        for other_index in sorted({i for key in keys for i in earlier.get(key, ())}):
+            result = profile.compare(profiles[other_index], threshold)
+            if result:
+                found.append(Match(None, records[other_index]['title'], records[other_index]['author'], *result))
+        for key in keys:
+            earlier.setdefault(key, []).append(index)
+        found.sort(key=lambda match: -match.score)
+        matches.append(found)
+    return matches
+
+
+def describe(match):
+    where = f'id {match.book_id}' if match.book_id else 'wcześniejszy wiersz'
+    return f'Duplikat książki "{match.title}" ({match.author}, {where})'
+
+
+def add_books(books):
+    """Klucze nowych książek [(id, tytuł, autor, isbn)] w bieżącej transakcji."""
+    rows = [{'key': key, 'book_id': book_id}
+            for book_id, title, author, isbn in books for key in Profile(title, author, isbn).keys()]
+    if rows:
+        db.session.execute(DuplicateKey.__table__.insert(), rows)
+
+
+def index_books(books):
+    """Jak add_books, ale najpierw usuwa dotychczasowe klucze - po edycji lub scaleniu."""
+    books = list(books)
+    remove_books([book_id for book_id, _, _, _ in books])
+    add_books(books)
+
+
+def remove_books(book_ids):
+    for start in range(0, len(book_ids), enrichment.LOOKUP_CHUNK):
+        DuplicateKey.query.filter(DuplicateKey.book_id.in_(book_ids[start:start + enrichment.LOOKUP_CHUNK]))\
+            .delete(synchronize_session=False)
+
+
+def rebuild(batch_size=2000):
+    DuplicateKey.query.delete()
+    indexed = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Book.id, Book.title, Book.author, Book.isbn)\
+            .filter(Book.id > last_id).order_by(Book.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        add_books(batch)
+        indexed += len(batch)
+    db.session.commit()
+    return indexed
+
+
+def report(threshold, limit=200):
+    """Pary prawdopodobnych duplikatów w katalogu: [(książka, książka, podobieństwo, powód)].
+
+    Przechodzi tylko po kluczach wspólnych dla kilku książek, nie po wszystkich parach.
+    """
+    shared = db.session.query(DuplicateKey.key).group_by(DuplicateKey.key)\
+        .having(db.func.count() > 1).having(db.func.count() <= MAX_BUCKET).subquery()
+    buckets = {}
+    profiles = {}
+    rows = db.session.query(DuplicateKey.key, Book.id, Book.title, Book.author, Book.isbn)\
+        .join(shared, shared.c.key == DuplicateKey.key).join(Book, Book.id == DuplicateKey.book_id)
+    for key, book_id, title, author, isbn in rows:
+        buckets.setdefault(key, []).append(book_id)
+        if book_id not in profiles:
+            profiles[book_id] = Profile(title, author, isbn)
+    pairs = {(a, b) for ids in buckets.values() for a in ids for b in ids if a < b}
+
+    found = []
+    for a, b in pairs:
+        result = profiles[a].compare(profiles[b], threshold)
+        if result:
+            found.append((a, b) + result)
+    found.sort(key=lambda pair: (-pair[2], pair[0], pair[1]))
+    found = found[:limit]
+
+    ids = {book_id for a, b, _, _ in found for book_id in (a, b)}
+    loaded = {book.id: book for book in Book.query.filter(Book.id.in_(ids))} if ids else {}
+    return [(loaded[a], loaded[b], score, reason) for a, b, score, reason in found]
+
+
+def usage(book_ids):
+    """{id: liczba wpisów w bibliotekach} - do wyboru książki, która zostaje."""
+    if not book_ids:
+        return {}
+    return dict(db.session.query(UserLibrary.book_id, db.func.count())
+                .filter(UserLibrary.book_id.in_(book_ids)).group_by(UserLibrary.book_id))
+
+
+def merge(survivor, duplicate):
+    """Przepina biblioteki, recenzje, gatunki i tagi z duplicate na survivor i usuwa duplicate.
+
+    Wszystko w jednej transakcji, commit na końcu. Gdy użytkownik ma obie
+    książki, zostaje jego wpis i recenzja dla survivor; wpis duplikatu znika
+    z liczników półek i statystyk czytania. Puste pola survivor (opis, strony,
+    okładka, ISBN) są brane z duplikatu. Zwraca liczniki zmian.
+    """
+    stats = dict.fromkeys(('entries_moved', 'entries_dropped', 'reviews_moved', 'reviews_dropped'), 0)
+    survivor_pages = survivor.pages or 0
+    duplicate_pages = duplicate.pages or 0
+
+    # strony, z którymi skończone wpisy trafiły do statystyk - do wyrównania po zmianie liczby stron
+    finished = [(entry.user_id, entry.finished_at, survivor_pages) for entry in UserLibrary.query.filter(
+        UserLibrary.book_id == survivor.id, UserLibrary.finished_at.isnot(None))]
+    survivor_users = {user_id for user_id, in db.session.query(UserLibrary.user_id).filter_by(book_id=survivor.id)}
+    for entry in UserLibrary.query.filter_by(book_id=duplicate.id):
+        if entry.user_id in survivor_users:
+            library_stats.adjust(entry.user_id, entry.shelf_id, -1)
+            reading_activity.on_remove(entry)
+            db.session.delete(entry)
+            stats['entries_dropped'] += 1
+        else:
+            if entry.finished_at:
+                finished.append((entry.user_id, entry.finished_at, duplicate_pages))
+            entry.book_id = survivor.id
+            survivor_users.add(entry.user_id)
+            stats['entries_moved'] += 1
+
+    reviewers = {user_id for user_id, in db.session.query(Review.user_id).filter_by(book_id=survivor.id)}
+    for review in Review.query.filter_by(book_id=duplicate.id):
+        if review.user_id in reviewers:
+            db.session.delete(review)
+            stats['reviews_dropped'] += 1
+        else:
+            review.book_id = survivor.id
+            stats['reviews_moved'] += 1
+
+    for table, column in ((book_genres, book_genres.c.genre_id), (book_tags, book_tags.c.tag_id)):
+        existing = {id for id, in db.session.query(column).filter(table.c.book_id == survivor.id)}
+        missing = [{'book_id': survivor.id, column.key: id}
+                   for id, in db.session.query(column).filter(table.c.book_id == duplicate.id) if id not in existing]
+        if missing:
+            db.session.execute(table.insert(), missing)
+        db.session.execute(table.delete().where(table.c.book_id == duplicate.id))
+    BookNeighbor.query.filter(db.or_(BookNeighbor.book_id == duplicate.id, BookNeighbor.neighbor_id == duplicate.id))\
+        .delete(synchronize_session=False)
+
+    for field in enrichment.ENRICH_FIELDS + ('isbn',):
+        if not getattr(survivor, field) and getattr(duplicate, field):
+            setattr(survivor, field, getattr(duplicate, field))
+    survivor.updated_at = datetime.utcnow()
+    db.session.flush()
+
+    events = {}
+    for user_id, finished_at, pages in finished:
+        if (survivor.pages or 0) != pages:
+            events.setdefault(user_id, []).append((finished_at, 0, 0, (survivor.pages or 0) - pages))
+    for user_id, user_events in events.items():
+        reading_activity.record_many(user_id, user_events)
+
+    histogram = dict(db.session.query(Review.rating, db.func.count())
+                     .filter(Review.book_id == survivor.id).group_by(Review.rating))
+    survivor.rating_count = sum(histogram.values())
+    survivor.rating_sum = sum(rating * count for rating, count in histogram.items())
+    survivor.average_rating = survivor.rating_sum / survivor.rating_count if survivor.rating_count else 0
+    for rating in range(1, 6):
+        setattr(survivor, f'rating_{rating}', histogram.get(rating, 0))
+
+    remove_books([duplicate.id])
+    search.remove_book(duplicate.id)
+    db.session.delete(duplicate)
+    db.session.flush()
+    db.session.expire(survivor, ['genres', 'tags'])
+    search.index_book(survivor)
+    index_books([(survivor.id, survivor.title, survivor.author, survivor.isbn)])
+    db.session.commit()
+    return stats
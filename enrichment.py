@@ -0,0 +1,271 @@
+import gzip
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from extensions import db
+from models import Book, UserLibrary
+import reading_activity
+import search
+
+ISBN_CHARACTERS = re.compile(r'[^0-9X]')
+# pola uzupełniane tylko wtedy, gdy w katalogu są puste
+ENRICH_FIELDS = ('description', 'pages', 'cover_url')
+OPEN_LIBRARY_COVER = 'https://covers.openlibrary.org/b/id/{}-L.jpg'
+# SQLite starsze niż 3.32 przyjmują najwyżej 999 parametrów w zapytaniu
+LOOKUP_CHUNK = 900
+
+
+def normalize_isbn(value):
+    """ISBN-10 lub ISBN-13 w dowolnym zapisie -> 13 cyfr; None, gdy suma kontrolna się nie zgadza."""
+    if not value:
+        return None
+    digits = ISBN_CHARACTERS.sub('', str(value).upper())
+    if len(digits) == 10:
+        if 'X' in digits[:9]:
+            return None
+        check = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(digits))
+        if check % 11:
+            return None
+        digits = '978' + digits[:9]
+    elif len(digits) == 13 and digits.isdigit() and digits[:3] in ('978', '979'):
+        if sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(digits)) % 10:
+            return None
+        digits = digits[:12]
+    else:
+        return None
+    check = (10 - sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(digits)) % 10) % 10
+    return digits + str(check)
+
+
+def _text(value):
+    # Open Library: opis bywa napisem albo {"type": "/type/text", "value": "..."}
+    if isinstance(value, dict):
+        value = value.get('value')
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def _list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def parse_dump_line(line):
+    """Rekord zrzutu -> (isbny, {description, pages, cover_url}) albo None.
+
+    Obsługuje JSONL (płaskie pola isbn/description/pages/cover_url albo pola
+    wydań Open Library) i zrzut Open Library w TSV, gdzie JSON jest ostatnią kolumną.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if not line.startswith('{'):
+        line = line.rsplit('\t', 1)[-1]
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(record, dict):
+        return None
+
+    isbns = {normalize_isbn(isbn) for key in ('isbn', 'isbn_13', 'isbn_10') for isbn in _list(record.get(key))}
+    isbns.discard(None)
+    if not isbns:
+        return None
+
+    pages = record.get('pages', record.get('number_of_pages'))
+    try:
+        pages = int(pages) if pages not in (None, '') else None
+    except (TypeError, ValueError):
+        pages = None
+    cover_url = _text(record.get('cover_url'))
+    if cover_url is None:
+        cover_ids = [cover for cover in _list(record.get('covers')) if isinstance(cover, int) and cover > 0]
+        cover_url = OPEN_LIBRARY_COVER.format(cover_ids[0]) if cover_ids else None
+
+    metadata = {
+        'description': _text(record.get('description')),
+        'pages': pages if pages and pages > 0 else None,
+        'cover_url': cover_url[:255] if cover_url else None
+    }
+    if not any(metadata.values()):
+        return None
+    return isbns, metadata
+
+
+def _open_dump(path):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8-sig')
+
+
+def build_index(dump_path, index_path, batch_size=10000, progress=None):
+    """Buduje indeks ISBN -> metadane z zrzutu; zwraca (wierszy zrzutu, ISBN w indeksie).
+
+    Indeks to osobny plik SQLite z ISBN-13 jako liczbowym kluczem głównym
+    (rowid) - bez osobnego indeksu, jedno wyszukiwanie w B-drzewie na książkę.
+    Plik powstaje obok docelowego i podmienia go dopiero po zbudowaniu.
+    """
+    temporary = f'{index_path}.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    connection = sqlite3.connect(temporary)
+    lines = 0
+    try:
+        # plik tymczasowy - przy awarii i tak budujemy od nowa
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('PRAGMA cache_size = -64000')
+        connection.execute(
+            'CREATE TABLE editions (isbn INTEGER PRIMARY KEY, description TEXT, pages INTEGER, cover_url TEXT)'
+        )
+        # kilka wydań z tym samym ISBN: każde pole z pierwszego wydania, które je ma
+        insert = (
+            'INSERT INTO editions (isbn, description, pages, cover_url) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (isbn) DO UPDATE SET '
+            'description = coalesce(description, excluded.description), '
+            'pages = coalesce(pages, excluded.pages), '
+            'cover_url = coalesce(cover_url, excluded.cover_url)'
+        )
+        batch = []
+        with _open_dump(dump_path) as dump:
+            for line in dump:
+                lines += 1
+                parsed = parse_dump_line(line)
+                if parsed is None:
+                    continue
+                isbns, metadata = parsed
+                batch.extend((int(isbn), metadata['description'], metadata['pages'], metadata['cover_url'])
+                             for isbn in isbns)
+                if len(batch) >= batch_size:
+                    connection.executemany(insert, batch)
+                    batch = []
+                    if progress:
+                        progress(lines)
+        if batch:
+            connection.executemany(insert, batch)
+        connection.commit()
+        entries = connection.execute('SELECT count(*) FROM editions').fetchone()[0]
+        connection.execute('VACUUM')
+    finally:
+        connection.close()
+    os.replace(temporary, index_path)
+    return lines, entries
+
+
+class IsbnIndex:
+    """Odczyt indeksu zbudowanego przez build_index - tylko do odczytu, bez sieci."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(Path(path).resolve().as_uri() + '?mode=ro', uri=True,
+                                          check_same_thread=False)
+
+    def lookup_many(self, isbns):
+        """{ISBN-13: {description, pages, cover_url}} dla znalezionych; jedno zapytanie na 900 numerów."""
+        keys = sorted({int(isbn) for isbn in filter(None, map(normalize_isbn, isbns))})
+        found = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            rows = self.connection.execute(
+                'SELECT isbn, description, pages, cover_url FROM editions '
+                f'WHERE isbn IN ({", ".join("?" * len(chunk))})', chunk
+            )
+            for isbn, description, pages, cover_url in rows:
+                found[str(isbn)] = {'description': description, 'pages': pages, 'cover_url': cover_url}
+        return found
+
+    def lookup(self, isbn):
+        return self.lookup_many([isbn]).get(normalize_isbn(isbn))
+
+    def fill(self, rows):
+        """Uzupełnia puste pola w słownikach rows (klucze isbn + ENRICH_FIELDS); zwraca zmienione."""
+        isbns = [normalize_isbn(row['isbn']) for row in rows]
+        found = self.lookup_many(isbns)
+        changed = []
+        for row, isbn in zip(rows, isbns):
+            metadata = found.get(isbn)
+            if metadata is None:
+                continue
+            updates = {field: metadata[field] for field in ENRICH_FIELDS
+                       if not row.get(field) and metadata[field]}
+            if updates:
+                row.update(updates)
+                changed.append(row)
+        return changed
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_index(app):
+    """IsbnIndex z ISBN_INDEX_PATH albo None, gdy indeksu nie zbudowano."""
+    path = app.config['ISBN_INDEX_PATH']
+    if not path or not os.path.exists(path):
+        return None
+    return IsbnIndex(path)
+
+
+def enrich_catalog(index, batch_size=1000, dry_run=False, progress=None):
+    """Uzupełnia istniejący katalog porcjami po id; zwraca (sprawdzonych, uzupełnionych).
+
+    Pobierane są tylko książki z ISBN i choć jednym pustym polem. Zmieniony
+    opis trafia do indeksu wyszukiwania, a strony dopisanej książki - do
+    statystyk czytelników, którzy już ją skończyli (inaczej zdjęcie jej
+    z półki "Przeczytane" odjęłoby strony, których nigdy nie doliczono).
+    """
+    missing = db.or_(Book.description.is_(None), Book.description == '', Book.pages.is_(None),
+                     Book.cover_url.is_(None), Book.cover_url == '')
+    checked = enriched = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Book.id, Book.isbn, Book.description, Book.pages, Book.cover_url)\
+            .filter(Book.id > last_id, Book.isbn.isnot(None), Book.isbn != '', missing)\
+            .order_by(Book.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        checked += len(batch)
+        rows = [row._asdict() for row in batch]
+        changed = index.fill(rows)
+        enriched += len(changed)
+        if changed and not dry_run:
+            _save(batch, changed)
+        if progress:
+            progress(checked, enriched)
+    return checked, enriched
+
+
+def _save(batch, changed):
+    before = {row.id: row for row in batch}
+    now = datetime.utcnow()
+    db.session.execute(db.update(Book), [
+        {'id': row['id'], 'updated_at': now, **{field: row[field] for field in ENRICH_FIELDS}}
+        for row in changed
+    ])
+
+    described = [row['id'] for row in changed if not before[row['id']].description]
+    if described:
+        books = Book.query.options(db.selectinload(Book.tags), db.selectinload(Book.genres))\
+            .filter(Book.id.in_(described)).execution_options(populate_existing=True)
+        for book in books:
+            search.index_book(book)
+
+    paged = {row['id']: row['pages'] for row in changed if not before[row['id']].pages and row['pages']}
+    if paged:
+        events = {}
+        finished = db.session.query(UserLibrary.user_id, UserLibrary.book_id, UserLibrary.finished_at)\
+            .filter(UserLibrary.book_id.in_(paged), UserLibrary.finished_at.isnot(None))
+        for user_id, book_id, finished_at in finished:
+            events.setdefault(user_id, []).append((finished_at, 0, 0, paged[book_id]))
+        for user_id, user_events in events.items():
+            reading_activity.record_many(user_id, user_events)
+    db.session.commit()
@@ -0,0 +1,127 @@
+import csv
+import io
+import itertools
+import json
+from datetime import datetime
+from extensions import db
+from models import Book, Genre, Tag, Review, Shelf, UserLibrary, book_genres, book_tags
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+# kolumny zgodne z importer.py - wyeksportowany katalog da się wczytać z powrotem
+CATALOG_FIELDS = ['id', 'title', 'author', 'description', 'pages', 'isbn', 'date_added',
+                  'average_rating', 'rating_count', 'genres', 'tags']
+LIBRARY_FIELDS = ['book_id', 'title', 'author', 'isbn', 'shelf', 'added_at', 'started_at',
+                  'finished_at', 'rating', 'review', 'reviewed_at']
+LIST_FIELDS = {'genres', 'tags'}
+
+
+def library_query(user_id):
+    """Biblioteka użytkownika z półką i recenzją - same kolumny, bez obiektów ORM."""
+    return db.session.query(
+        UserLibrary.book_id, Book.title, Book.author, Book.isbn, Shelf.name,
+        UserLibrary.added_at, UserLibrary.started_at, UserLibrary.finished_at,
+        Review.rating, Review.text, Review.created_at
+    ).join(Book, Book.id == UserLibrary.book_id)\
+        .outerjoin(Shelf, Shelf.id == UserLibrary.shelf_id)\
+        .outerjoin(Review, db.and_(Review.user_id == UserLibrary.user_id, Review.book_id == UserLibrary.book_id))\
+        .filter(UserLibrary.user_id == user_id)\
+        .order_by(UserLibrary.added_at, UserLibrary.id)
+
+
+def catalog_query():
+    return db.session.query(
+        Book.id, Book.title, Book.author, Book.description, Book.pages, Book.isbn,
+        Book.date_added, Book.average_rating, Book.rating_count
+    ).order_by(Book.id)
+
+
+def _batches(query, batch_size):
+    # yield_per: kursor po stronie serwera (PostgreSQL) / fetchmany (SQLite) - w pamięci
+    # jest najwyżej jedna porcja wierszy
+    rows = iter(query.yield_per(batch_size))
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _names(link_table, key, model, book_ids):
+    names = {}
+    query = db.session.query(link_table.c.book_id, model.name)\
+        .join(model, model.id == key).filter(link_table.c.book_id.in_(book_ids))\
+        .order_by(link_table.c.book_id, model.name)
+    for book_id, name in query:
+        names.setdefault(book_id, []).append(name)
+    return names
+
+
+def library_records(user_id, batch_size=1000):
+    for batch in _batches(library_query(user_id), batch_size):
+        yield [dict(zip(LIBRARY_FIELDS, row)) for row in batch]
+
+
+def catalog_records(batch_size=1000):
+    """Porcje książek; gatunki i tagi dwoma zapytaniami na porcję zamiast dwóch na książkę."""
+    for batch in _batches(catalog_query(), batch_size):
+        book_ids = [row.id for row in batch]
+        genres = _names(book_genres, book_genres.c.genre_id, Genre, book_ids)
+        tags = _names(book_tags, book_tags.c.tag_id, Tag, book_ids)
+        records = []
+        for row in batch:
+            record = dict(zip(CATALOG_FIELDS, row))
+            record['genres'] = genres.get(row.id, [])
+            record['tags'] = tags.get(row.id, [])
+            records.append(record)
+        yield records
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    return value
+
+
+def _csv_value(field, value):
+    if field in LIST_FIELDS:
+        return '|'.join(value)
+    value = _value(value)
+    return '' if value is None else value
+
+
+def render(batches, fmt, fields):
+    """Zamienia porcje rekordów na kawałki tekstu w danym formacie - po jednym na porcję."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM: Excel rozpozna UTF-8; importer.open_text i tak go pomija
+        writer.writerow(fields)
+        yield '\ufeff' + buffer.getvalue()
+        for batch in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([_csv_value(field, record[field]) for field in fields] for record in batch)
+            yield buffer.getvalue()
+    elif fmt == 'json':
+        separator = '[\n'
+        for batch in batches:
+            chunk = ',\n'.join(json.dumps(record, default=_value, ensure_ascii=False) for record in batch)
+            yield separator + chunk
+            separator = ',\n'
+        yield '[]\n' if separator == '[\n' else '\n]\n'
+    else:
+        for batch in batches:
+            yield ''.join(json.dumps(record, default=_value, ensure_ascii=False) + '\n' for record in batch)
+
+
+def export_library(user_id, fmt, batch_size=1000):
+    return render(library_records(user_id, batch_size), fmt, LIBRARY_FIELDS)
+
+
+def export_catalog(fmt, batch_size=1000):
+    return render(catalog_records(batch_size), fmt, CATALOG_FIELDS)
@@ -1,7 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_bcrypt import Bcrypt
+from cache import Cache
+from sql_metrics import SQLMetrics
 
 db = SQLAlchemy()
 login_manager = LoginManager()
-bcrypt = Bcrypt()
\ No newline at end of file
+cache = Cache()
+sql_metrics = SQLMetrics()
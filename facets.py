@@ -0,0 +1,268 @@
+import heapq
+import threading
+import uuid
+from extensions import db
+from models import Book, FacetVersion, Genre, Tag, book_genres, book_tags
+
+
+def bitset(ids):
+    """Liczba z ustawionym bitem n dla każdej książki o id n."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for book_id in ids:
+        bits[book_id >> 3] |= 1 << (book_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def book_ids(bits):
+    """Id książek z bitsetu, rosnąco."""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    return [offset * 8 + bit for offset, byte in enumerate(data) if byte
+            for bit in range(8) if byte >> bit & 1]
+
+
+def version_query():
+    """Podzapytanie z wersją indeksu - do dołączenia do innego zapytania strony."""
+    return db.select(FacetVersion.version).where(FacetVersion.id == 1).scalar_subquery()
+
+
+def current_version():
+    return db.session.query(FacetVersion.version).filter(FacetVersion.id == 1).scalar()
+
+
+def _new_version(expected=None):
+    """Zapisuje nową wersję indeksu w bazie i ją zwraca.
+
+    Z expected zmiana jest warunkowa (compare-and-swap): jeśli w bazie jest już
+    inna wersja, bo indeks zmienił inny proces, wersja i tak jest przesuwana,
+    ale wynik to None - kopia w tym procesie jest nieaktualna.
+    """
+    # wersja w bazie, a nie w cache'u: backend 'memory' jest osobny w każdym workerze
+    # i w procesach flask import-books / merge-books
+    version = uuid.uuid4().hex
+    query = FacetVersion.query.filter(FacetVersion.id == 1)
+    if expected is not None and query.filter(FacetVersion.version == expected).update(
+            {FacetVersion.version: version}):
+        db.session.commit()
+        return version
+    if not query.update({FacetVersion.version: version}):
+        db.session.add(FacetVersion(id=1, version=version))
+    db.session.commit()
+    return None if expected is not None else version
+
+
+def _union(postings, ids):
+    bits = 0
+    for id in ids:
+        bits |= postings.get(id, 0)
+    return bits
+
+
+class FacetIndex:
+    """Listy książek dla każdego gatunku i tagu trzymane w pamięci jako bitsety.
+
+    Liczniki fasetek to AND i bit_count() na liczbach Pythona - bez GROUP BY
+    w bazie. Zmiany z tego procesu są nanoszone od razu; pozostałe procesy
+    widzą nową wersję w tabeli facet_version i wczytują indeks od nowa.
+    Zmiany podmieniają słowniki na nowe zamiast modyfikować je w miejscu,
+    więc search() pracuje na spójnej migawce bez trzymania blokady.
+    """
+
+    def __init__(self):
+        self.genres = {}  # genre_id -> bitset książek
+        self.tags = {}
+        self.genre_names = {}
+        self.tag_names = {}
+        self.all_books = 0
+        self.version = None
+        self._sizes = None  # liczniki bez filtra, liczone raz na wersję indeksu
+        self._lock = threading.Lock()
+
+    def load(self):
+        # wersja sprzed odczytu: zmiana w trakcie wczytywania wymusi kolejne wczytanie
+        version = current_version() or _new_version()
+        genres, tags = {}, {}
+        for book_id, genre_id in db.session.query(book_genres.c.book_id, book_genres.c.genre_id):
+            genres.setdefault(genre_id, []).append(book_id)
+        for book_id, tag_id in db.session.query(book_tags.c.book_id, book_tags.c.tag_id):
+            tags.setdefault(tag_id, []).append(book_id)
+        with self._lock:
+            self.genre_names = dict(db.session.query(Genre.id, Genre.name))
+            self.tag_names = dict(db.session.query(Tag.id, Tag.name))
+            self.genres = {genre_id: bitset(ids) for genre_id, ids in genres.items()}
+            self.tags = {tag_id: bitset(ids) for tag_id, ids in tags.items()}
+            self.all_books = bitset(book_id for book_id, in db.session.query(Book.id))
+            self.version = version
+            self._sizes = None
+
+    def ensure_current(self, version=None):
+        """Wczytuje indeks przy pierwszym użyciu i po zmianach z innych procesów.
+
+        version - wersja odczytana już razem z innym zapytaniem (version_query());
+        bez niej jest czytana osobno.
+        """
+        if version is None:
+            version = current_version()
+        if self.version is None or version != self.version:
+            self.load()
+
+    def set_book(self, book_id, genres, tags):
+        """Nanosi gatunki i tagi książki ({id: nazwa}) po commicie - dodanie lub edycja."""
+        mask = 1 << book_id
+
+        def patch():
+            updated = []
+            for postings, new in ((self.genres, set(genres)), (self.tags, set(tags))):
+                postings = dict(postings)
+                for id, bits in postings.items():
+                    if bits & mask and id not in new:
+                        postings[id] = bits & ~mask
+                for id in new:
+                    postings[id] = postings.get(id, 0) | mask
+                updated.append(postings)
+            self.genres, self.tags = updated
+            self.genre_names = {**self.genre_names, **genres}
+            self.tag_names = {**self.tag_names, **tags}
+            self.all_books |= mask
+
+        self._apply(patch)
+
+    def add_books(self, books, genre_names=None, tag_names=None):
+        """Nowe książki z importu: [(book_id, genre_ids, tag_ids)] - jeden OR na gatunek/tag."""
+        genres, tags = {}, {}
+        for book_id, genre_ids, tag_ids in books:
+            for genre_id in genre_ids:
+                genres.setdefault(genre_id, []).append(book_id)
+            for tag_id in tag_ids:
+                tags.setdefault(tag_id, []).append(book_id)
+
+        def patch():
+            updated = []
+            for postings, new in ((self.genres, genres), (self.tags, tags)):
+                postings = dict(postings)
+                for id, ids in new.items():
+                    postings[id] = postings.get(id, 0) | bitset(ids)
+                updated.append(postings)
+            self.genres, self.tags = updated
+            # nazwy z pliku mogą różnić się wielkością liter - tylko dla nowych gatunków/tagów
+            self.genre_names = {**(genre_names or {}), **self.genre_names}
+            self.tag_names = {**(tag_names or {}), **self.tag_names}
+            self.all_books |= bitset(book_id for book_id, _, _ in books)
+
+        self._apply(patch)
+
+    def _apply(self, patch):
+        """Zmiana przyrostowa pod blokadą, nowa wersja w bazie już poza nią.
+
+        Nowa wersja jest przyjmowana tylko wtedy, gdy w bazie była ta, od której
+        zaczynała kopia w pamięci - inaczej zmiany innego procesu by przepadły.
+        """
+        with self._lock:
+            base = self.version
+            if base is not None:
+                patch()
+                self._sizes = None
+        # commit poza blokadą - search() i sizes() nie czekają na bazę
+        if base is None:
+            # indeks jeszcze niewczytany albo już unieważniony - wystarczy powiadomić inne procesy
+            _new_version()
+            return
+        version = _new_version(expected=base)
+        with self._lock:
+            if version is None:
+                # inny proces zmienił indeks w międzyczasie - następne ensure_current() wczyta go od nowa
+                self.version = None
+            elif self.version == base:
+                self.version = version
+
+    def invalidate(self):
+        """Po zmianach, których nie da się nanieść przyrostowo (usunięcia, słowniki)."""
+        with self._lock:
+            self.version = None
+        _new_version()
+
+    def search(self, genre_ids=(), tag_ids=(), within=None, tag_limit=10):
+        """Wybrane gatunki i tagi łączone OR w obrębie fasetki, AND między fasetkami.
+
+        within - bitset książek spełniających pozostałe warunki (np. wyszukiwanie).
+        Licznik opcji to liczba wyników po jej dodaniu do bieżącego filtra.
+        """
+        with self._lock:
+            # migawka: set_book/add_books/load podmieniają słowniki, nie zmieniają ich w miejscu
+            all_books, genre_postings, tag_postings = self.all_books, self.genres, self.tags
+            genre_names, tag_names = self.genre_names, self.tag_names
+            genre_sizes, tag_sizes = self._current_sizes()
+        base = all_books if within is None else all_books & within
+        genre_filter = _union(genre_postings, genre_ids) if genre_ids else -1
+        tag_filter = _union(tag_postings, tag_ids) if tag_ids else -1
+
+        if within is None and not tag_ids:
+            genre_counts = genre_sizes
+        else:
+            for_genres = base & tag_filter
+            genre_counts = {genre_id: (for_genres & bits).bit_count() for genre_id, bits in genre_postings.items()}
+        if within is None and not genre_ids:
+            tag_counts = tag_sizes
+        else:
+            for_tags = base & genre_filter
+            tag_counts = {tag_id: (for_tags & bits).bit_count() for tag_id, bits in tag_postings.items()}
+
+        genres = sorted(((genre_id, name, genre_counts.get(genre_id, 0))
+                         for genre_id, name in genre_names.items()),
+                        key=lambda option: option[1].lower())
+        shown = {tag_id for tag_id in heapq.nlargest(tag_limit, tag_counts, key=tag_counts.get) if tag_counts[tag_id]}
+        shown.update(tag_ids)
+        tags = sorted(((tag_id, tag_names.get(tag_id, ''), tag_counts.get(tag_id, 0)) for tag_id in shown),
+                      key=lambda option: (-option[2], option[1].lower()))
+        return FacetResult(base & genre_filter & tag_filter, genres, tags)
+
+    def sizes(self):
+        with self._lock:
+            return self._current_sizes()
+
+    def _current_sizes(self):
+        sizes = self._sizes
+        if sizes is None:
+            sizes = self._sizes = ({genre_id: bits.bit_count() for genre_id, bits in self.genres.items()},
+                                   {tag_id: bits.bit_count() for tag_id, bits in self.tags.items()})
+        return sizes
+
+
+class FacetResult:
+    def __init__(self, matching, genres, tags):
+        self.matching = matching  # bitset książek pasujących do całego filtra
+        self.genres = genres  # [(id, nazwa, liczba)]
+        self.tags = tags
+        self.total = matching.bit_count()
+
+    def book_ids(self):
+        return book_ids(self.matching)
+
+
+index = FacetIndex()
+
+
+def filter_query(query, genre_ids, tag_ids, result=None, id_limit=1000):
+    """Zawęża zapytanie o książki do wybranych gatunków i tagów.
+
+    Przy małej liczbie trafień wystarczy Book.id IN (...) z wyniku w pamięci,
+    przy dużej - EXISTS po kluczach book_genres/book_tags.
+    """
+    if not genre_ids and not tag_ids:
+        return query
+    if result is not None and result.total <= id_limit:
+        return query.filter(Book.id.in_(result.book_ids()))
+    if genre_ids:
+        query = query.filter(db.exists().where(
+            book_genres.c.book_id == Book.id, book_genres.c.genre_id.in_(genre_ids)))
+    if tag_ids:
+        query = query.filter(db.exists().where(
+            book_tags.c.book_id == Book.id, book_tags.c.tag_id.in_(tag_ids)))
+    return query
+
+
+def toggle(selected, value):
+    """Lista wybranych opcji po kliknięciu value - do linków fasetek."""
+    return [item for item in selected if item != value] if value in selected else list(selected) + [value]
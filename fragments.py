@@ -0,0 +1,48 @@
+import os
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from extensions import cache
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 'nazwa', book.id, book.updated_at %}...{% endcache %}
+
+    Wyrenderowany fragment trafia do cache'u aplikacji pod kluczem ze wszystkich
+    argumentów. Wersja (np. Book.updated_at) w kluczu sprawia, że po edycji lub
+    nowej recenzji fragment liczy się od nowa, a stary wpis po prostu wygasa.
+    Fragment nie może zależeć od zalogowanego użytkownika ani od zapytania.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', [nodes.List(args)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _cache(self, args, caller):
+        config = current_app.config
+        if not config['FRAGMENT_CACHE_ENABLED']:
+            return caller()
+        key = 'fragment:' + ':'.join(str(arg) for arg in args)
+        html = cache.get_or_set(key, lambda: str(caller()), config['FRAGMENT_CACHE_TTL'])
+        return Markup(html)
+
+
+def init_app(app):
+    app.config.setdefault('FRAGMENT_CACHE_ENABLED', True)
+    app.config.setdefault('FRAGMENT_CACHE_TTL', 3600)
+    app.config.setdefault('JINJA_BYTECODE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+    directory = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if directory:
+        # skompilowane szablony na dysku: nowy worker nie kompiluje ich od nowa;
+        # wpis zawiera sumę kontrolną źródła, więc po zmianie szablonu się unieważnia
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
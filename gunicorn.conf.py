@@ -0,0 +1,5 @@
+# gunicorn -c gunicorn.conf.py wsgi:app - te same ustawienia co flask serve (SERVER_* w app.py)
+from app import app
+import server
+
+globals().update(server.gunicorn_options(app.config))
@@ -0,0 +1,242 @@
+import csv
+import io
+import json
+import re
+from extensions import db
+from models import Book, Genre, Tag, book_genres, book_tags
+import duplicates
+import facets
+import search
+
+LIST_SEPARATOR = re.compile(r'[|,]')
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension == 'json':
+        return 'json'
+    return 'ndjson'
+
+
+def iter_records(stream, fmt):
+    """Zwraca pary (numer_wiersza, rekord) - rekord to dict albo wyjątek."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'json':
+        # tablica JSON (format pola tekstowego) i tak musi trafić w całości do pamięci
+        data = json.load(stream)
+        if not isinstance(data, list):
+            raise ValueError('Oczekiwano tablicy JSON')
+        for number, record in enumerate(data, start=1):
+            yield number, record
+    else:
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield number, e
+
+
+def open_text(binary_stream):
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+
+def _text(record, field):
+    """Pole tekstowe rekordu; JSON może mieć tu liczbę (tytuł 1984, ISBN bez kresek)."""
+    value = record.get(field)
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        raise ValueError(f'Nieprawidłowe pole {field}')
+    return str(value).strip()
+
+
+def _names(value):
+    if not value:
+        return []
+    if not isinstance(value, list):
+        if isinstance(value, dict):
+            raise ValueError('Nieprawidłowa lista gatunków lub tagów')
+        value = LIST_SEPARATOR.split(str(value))
+    return [str(name).strip() for name in value if str(name).strip()]
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed = 0
+        self.added = 0
+        self.enriched = 0
+        self.duplicates = 0
+        self.errors = []
+        self.book_ids = []
+
+
+class BookImporter:
+    """Import książek porcjami: jeden INSERT wielowierszowy i commit na porcję.
+
+    Gatunki i tagi są rozwiązywane przez słowniki nazwa->id wczytane raz
+    na początku importu, więc wiersz nie kosztuje dodatkowych zapytań.
+    Z isbn_index (enrichment.IsbnIndex) puste opisy, liczby stron i okładki
+    są uzupełniane z lokalnego zrzutu - jedno zapytanie do indeksu na porcję.
+    Z duplicate_threshold wiersze będące duplikatami książek z katalogu albo
+    wcześniejszych wierszy są pomijane (duplicates.find); klucze duplikatów
+    nowych książek są zapisywane zawsze.
+    """
+
+    def __init__(self, chunk_size=1000, progress=None, isbn_index=None, duplicate_threshold=None):
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.isbn_index = isbn_index
+        self.duplicate_threshold = duplicate_threshold
+        self._load_names()
+
+    def _load_names(self):
+        self.genre_ids = {name.lower(): id for id, name in db.session.query(Genre.id, Genre.name)}
+        self.tag_ids = {name.lower(): id for id, name in db.session.query(Tag.id, Tag.name)}
+
+    def run(self, records):
+        result = ImportResult()
+        chunk = []
+        for number, record in records:
+            result.processed += 1
+            try:
+                row = self._parse(number, record, result)
+            except ValueError as e:
+                # błędny wiersz nie przerywa importu - trafia do raportu jak pozostałe
+                result.errors.append((number, str(e)))
+                row = None
+            if row is not None:
+                chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk, result)
+                chunk = []
+        if chunk:
+            self._flush(chunk, result)
+        return result
+
+    def _parse(self, number, record, result):
+        if isinstance(record, Exception):
+            result.errors.append((number, f'Nieprawidłowy JSON: {record}'))
+            return None
+        if not isinstance(record, dict):
+            result.errors.append((number, 'Wiersz nie jest obiektem'))
+            return None
+
+        title = _text(record, 'title')
+        author = _text(record, 'author')
+        if not title or not author:
+            result.errors.append((number, 'Brak tytułu lub autora'))
+            return None
+
+        pages = record.get('pages')
+        if pages in ('', None):
+            pages = None
+        else:
+            try:
+                pages = int(pages)
+            except (TypeError, ValueError):
+                result.errors.append((number, f'Nieprawidłowa liczba stron: {pages}'))
+                return None
+
+        return {
+            'line': number,
+            'title': title[:100],
+            'author': author[:50],
+            'description': _text(record, 'description'),
+            'pages': pages,
+            'isbn': _text(record, 'isbn')[:20],
+            'cover_url': None,
+            'genres': _names(record.get('genres')),
+            'tags': _names(record.get('tags'))
+        }
+
+    def _resolve(self, names, ids, model):
+        missing = {}
+        for name in names:
+            if name.lower() not in ids:
+                missing.setdefault(name.lower(), name)
+        if missing:
+            created = db.session.execute(
+                db.insert(model).returning(model.id, model.name, sort_by_parameter_order=True),
+                [{'name': name} for name in missing.values()]
+            ).all()
+            for id, name in created:
+                ids[name.lower()] = id
+        return [ids[name.lower()] for name in names]
+
+    def _flush(self, chunk, result):
+        if self.duplicate_threshold is not None:
+            unique = []
+            for row, matches in zip(chunk, duplicates.find(chunk, self.duplicate_threshold)):
+                if matches:
+                    result.duplicates += 1
+                    result.errors.append((row['line'], duplicates.describe(matches[0])))
+                else:
+                    unique.append(row)
+            chunk = unique
+        if not chunk:
+            if self.progress:
+                self.progress(result)
+            return
+        try:
+            enriched = len(self.isbn_index.fill(chunk)) if self.isbn_index else 0
+            for row in chunk:
+                row['genre_ids'] = set(self._resolve(row['genres'], self.genre_ids, Genre))
+                row['tag_ids'] = set(self._resolve(row['tags'], self.tag_ids, Tag))
+
+            book_ids = db.session.scalars(
+                db.insert(Book).returning(Book.id, sort_by_parameter_order=True),
+                [{key: row[key] for key in ('title', 'author', 'description', 'pages', 'isbn', 'cover_url')}
+                 for row in chunk]
+            ).all()
+
+            genre_links = [{'book_id': book_id, 'genre_id': genre_id}
+                           for book_id, row in zip(book_ids, chunk) for genre_id in row['genre_ids']]
+            tag_links = [{'book_id': book_id, 'tag_id': tag_id}
+                         for book_id, row in zip(book_ids, chunk) for tag_id in row['tag_ids']]
+            if genre_links:
+                db.session.execute(book_genres.insert(), genre_links)
+            if tag_links:
+                db.session.execute(book_tags.insert(), tag_links)
+            duplicates.add_books((book_id, row['title'], row['author'], row['isbn'])
+                                 for book_id, row in zip(book_ids, chunk))
+
+            search.index_many([{
+                'id': book_id,
+                'title': row['title'],
+                'author': row['author'],
+                'description': row['description'],
+                'tags': ' '.join(row['tags']),
+                'genres': ' '.join(row['genres'])
+            } for book_id, row in zip(book_ids, chunk)])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # słowniki mogły dostać id z wycofanej transakcji
+            self._load_names()
+            result.errors.extend((row['line'], f'Błąd zapisu porcji: {e}') for row in chunk)
+        else:
+            result.added += len(book_ids)
+            result.enriched += enriched
+            result.book_ids.extend(book_ids)
+            facets.index.add_books(
+                [(book_id, row['genre_ids'], row['tag_ids']) for book_id, row in zip(book_ids, chunk)],
+                genre_names={self.genre_ids[name.lower()]: name for row in chunk for name in row['genres']},
+                tag_names={self.tag_ids[name.lower()]: name for row in chunk for name in row['tags']}
+            )
+
+        if self.progress:
+            self.progress(result)
+
+
+def import_books(stream, fmt, chunk_size=1000, progress=None, isbn_index=None, duplicate_threshold=None):
+    importer = BookImporter(chunk_size=chunk_size, progress=progress, isbn_index=isbn_index,
+                            duplicate_threshold=duplicate_threshold)
+    return importer.run(iter_records(stream, fmt))
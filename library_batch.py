@@ -0,0 +1,145 @@
+from collections import Counter
+from datetime import datetime
+from extensions import db
+from models import Book, Shelf, UserLibrary
+import library_stats
+import reading_activity
+
+ACTIONS = ('add', 'move', 'remove', 'add_to_shelf')
+
+
+def _unique(ids):
+    return list(dict.fromkeys(ids))
+
+
+def _shelves(user_id):
+    return {shelf.id: shelf for shelf in Shelf.query.filter_by(user_id=user_id)}
+
+
+def _entries(user_id, column, ids):
+    """Wpisy użytkownika (bez obiektów ORM) wraz z liczbą stron książki, kluczowane po column."""
+    rows = db.session.query(
+        UserLibrary.id, UserLibrary.book_id, UserLibrary.shelf_id,
+        UserLibrary.started_at, UserLibrary.finished_at, Book.pages
+    ).join(Book, UserLibrary.book_id == Book.id).filter(
+        UserLibrary.user_id == user_id, column.in_(ids)
+    )
+    key = 0 if column is UserLibrary.id else 1
+    return {row[key]: row for row in rows}
+
+
+class Batch:
+    """Zmiany w bibliotece jednego użytkownika dla wielu książek naraz.
+
+    Każda akcja to kilka zapytań niezależnie od liczby pozycji: jeden
+    SELECT istniejących wpisów, jeden INSERT/UPDATE/DELETE dla całej listy
+    i zbiorcze poprawki liczników półek oraz podsumowań czytania.
+    Zatwierdza wywołujący - cała partia to jedna transakcja.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.shelves = _shelves(user_id)
+        self.now = datetime.utcnow()
+        self.shelf_deltas = Counter()
+        self.events = []
+        self.library_changed = False
+
+    def _shelf(self, shelf_id):
+        if shelf_id is None:
+            return None
+        shelf = self.shelves.get(shelf_id)
+        if shelf is None:
+            raise LookupError('Nie znaleziono półki')
+        return shelf
+
+    def _events(self, events, pages):
+        self.events.extend((when, started, finished, finished * (pages or 0))
+                           for when, started, finished in events)
+
+    def add(self, book_ids, shelf_id=None):
+        """Dodaje książki do biblioteki; istniejące wpisy zostawia bez zmian."""
+        shelf = self._shelf(shelf_id)
+        book_ids = _unique(book_ids)
+        pages = dict(db.session.query(Book.id, Book.pages).filter(Book.id.in_(book_ids)))
+        existing = _entries(self.user_id, UserLibrary.book_id, book_ids)
+
+        results, rows = [], []
+        for book_id in book_ids:
+            if book_id not in pages:
+                results.append({'book_id': book_id, 'status': 'not_found'})
+            elif book_id in existing:
+                results.append({'book_id': book_id, 'status': 'exists'})
+            else:
+                started_at, finished_at, events = reading_activity.transition(
+                    None, shelf, None, None, self.now)
+                self._events(events, pages[book_id])
+                rows.append({'user_id': self.user_id, 'book_id': book_id, 'shelf_id': shelf_id,
+                             'added_at': self.now, 'started_at': started_at, 'finished_at': finished_at})
+                results.append({'book_id': book_id, 'status': 'added'})
+
+        if rows:
+            db.session.execute(db.insert(UserLibrary), rows)
+            self.shelf_deltas[shelf_id] += len(rows)
+            self.library_changed = True
+        return results
+
+    def _move_rows(self, entries, shelf):
+        updates = []
+        for entry_id, book_id, old_shelf_id, started_at, finished_at, pages in entries:
+            if old_shelf_id == (shelf.id if shelf else None):
+                continue
+            new_started, new_finished, events = reading_activity.transition(
+                self.shelves.get(old_shelf_id), shelf, started_at, finished_at, self.now)
+            self._events(events, pages)
+            self.shelf_deltas[old_shelf_id] -= 1
+            self.shelf_deltas[shelf.id if shelf else None] += 1
+            updates.append({'id': entry_id, 'shelf_id': shelf.id if shelf else None,
+                            'started_at': new_started, 'finished_at': new_finished})
+        if updates:
+            # UPDATE ... WHERE id = ? wykonany jako jedno executemany
+            db.session.execute(db.update(UserLibrary), updates)
+        return len(updates)
+
+    def move(self, entry_ids, shelf_id):
+        """Przenosi wpisy na półkę (None = bez półki)."""
+        shelf = self._shelf(shelf_id)
+        entry_ids = _unique(entry_ids)
+        entries = _entries(self.user_id, UserLibrary.id, entry_ids)
+        self._move_rows(entries.values(), shelf)
+        return [{'entry_id': entry_id, 'status': 'moved' if entry_id in entries else 'not_found'}
+                for entry_id in entry_ids]
+
+    def add_to_shelf(self, book_ids, shelf_id):
+        """Jak pojedyncze add_to_shelf: książki spoza biblioteki są dodawane, pozostałe przenoszone."""
+        shelf = self._shelf(shelf_id)
+        book_ids = _unique(book_ids)
+        existing = _entries(self.user_id, UserLibrary.book_id, book_ids)
+        self._move_rows(existing.values(), shelf)
+        added = {result['book_id']: result
+                 for result in self.add([book_id for book_id in book_ids if book_id not in existing], shelf_id)}
+        return [{'book_id': book_id, 'status': 'moved'} if book_id in existing else added[book_id]
+                for book_id in book_ids]
+
+    def remove(self, entry_ids):
+        entry_ids = _unique(entry_ids)
+        entries = _entries(self.user_id, UserLibrary.id, entry_ids)
+        for entry_id, book_id, shelf_id, started_at, finished_at, pages in entries.values():
+            if started_at:
+                self.events.append((started_at, -1, 0, 0))
+            if finished_at:
+                self.events.append((finished_at, 0, -1, -(pages or 0)))
+            self.shelf_deltas[shelf_id] -= 1
+        if entries:
+            UserLibrary.query.filter(UserLibrary.id.in_(list(entries))).delete(synchronize_session=False)
+            self.library_changed = True
+        return [{'entry_id': entry_id, 'status': 'removed' if entry_id in entries else 'not_found'}
+                for entry_id in entry_ids]
+
+    def flush(self):
+        """Zapisuje zebrane zmiany liczników półek i podsumowań czytania."""
+        for shelf_id, delta in self.shelf_deltas.items():
+            library_stats.adjust(self.user_id, shelf_id, delta)
+        reading_activity.record_many(self.user_id, self.events)
+        self.shelf_deltas.clear()
+        self.events = []
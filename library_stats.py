@@ -0,0 +1,86 @@
+from extensions import db
+from models import UserLibrary, UserLibraryStats
+
+NO_SHELF = 0
+
+
+def _key(shelf_id):
+    return shelf_id or NO_SHELF
+
+
+def adjust(user_id, shelf_id, delta):
+    """Zmienia licznik półki w bieżącej transakcji."""
+    if not delta:
+        return
+    updated = UserLibraryStats.query.filter_by(user_id=user_id, shelf_id=_key(shelf_id)).update(
+        {UserLibraryStats.book_count: UserLibraryStats.book_count + delta},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(UserLibraryStats(user_id=user_id, shelf_id=_key(shelf_id), book_count=delta))
+        db.session.flush()
+
+
+def move(user_id, old_shelf_id, new_shelf_id, count=1):
+    if _key(old_shelf_id) == _key(new_shelf_id):
+        return
+    adjust(user_id, old_shelf_id, -count)
+    adjust(user_id, new_shelf_id, count)
+
+
+def drop_shelf(user_id, shelf_id, target_shelf_id=None):
+    """Usuwa licznik półki, opcjonalnie przenosząc jej książki na inną półkę."""
+    row = UserLibraryStats.query.filter_by(user_id=user_id, shelf_id=_key(shelf_id)).first()
+    if row is None:
+        return
+    if target_shelf_id is not None:
+        adjust(user_id, target_shelf_id, row.book_count)
+    db.session.delete(row)
+
+
+def shelf_counts(user_id):
+    return {
+        shelf_id: count for shelf_id, count in db.session.query(
+            UserLibraryStats.shelf_id, UserLibraryStats.book_count
+        ).filter_by(user_id=user_id)
+    }
+
+
+def _actual_counts(user_id=None):
+    query = db.session.query(
+        UserLibrary.user_id,
+        db.func.coalesce(UserLibrary.shelf_id, NO_SHELF),
+        db.func.count(UserLibrary.id)
+    ).group_by(UserLibrary.user_id, db.func.coalesce(UserLibrary.shelf_id, NO_SHELF))
+    if user_id is not None:
+        query = query.filter(UserLibrary.user_id == user_id)
+    return {(uid, shelf_id): count for uid, shelf_id, count in query}
+
+
+def _stored_counts(user_id=None):
+    query = db.session.query(UserLibraryStats.user_id, UserLibraryStats.shelf_id, UserLibraryStats.book_count)
+    if user_id is not None:
+        query = query.filter(UserLibraryStats.user_id == user_id)
+    return {(uid, shelf_id): count for uid, shelf_id, count in query if count}
+
+
+def check(user_id=None):
+    """Zwraca listę rozbieżności (user_id, shelf_id, zapisane, faktyczne)."""
+    actual = _actual_counts(user_id)
+    stored = _stored_counts(user_id)
+    return [(uid, shelf_id, stored.get((uid, shelf_id), 0), actual.get((uid, shelf_id), 0))
+            for uid, shelf_id in sorted(set(actual) | set(stored))
+            if stored.get((uid, shelf_id), 0) != actual.get((uid, shelf_id), 0)]
+
+
+def rebuild(user_id=None):
+    query = UserLibraryStats.query
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    query.delete(synchronize_session=False)
+    rows = [{'user_id': uid, 'shelf_id': shelf_id, 'book_count': count}
+            for (uid, shelf_id), count in _actual_counts(user_id).items()]
+    if rows:
+        db.session.execute(db.insert(UserLibraryStats), rows)
+    db.session.commit()
+    return len(rows)
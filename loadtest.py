@@ -0,0 +1,391 @@
+import contextlib
+import http.cookiejar
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from sqlalchemy import event
+from extensions import db
+from models import Book, Genre, Tag, User, Shelf
+import dataset
+
+CSRF_INPUT = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+\d+ \|\s+(?P<cumulative>\d+) \|(?P<indent> +)(?P<name>\S+)$')
+
+
+class Scenario:
+    def __init__(self, name, path, user=None, method='GET', data=None):
+        self.name = name
+        self.path = path  # tekst albo funkcja rng -> ścieżka
+        self.user = user  # None, 'reader' albo 'moderator'
+        self.method = method
+        self.data = data
+
+    def url(self, rng):
+        return self.path(rng) if callable(self.path) else self.path
+
+
+def scenarios(seed=0):
+    """Scenariusze na danych z dataset.generate() - książki losowane według popularności."""
+    from app import BOOK_SORT_ORDERS, LIBRARY_SORT_ORDERS
+
+    rng = random.Random(seed)
+    book_ids = [book_id for book_id, in db.session.query(Book.id).order_by(Book.rating_count.desc()).limit(5000)]
+    popular = dataset.Zipf(book_ids, 1.1, rng) if book_ids else None
+    genre_ids = [genre_id for genre_id, in db.session.query(Genre.id).order_by(Genre.id).limit(2)]
+    genre_id = genre_ids[0] if genre_ids else None
+    tag_id = db.session.query(Tag.id).order_by(Tag.id).limit(1).scalar()
+
+    def book_path(rng):
+        return f'/book/{popular.choice()}'
+
+    def bulk_payload(rng):
+        return {'books_data': json.dumps([
+            {'title': f'Import obciążeniowy {rng.randrange(10 ** 9)}', 'author': 'Autor testowy',
+             'pages': rng.randint(100, 500), 'genres': ['Gatunek 0'], 'tags': ['tag-0']}
+            for _ in range(5)
+        ])}
+
+    result = [Scenario('home (anonim)', '/'), Scenario('home', '/', user='reader')]
+    result += [Scenario(f'books sort_by={sort_by}', f'/books?sort_by={sort_by}') for sort_by in BOOK_SORT_ORDERS]
+    result += [
+        Scenario('books search', '/books?search=ksiazka'),
+        Scenario('books genre', f'/books?genre={genre_id}'),
+        Scenario('books tag', f'/books?tag={tag_id}'),
+        Scenario('books fasetki', '/books?' + '&'.join([f'genre={id}' for id in genre_ids] + [f'tag={tag_id}'])),
+        Scenario('book_details', book_path),
+        Scenario('book_details (zalogowany)', book_path, user='reader'),
+    ]
+    result += [Scenario(f'my_library sort_by={sort_by}', f'/my_library?sort_by={sort_by}', user='reader')
+               for sort_by in LIBRARY_SORT_ORDERS]
+    result += [
+        Scenario('my_library search', '/my_library?search=ksiazka', user='reader'),
+        Scenario('profile', '/profile', user='reader'),
+        Scenario('bulk_add_books', '/bulk_add_books', user='moderator', method='POST', data=bulk_payload),
+    ]
+    return result
+
+
+def _credentials(kind, index):
+    if kind == 'moderator':
+        return dataset.MODERATOR, dataset.PASSWORD
+    return f'{dataset.USER_PREFIX}{index}', dataset.PASSWORD
+
+
+class InProcessClient:
+    """Klient testowy Flaska; liczbę zapytań zlicza zdarzenie silnika."""
+    _local = threading.local()
+    _listening = False
+    _lock = threading.Lock()
+
+    def __init__(self, app, credentials=None):
+        self.app = app
+        self.client = app.test_client()
+        with InProcessClient._lock:
+            if not InProcessClient._listening:
+                with app.app_context():
+                    event.listen(db.engine, 'before_cursor_execute', InProcessClient._count)
+                InProcessClient._listening = True
+        if credentials:
+            username, password = credentials
+            self.client.post('/login', data={'username': username, 'password': password})
+
+    @classmethod
+    def _count(cls, *args):
+        cls._local.queries = getattr(cls._local, 'queries', 0) + 1
+
+    def request(self, method, path, data=None):
+        InProcessClient._local.queries = 0
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, InProcessClient._local.queries
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # mierzymy samo żądanie, tak jak klient testowy - bez strony docelowej przekierowania
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """Prawdziwy serwer; liczba zapytań z nagłówka Server-Timing (SQL_SERVER_TIMING)."""
+
+    def __init__(self, base_url, credentials=None):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+        self.tokens = {}
+        if credentials:
+            username, password = credentials
+            self.request('POST', '/login', {'username': username, 'password': password})
+
+    def _token(self, path):
+        if path not in self.tokens:
+            with self.opener.open(self.base_url + path) as response:
+                match = CSRF_INPUT.search(response.read().decode('utf-8'))
+            self.tokens[path] = match.group(1) if match else ''
+        return self.tokens[path]
+
+    def request(self, method, path, data=None):
+        body = None
+        if method == 'POST':
+            data = dict(data or {}, csrf_token=self._token(path))
+            body = urllib.parse.urlencode(data).encode('utf-8')
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                status, timing = response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            status, timing = e.code, e.headers.get('Server-Timing', '')
+        match = SERVER_TIMING_QUERIES.search(timing)
+        return status, int(match.group(1)) if match else None
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(make_client, scenario_list, requests=100, concurrency=4, seed=0, progress=None):
+    """Każdy scenariusz: `requests` żądań rozłożonych na `concurrency` wątków."""
+    results = {}
+    sessions = {}  # zalogowani klienci są współdzieleni między scenariuszami
+
+    def client_for(kind, index):
+        if (kind, index) not in sessions:
+            sessions[kind, index] = make_client(_credentials(kind, index) if kind else None)
+        return sessions[kind, index]
+
+    for scenario in scenario_list:
+        clients = [client_for(scenario.user, i) for i in range(concurrency)]
+        latencies, queries, errors = [], [], 0
+        lock = threading.Lock()
+        counter = iter(range(requests))
+
+        def worker(client, worker_rng):
+            nonlocal errors
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                path = scenario.url(worker_rng)
+                data = scenario.data(worker_rng) if callable(scenario.data) else scenario.data
+                start = time.perf_counter()
+                try:
+                    status, query_count = client.request(scenario.method, path, data)
+                except OSError:
+                    status, query_count = None, None
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if query_count is not None:
+                        queries.append(query_count)
+                    if status is None or status >= 400:
+                        errors += 1
+
+        threads = [threading.Thread(target=worker, args=(client, random.Random(seed + i)))
+                   for i, client in enumerate(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        results[scenario.name] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / wall if wall else 0,
+            'p50_ms': _percentile(latencies, 0.50) * 1000,
+            'p95_ms': _percentile(latencies, 0.95) * 1000,
+            'p99_ms': _percentile(latencies, 0.99) * 1000,
+            'queries_per_request': sum(queries) / len(queries) if queries else None,
+        }
+        if progress:
+            progress(scenario.name, results[scenario.name])
+    return results
+
+
+def dataset_size():
+    return {
+        'books': db.session.query(db.func.count(Book.id)).scalar(),
+        'users': db.session.query(db.func.count(User.id)).scalar(),
+        'shelves': db.session.query(db.func.count(Shelf.id)).scalar(),
+    }
+
+
+def report(results, mode, target, requests, concurrency):
+    return {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'mode': mode,
+            'target': target,
+            'requests_per_scenario': requests,
+            'concurrency': concurrency,
+            'dataset': dataset_size(),
+        },
+        'scenarios': results,
+    }
+
+
+def compare(previous, current):
+    """Wiersze (scenariusz, p95 przed, p95 teraz, zmiana %, zapytania przed, zapytania teraz)."""
+    rows = []
+    for name, stats in current['scenarios'].items():
+        old = previous['scenarios'].get(name)
+        if not old:
+            continue
+        change = (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+        rows.append((name, old['p95_ms'], stats['p95_ms'], change,
+                     old.get('queries_per_request'), stats.get('queries_per_request')))
+    return rows
+
+
+# uruchamiane w nowym interpreterze: import aplikacji i pierwsze żądanie jak w świeżym workerze
+BOOT_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+print(json.dumps({'import_ms': (imported - start) * 1000,
+                  'first_request_ms': (time.perf_counter() - imported) * 1000,
+                  'status': response.status_code, 'modules': len(sys.modules)}))
+'''
+
+
+def boot(root_path, url='/', runs=10):
+    """Zimny start w osobnych procesach: [{'total_ms', 'import_ms', 'first_request_ms', ...}]."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', BOOT_PROBE, url], cwd=root_path,
+                                capture_output=True, text=True, check=True).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['total_ms'] = (time.perf_counter() - start) * 1000
+        samples.append(sample)
+    return samples
+
+
+def import_profile(root_path, limit=15):
+    """Najdroższe moduły importowane bezpośrednio przez app.py według python -X importtime."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=root_path,
+                            capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        # wcięcie o jeden poziom głębiej niż app: import z poziomu app.py
+        if match and match.group('indent') == '   ':
+            modules.append((match.group('name'), int(match.group('cumulative')) / 1000))
+        elif match and match.group('name') == 'app':
+            modules.append(('app (razem)', int(match.group('cumulative')) / 1000))
+    return sorted(modules, key=lambda module: module[1], reverse=True)[:limit]
+
+
+def boot_report(samples, url):
+    summary = {'created_at': datetime.utcnow().isoformat(timespec='seconds'), 'url': url, 'runs': len(samples)}
+    for key in ('total_ms', 'import_ms', 'first_request_ms'):
+        values = [sample[key] for sample in samples]
+        summary[key] = {'p50': _percentile(values, 0.50), 'max': max(values)}
+    summary['modules'] = samples[-1]['modules']
+    return summary
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def server_process(command, base_url, root_path, timeout=30):
+    """Uruchamia serwer w osobnej grupie procesów i czeka, aż odpowie na /."""
+    process = subprocess.Popen(command, cwd=root_path, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'Serwer zakończył się kodem {process.returncode}: {" ".join(command)}')
+            try:
+                with urllib.request.urlopen(base_url + '/', timeout=1):
+                    break
+            except (urllib.error.URLError, OSError):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'Serwer nie odpowiada po {timeout} s: {" ".join(command)}')
+                time.sleep(0.2)
+        yield process
+    finally:
+        # cała grupa: reloader serwera deweloperskiego i workery gunicorna
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+# eksport w nowym procesie: szczytowe RSS dotyczy tylko importu aplikacji i samego eksportu
+EXPORT_PROBE = '''
+import json, os, sys, time
+def status_kb(field):
+    # VmHWM - szczyt całego RSS; RssAnon - bez stron pliku bazy zmapowanych przez mmap SQLite
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+from app import app
+import exporter
+from models import User
+kind, username, fmt, batch_size = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+with app.app_context():
+    baseline = status_kb('RssAnon')
+    user_id = User.query.filter_by(username=username).first().id
+    start = time.perf_counter()
+    size = 0
+    peak_anon = baseline
+    with open(os.devnull, 'w', encoding='utf-8') as output:
+        if kind == 'naive':
+            # dla porównania: cała biblioteka jako obiekty ORM, potem jeden dokument
+            from extensions import db
+            from models import Book, Review, Shelf, UserLibrary
+            rows = (db.session.query(UserLibrary, Book, Shelf, Review)
+                    .join(Book, Book.id == UserLibrary.book_id)
+                    .outerjoin(Shelf, Shelf.id == UserLibrary.shelf_id)
+                    .outerjoin(Review, db.and_(Review.user_id == UserLibrary.user_id,
+                                               Review.book_id == UserLibrary.book_id))
+                    .filter(UserLibrary.user_id == user_id).all())
+            chunks = [json.dumps([{'book_id': entry.book_id, 'title': book.title, 'author': book.author,
+                                   'shelf': shelf.name if shelf else None, 'added_at': str(entry.added_at),
+                                   'rating': review.rating if review else None,
+                                   'review': review.text if review else None}
+                                  for entry, book, shelf, review in rows], ensure_ascii=False)]
+        else:
+            chunks = exporter.export_library(user_id, fmt, batch_size)
+        for chunk in chunks:
+            size += len(chunk)
+            output.write(chunk)
+            peak_anon = max(peak_anon, status_kb('RssAnon'))
+    print(json.dumps({'seconds': time.perf_counter() - start, 'chars': size, 'baseline_kb': baseline,
+                      'peak_anon_kb': peak_anon, 'peak_kb': status_kb('VmHWM')}))
+'''
+
+
+def export_memory(root_path, username, fmt='ndjson', batch_size=1000, kind='stream'):
+    """Eksport biblioteki w osobnym procesie: {'seconds', 'chars', 'baseline_kb', 'peak_anon_kb', 'peak_kb'}."""
+    output = subprocess.run([sys.executable, '-c', EXPORT_PROBE, kind, username, fmt, str(batch_size)],
+                            cwd=root_path, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
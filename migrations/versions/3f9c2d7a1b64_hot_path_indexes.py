@@ -0,0 +1,68 @@
+"""hot path indexes
+
+Revision ID: 3f9c2d7a1b64
+Revises: eca381d1b9ed
+Create Date: 2026-10-18 15:10:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2d7a1b64'
+down_revision = 'eca381d1b9ed'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_books_title'), ['title'], unique=False)
+        batch_op.create_index(batch_op.f('ix_books_author'), ['author'], unique=False)
+        batch_op.create_index(batch_op.f('ix_books_date_added'), ['date_added'], unique=False)
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_reviews_book_created', ['book_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('shelves', schema=None) as batch_op:
+        batch_op.create_index('ix_shelves_user_name', ['user_id', 'name'], unique=False)
+
+    with op.batch_alter_table('user_library', schema=None) as batch_op:
+        batch_op.create_index('ix_user_library_user_shelf_added', ['user_id', 'shelf_id', 'added_at'], unique=False)
+        batch_op.create_index('ix_user_library_user_added', ['user_id', 'added_at'], unique=False)
+        batch_op.create_index('ix_user_library_user_book', ['user_id', 'book_id'], unique=False)
+        batch_op.create_index('ix_user_library_book', ['book_id'], unique=False)
+        batch_op.create_index('ix_user_library_shelf', ['shelf_id'], unique=False)
+
+    with op.batch_alter_table('book_genres', schema=None) as batch_op:
+        batch_op.create_index('ix_book_genres_genre', ['genre_id', 'book_id'], unique=False)
+
+    with op.batch_alter_table('book_tags', schema=None) as batch_op:
+        batch_op.create_index('ix_book_tags_tag', ['tag_id', 'book_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('book_tags', schema=None) as batch_op:
+        batch_op.drop_index('ix_book_tags_tag')
+
+    with op.batch_alter_table('book_genres', schema=None) as batch_op:
+        batch_op.drop_index('ix_book_genres_genre')
+
+    with op.batch_alter_table('user_library', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_library_shelf')
+        batch_op.drop_index('ix_user_library_book')
+        batch_op.drop_index('ix_user_library_user_book')
+        batch_op.drop_index('ix_user_library_user_added')
+        batch_op.drop_index('ix_user_library_user_shelf_added')
+
+    with op.batch_alter_table('shelves', schema=None) as batch_op:
+        batch_op.drop_index('ix_shelves_user_name')
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_reviews_book_created')
+
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_books_date_added'))
+        batch_op.drop_index(batch_op.f('ix_books_author'))
+        batch_op.drop_index(batch_op.f('ix_books_title'))
@@ -0,0 +1,34 @@
+"""book duplicate keys
+
+Revision ID: 5d2a9e41c7b3
+Revises: c3d3c7674ae2
+Create Date: 2026-10-18 17:42:11.384102
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2a9e41c7b3'
+down_revision = 'c3d3c7674ae2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('book_duplicate_keys',
+    sa.Column('key', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.PrimaryKeyConstraint('key', 'book_id')
+    )
+    with op.batch_alter_table('book_duplicate_keys', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_book_duplicate_keys_book_id'), ['book_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('book_duplicate_keys', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_duplicate_keys_book_id'))
+
+    op.drop_table('book_duplicate_keys')
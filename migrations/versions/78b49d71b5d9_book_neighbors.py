@@ -0,0 +1,32 @@
+"""book neighbors
+
+Revision ID: 78b49d71b5d9
+Revises: 3f9c2d7a1b64
+Create Date: 2026-10-18 15:08:34.513623
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '78b49d71b5d9'
+down_revision = '3f9c2d7a1b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('book_neighbors',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.ForeignKeyConstraint(['neighbor_id'], ['books.id'], ),
+    sa.PrimaryKeyConstraint('book_id', 'neighbor_id')
+    )
+
+
+def downgrade():
+    op.drop_table('book_neighbors')
@@ -0,0 +1,28 @@
+"""facet version
+
+Revision ID: 9b1e6f0c2d48
+Revises: 5d2a9e41c7b3
+Create Date: 2026-10-18 21:05:37.912544
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1e6f0c2d48'
+down_revision = '5d2a9e41c7b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('facet_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.String(length=32), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('facet_version')
@@ -0,0 +1,30 @@
+"""book updated_at
+
+Revision ID: c3d3c7674ae2
+Revises: 78b49d71b5d9
+Create Date: 2026-10-18 15:26:05.119071
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d3c7674ae2'
+down_revision = '78b49d71b5d9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_books_updated_at'), ['updated_at'], unique=False)
+
+    op.execute('UPDATE books SET updated_at = date_added')
+
+
+def downgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_books_updated_at'))
+        batch_op.drop_column('updated_at')
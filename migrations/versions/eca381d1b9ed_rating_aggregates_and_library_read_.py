@@ -0,0 +1,105 @@
+"""rating aggregates and library read models
+
+Revision ID: eca381d1b9ed
+Revises: 
+Create Date: 2026-10-18 15:02:30.030272
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'eca381d1b9ed'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reading_activity_daily',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('books_started', sa.Integer(), nullable=False),
+    sa.Column('books_finished', sa.Integer(), nullable=False),
+    sa.Column('pages_read', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    op.create_table('reading_activity_monthly',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('books_started', sa.Integer(), nullable=False),
+    sa.Column('books_finished', sa.Integer(), nullable=False),
+    sa.Column('pages_read', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'month')
+    )
+    op.create_table('user_library_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('shelf_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'shelf_id')
+    )
+
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('average_rating', sa.Float(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_1', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_2', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_3', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_4', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_5', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_books_average_rating', ['average_rating', 'rating_count'], unique=False)
+
+    with op.batch_alter_table('user_library', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('started_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('finished_at', sa.DateTime(), nullable=True))
+
+    # agregaty ocen dla istniejących recenzji (to samo co `flask recalc-ratings`)
+    op.execute("""
+        UPDATE books SET
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.book_id = books.id),
+            rating_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id),
+            average_rating = COALESCE((SELECT AVG(rating) FROM reviews WHERE reviews.book_id = books.id), 0),
+            rating_1 = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id AND rating = 1),
+            rating_2 = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id AND rating = 2),
+            rating_3 = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id AND rating = 3),
+            rating_4 = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id AND rating = 4),
+            rating_5 = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id AND rating = 5)
+    """)
+
+    # daty czytania dla wpisów, które już stoją na półkach śledzonych przez reading_activity.py:
+    # najlepsze przybliżenie to dodanie do biblioteki; flask init-db odbuduje z nich aktywność
+    for column, shelf in (('started_at', 'W trakcie czytania'), ('finished_at', 'Przeczytane')):
+        op.execute(sa.text(f"""
+            UPDATE user_library SET {column} = COALESCE(
+                added_at,
+                (SELECT created_at FROM shelves WHERE shelves.id = user_library.shelf_id)
+            )
+            WHERE {column} IS NULL
+              AND shelf_id IN (SELECT id FROM shelves WHERE name = :shelf)
+        """).bindparams(shelf=shelf))
+
+
+def downgrade():
+    with op.batch_alter_table('user_library', schema=None) as batch_op:
+        batch_op.drop_column('finished_at')
+        batch_op.drop_column('started_at')
+
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_index('ix_books_average_rating')
+        batch_op.drop_column('rating_5')
+        batch_op.drop_column('rating_4')
+        batch_op.drop_column('rating_3')
+        batch_op.drop_column('rating_2')
+        batch_op.drop_column('rating_1')
+        batch_op.drop_column('average_rating')
+        batch_op.drop_column('rating_count')
+        batch_op.drop_column('rating_sum')
+
+    op.drop_table('user_library_stats')
+    op.drop_table('reading_activity_monthly')
+    op.drop_table('reading_activity_daily')
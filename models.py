@@ -20,17 +20,41 @@ class Book(db.Model):
     __tablename__ = 'books'
 
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
-    author = db.Column(db.String(50), nullable=False)
+    title = db.Column(db.String(100), nullable=False, index=True)
+    author = db.Column(db.String(50), nullable=False, index=True)
     description = db.Column(db.Text)
     cover_url = db.Column(db.String(255)) 
     isbn = db.Column(db.String(20)) 
-    date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    date_added = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # każda zmiana wiersza, także liczników ocen - wersja strony książki dla ETag/Last-Modified
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     pages = db.Column(db.Integer, nullable=True)
 
+    # agregaty ocen, aktualizowane przez update_book_rating() w app.py
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    average_rating = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    rating_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     library_entries = db.relationship('UserLibrary', back_populates='book')
     book_reviews = db.relationship('Review', backref='review_book', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_books_average_rating', 'average_rating', 'rating_count'),
+    )
+
+    @property
+    def review_count(self):
+        return self.rating_count
+
+    @property
+    def rating_histogram(self):
+        return {i: getattr(self, f'rating_{i}') or 0 for i in range(1, 6)}
+
 
 class Review(db.Model):
     __tablename__ = 'reviews'
@@ -44,6 +68,7 @@ class Review(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'book_id', name='_user_book_uc'),
+        db.Index('ix_reviews_book_created', 'book_id', 'created_at'),
     )
 
 class UserLibrary(db.Model):
@@ -54,11 +79,21 @@ class UserLibrary(db.Model):
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'))
     shelf_id = db.Column(db.Integer, db.ForeignKey('shelves.id'))  
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
 
     book = db.relationship('Book', back_populates='library_entries')
     shelf = db.relationship('Shelf', back_populates='books')
     user = db.relationship('User', back_populates='library_books')
 
+    __table_args__ = (
+        db.Index('ix_user_library_user_shelf_added', 'user_id', 'shelf_id', 'added_at'),
+        db.Index('ix_user_library_user_added', 'user_id', 'added_at'),
+        db.Index('ix_user_library_user_book', 'user_id', 'book_id'),
+        db.Index('ix_user_library_book', 'book_id'),
+        db.Index('ix_user_library_shelf', 'shelf_id'),
+    )
+
 class Genre(db.Model):
     __tablename__ = 'genres'
     id = db.Column(db.Integer, primary_key=True)
@@ -83,12 +118,83 @@ class Shelf(db.Model):
     user = db.relationship('User', back_populates='shelves')
     books = db.relationship('UserLibrary', back_populates='shelf')
 
+    __table_args__ = (
+        db.Index('ix_shelves_user_name', 'user_id', 'name'),
+    )
+
 book_genres = db.Table('book_genres',
     db.Column('book_id', db.Integer, db.ForeignKey('books.id'), primary_key=True),
-    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True)
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+    db.Index('ix_book_genres_genre', 'genre_id', 'book_id')
 )
 
 book_tags = db.Table('book_tags',
     db.Column('book_id', db.Integer, db.ForeignKey('books.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True)
-)
\ No newline at end of file
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    db.Index('ix_book_tags_tag', 'tag_id', 'book_id')
+)
+
+class UserLibraryStats(db.Model):
+    """Liczba książek użytkownika na każdej półce (shelf_id=0 - bez półki).
+
+    Utrzymywana przyrostowo przez library_stats.py, suma wierszy
+    użytkownika daje rozmiar całej biblioteki.
+    """
+    __tablename__ = 'user_library_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    shelf_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    book_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ReadingActivityDaily(db.Model):
+    __tablename__ = 'reading_activity_daily'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    books_started = db.Column(db.Integer, nullable=False, default=0)
+    books_finished = db.Column(db.Integer, nullable=False, default=0)
+    pages_read = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ReadingActivityMonthly(db.Model):
+    __tablename__ = 'reading_activity_monthly'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # pierwszy dzień miesiąca
+    books_started = db.Column(db.Integer, nullable=False, default=0)
+    books_finished = db.Column(db.Integer, nullable=False, default=0)
+    pages_read = db.Column(db.Integer, nullable=False, default=0)
+
+
+class BookNeighbor(db.Model):
+    """Najbardziej podobne książki (item-item, kosinus po bibliotekach i ocenach).
+
+    Liczone przez recommendations.py; po book_id wystarcza klucz główny.
+    """
+    __tablename__ = 'book_neighbors'
+
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class DuplicateKey(db.Model):
+    """Klucze wykrywania duplikatów: znormalizowany ISBN i pasma MinHash tytułu z autorem.
+
+    Utrzymywane przez duplicates.py; książki o wspólnym kluczu to kandydaci
+    na duplikat, sprawdzani potem dokładnie.
+    """
+    __tablename__ = 'book_duplicate_keys'
+
+    key = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True, index=True)
+
+
+class FacetVersion(db.Model):
+    """Wersja indeksu fasetek (facets.py) - jeden wiersz wspólny dla wszystkich procesów."""
+    __tablename__ = 'facet_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.String(32), nullable=False)
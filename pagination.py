@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import datetime
+from extensions import db
+
+
+def apply_order(query, order):
+    """order: lista par (kolumna, malejąco)"""
+    return query.order_by(*[column.desc() if descending else column.asc()
+                            for column, descending in order])
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': [_encode_value(v) for v in values], 'd': direction},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Zwraca (wartości, kierunek) albo (None, 'next') dla pustego/uszkodzonego tokenu."""
+    if not token:
+        return None, 'next'
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        direction = 'prev' if payload.get('d') == 'prev' else 'next'
+        return [_decode_value(v) for v in payload['v']], direction
+    except (ValueError, KeyError, TypeError):
+        return None, 'next'
+
+
+def _matches_column(column, value):
+    # kursor przychodzi od klienta - do zapytania trafiają tylko wartości typu kolumny
+    if value is None:
+        return True
+    if isinstance(value, (dict, list, bool)):
+        return False
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return True
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def _seek_condition(order, values, reverse):
+    # (a, b, c) > (x, y, z) rozpisane tak, by działało przy mieszanych kierunkach
+    conditions = []
+    for i, (column, descending) in enumerate(order):
+        after = descending == reverse
+        comparison = column > values[i] if after else column < values[i]
+        equal_prefix = [order[j][0] == values[j] for j in range(i)]
+        conditions.append(db.and_(*equal_prefix, comparison))
+    return db.or_(*conditions)
+
+
+class KeysetPagination:
+    """Paginacja po kursorze - koszt strony nie zależy od jej numeru.
+
+    `order` musi kończyć się kolumną unikalną (np. id), żeby kolejność
+    była jednoznaczna. Liczba wszystkich wyników (`total`) liczona jest
+    dopiero przy pierwszym odczycie. Kursor o złej długości albo z wartościami
+    innego typu niż kolumny jest traktowany jak uszkodzony - pierwsza strona.
+    """
+    is_keyset = True
+
+    def __init__(self, query, order, cursor=None, per_page=12, max_per_page=100):
+        # LIMIT -1 w SQLite to brak limitu - przycinane tak jak w paginate()
+        self.per_page = per_page = min(max(per_page, 1), max_per_page)
+        self._query = query
+        values, direction = decode_cursor(cursor)
+        if values is not None and (len(values) != len(order) or not all(
+                _matches_column(column, value) for (column, _), value in zip(order, values))):
+            values, direction = None, 'next'
+        self.cursor = cursor if values is not None else None
+
+        entity_count = len(query.column_descriptions)
+        reverse = direction == 'prev'
+        keyed = query.add_columns(*[column.label(f'_k{i}') for i, (column, _) in enumerate(order)])
+        if values is not None:
+            keyed = keyed.filter(_seek_condition(order, values, reverse))
+        keyed = apply_order(keyed, [(column, descending != reverse) for column, descending in order])
+        rows = keyed.limit(per_page + 1).all()
+
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if reverse:
+            rows.reverse()
+
+        self.items = [row[0] if entity_count == 1 else tuple(row[:entity_count]) for row in rows]
+        keys = [tuple(row[entity_count:]) for row in rows]
+
+        if reverse:
+            self.has_prev, self.has_next = has_more, True
+        else:
+            self.has_prev, self.has_next = values is not None, has_more
+
+        self.prev_cursor = encode_cursor(keys[0], 'prev') if self.has_prev and keys else None
+        self.next_cursor = encode_cursor(keys[-1], 'next') if self.has_next and keys else None
+        self._total = None
+
+    @property
+    def total(self):
+        if self._total is None:
+            self._total = self._query.order_by(None).count()
+        return self._total
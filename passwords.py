@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+# Procesy startują metodą spawn, więc skrypt uruchamiany bezpośrednio (python skrypt.py),
+# który haszuje hasła, potrzebuje `if __name__ == '__main__':` - flask i gunicorn to zapewniają.
+
+# stan puli jest per proces - po forku serwera (gunicorn) każdy worker tworzy własną
+_pool = None
+_pool_pid = None
+_slots = None
+_lock = threading.Lock()
+_config = {'rounds': 12, 'workers': 2, 'queue': 8, 'timeout': 10}
+
+
+class Overloaded(Exception):
+    """Kolejka haszowania pełna dłużej niż AUTH_HASH_TIMEOUT."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password, hashed):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def init_app(app):
+    app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+    app.config.setdefault('AUTH_HASH_WORKERS', 2)
+    app.config.setdefault('AUTH_HASH_QUEUE', 8)
+    app.config.setdefault('AUTH_HASH_TIMEOUT', 10)
+    _config.update(
+        rounds=app.config['BCRYPT_LOG_ROUNDS'],
+        workers=app.config['AUTH_HASH_WORKERS'],
+        queue=app.config['AUTH_HASH_QUEUE'],
+        timeout=app.config['AUTH_HASH_TIMEOUT']
+    )
+
+
+def _executor():
+    global _pool, _pool_pid, _slots
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: procesy potrzebują tylko bcrypt, nie dziedziczą połączeń z bazą ani wątków
+            _pool = ProcessPoolExecutor(max_workers=_config['workers'],
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(_config['workers'] + _config['queue'])
+        return _pool, _slots
+
+
+def _run(function, *args):
+    """bcrypt w puli procesów - wątek żądania tylko czeka, nie zajmuje CPU."""
+    if not _config['workers']:
+        return function(*args)
+    pool, slots = _executor()
+    if not slots.acquire(timeout=_config['timeout']):
+        raise Overloaded()
+    try:
+        return pool.submit(function, *args).result()
+    except BrokenProcessPool:
+        shutdown()
+        return function(*args)
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    return _run(_hash, password, _config['rounds'])
+
+
+def check_password(hashed, password):
+    if not hashed:
+        return False
+    try:
+        return _run(_verify, password, hashed)
+    except ValueError:
+        return False
+
+
+def needs_rehash(hashed):
+    """Hash z innym współczynnikiem pracy niż BCRYPT_LOG_ROUNDS ($2b$12$...)."""
+    try:
+        return int(hashed.split('$')[2]) != _config['rounds']
+    except (IndexError, ValueError):
+        return True
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
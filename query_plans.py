@@ -0,0 +1,134 @@
+import re
+from sqlalchemy import event
+from extensions import db
+from models import Book, Genre, Tag, UserLibrary
+import facets
+
+# tabele, których pełny skan przy dużym katalogu jest regresją
+WATCHED_TABLES = {
+    'books', 'reviews', 'user_library', 'shelves', 'book_genres', 'book_tags',
+    'user_library_stats', 'reading_activity_daily', 'reading_activity_monthly', 'book_neighbors'
+}
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def routes(user_id=None, book_id=None, shelf_id=None, genre_id=None, tag_id=None):
+    """Trasy do sprawdzenia, w postaci (nazwa, zalogowany, url) - tylko GET, bez zmian w bazie."""
+    from app import BOOK_SORT_ORDERS, LIBRARY_SORT_ORDERS
+
+    cases = [('home (anonim)', False, '/')]
+    cases += [(f'book_list: {sort_by}', False, f'/books?sort_by={sort_by}') for sort_by in BOOK_SORT_ORDERS]
+    if genre_id:
+        cases.append(('book_list: genre', False, f'/books?genre={genre_id}'))
+        if tag_id:
+            cases.append(('book_list: genre + tag', False, f'/books?genre={genre_id}&tag={tag_id}'))
+    if user_id is None:
+        return cases
+
+    cases.append(('home', True, '/'))
+    if book_id:
+        cases.append(('book_details', True, f'/book/{book_id}'))
+    cases += [(f'my_library: {sort_by}', True, f'/my_library?sort_by={sort_by}') for sort_by in LIBRARY_SORT_ORDERS]
+    cases += [('my_shelves', True, '/my_shelves'), ('profile', True, '/profile')]
+    if shelf_id:
+        cases += [('my_library: shelf', True, f'/my_library?shelf={shelf_id}'),
+                  ('shelf_books', True, f'/shelf/{shelf_id}')]
+    return cases
+
+
+def _sample_ids():
+    """Użytkownik z największą biblioteką, jego największa półka i przykładowe książka, gatunek, tag."""
+    user_id = db.session.query(UserLibrary.user_id).group_by(UserLibrary.user_id)\
+        .order_by(db.func.count().desc()).limit(1).scalar()
+    shelf_id = user_id and db.session.query(UserLibrary.shelf_id).filter(UserLibrary.user_id == user_id)\
+        .group_by(UserLibrary.shelf_id).order_by(db.func.count().desc()).limit(1).scalar()
+    return {
+        'user_id': user_id,
+        'book_id': db.session.query(db.func.min(Book.id)).scalar(),
+        'shelf_id': shelf_id,
+        'genre_id': db.session.query(db.func.min(Genre.id)).scalar(),
+        'tag_id': db.session.query(db.func.min(Tag.id)).scalar(),
+    }
+
+
+def hot_queries():
+    """Zapytania SELECT wykonane naprawdę przez trasy: (nazwa, SQL, parametry).
+
+    Trasy idą przez klienta testowego, a zapytania są zbierane z
+    before_cursor_execute - razem z parametrami, z którymi je wykonano.
+    To samo zapytanie z kilku tras jest zwracane raz.
+    """
+    from flask import current_app
+    from extensions import cache
+
+    app = current_app._get_current_object()
+    ids = _sample_ids()
+    cases = routes(**ids)
+    # indeks fasetek wczytuje się raz na proces - jego pełne odczyty to nie zapytania tras
+    facets.index.load()
+    db.session.rollback()
+
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            captured.append((statement, parameters))
+
+    client = app.test_client()
+    if ids['user_id']:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(ids['user_id'])
+    seen = set()
+    queries = []
+    for name, logged_in, url in cases:
+        cache.clear()
+        del captured[:]
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            # osobny kontekst aplikacji: inaczej g (i zalogowany użytkownik) przechodzi między żądaniami
+            with app.app_context():
+                response = (client if logged_in else app.test_client()).get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        if response.status_code != 200:
+            raise RuntimeError(f'{name} ({url}): HTTP {response.status_code}')
+        for number, (statement, parameters) in enumerate(captured, 1):
+            if statement not in seen:
+                seen.add(statement)
+                queries.append((f'{name} #{number}', statement, parameters))
+    return queries
+
+
+def explain(statement, parameters=()):
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        return [row[-1] for row in rows]
+    # przy małych tabelach PostgreSQL i tak wybrałby Seq Scan - wymuszamy
+    # indeksy, więc Seq Scan zostaje tylko tam, gdzie indeksu brak
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    return [row[0] for row in connection.exec_driver_sql(f'EXPLAIN {statement}', parameters).all()]
+
+
+def full_scans(plan):
+    tables = []
+    for line in plan:
+        line = line.strip()
+        match = SQLITE_FULL_SCAN.match(line)
+        if match and match.group(1) in WATCHED_TABLES:
+            tables.append(match.group(1))
+        seq_scan = re.search(r'Seq Scan on (\w+)', line)
+        if seq_scan and seq_scan.group(1) in WATCHED_TABLES:
+            tables.append(seq_scan.group(1))
+    return tables
+
+
+def check():
+    """Zwraca listę (nazwa, SQL, pełne skany, plan) dla zapytań, które przestały używać indeksów."""
+    problems = []
+    for name, statement, parameters in hot_queries():
+        plan = explain(statement, parameters)
+        scans = full_scans(plan)
+        if scans:
+            problems.append((name, statement, scans, plan))
+    return problems
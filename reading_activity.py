@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from extensions import db
+from models import Book, UserLibrary, ReadingActivityDaily, ReadingActivityMonthly
+
+READING_SHELF = 'W trakcie czytania'
+FINISHED_SHELF = 'Przeczytane'
+
+
+def _status(shelf):
+    if shelf is None:
+        return None
+    return {READING_SHELF: 'reading', FINISHED_SHELF: 'finished'}.get(shelf.name)
+
+
+def _pages(entry):
+    book = entry.book or db.session.get(Book, entry.book_id)
+    return (book.pages or 0) if book else 0
+
+
+def _bump(model, user_id, key_column, key, started=0, finished=0, pages=0):
+    updated = model.query.filter(model.user_id == user_id, key_column == key).update({
+        model.books_started: model.books_started + started,
+        model.books_finished: model.books_finished + finished,
+        model.pages_read: model.pages_read + pages
+    }, synchronize_session=False)
+    if not updated:
+        db.session.add(model(**{
+            'user_id': user_id,
+            key_column.key: key,
+            'books_started': started,
+            'books_finished': finished,
+            'pages_read': pages
+        }))
+        db.session.flush()
+
+
+def record(user_id, when, started=0, finished=0, pages=0):
+    """Dopisuje zdarzenie do dziennego i miesięcznego podsumowania."""
+    day = when.date()
+    _bump(ReadingActivityDaily, user_id, ReadingActivityDaily.day, day, started, finished, pages)
+    _bump(ReadingActivityMonthly, user_id, ReadingActivityMonthly.month, day.replace(day=1),
+          started, finished, pages)
+
+
+def tracks(shelf):
+    return _status(shelf) is not None
+
+
+def transition(old_shelf, new_shelf, started_at, finished_at, now):
+    """Skutek przeniesienia wpisu: (started_at, finished_at, zdarzenia).
+
+    Zdarzenie to (kiedy, rozpoczęte, skończone); strony liczy wywołujący.
+    """
+    old_status = _status(old_shelf)
+    new_status = _status(new_shelf)
+    events = []
+    if old_status == new_status:
+        return started_at, finished_at, events
+
+    if old_status == 'finished' and finished_at:
+        events.append((finished_at, 0, -1))
+        finished_at = None
+    if new_status == 'reading' and not started_at:
+        started_at = now
+        events.append((now, 1, 0))
+    if new_status == 'finished':
+        finished_at = now
+        events.append((now, 0, 1))
+    return started_at, finished_at, events
+
+
+def on_shelf_change(entry, new_shelf):
+    """Wywoływane przed przeniesieniem wpisu na new_shelf (None = bez półki)."""
+    entry.started_at, entry.finished_at, events = transition(
+        entry.shelf if entry.shelf_id else None, new_shelf,
+        entry.started_at, entry.finished_at, datetime.utcnow()
+    )
+    for when, started, finished in events:
+        record(entry.user_id, when, started=started, finished=finished,
+               pages=finished * _pages(entry) if finished else 0)
+
+
+def record_many(user_id, events):
+    """Jak record(), ale dla wielu zdarzeń (kiedy, rozpoczęte, skończone, strony) - jeden zapis na dzień."""
+    days = {}
+    for when, started, finished, pages in events:
+        row = days.setdefault(when.date(), [0, 0, 0])
+        row[0] += started
+        row[1] += finished
+        row[2] += pages
+    for day, (started, finished, pages) in days.items():
+        if started or finished or pages:
+            record(user_id, datetime.combine(day, datetime.min.time()), started, finished, pages)
+
+
+def on_remove(entry):
+    """Wycofuje zdarzenia wpisu usuwanego z biblioteki."""
+    if entry.started_at:
+        record(entry.user_id, entry.started_at, started=-1)
+    if entry.finished_at:
+        record(entry.user_id, entry.finished_at, finished=-1, pages=-_pages(entry))
+
+
+def summary(user_id, now=None):
+    now = now or datetime.utcnow()
+    today = now.date()
+    this_month = today.replace(day=1)
+    year_ago_month = (this_month - timedelta(days=335)).replace(day=1)
+
+    monthly = db.session.query(
+        ReadingActivityMonthly.month,
+        ReadingActivityMonthly.books_finished,
+        ReadingActivityMonthly.pages_read
+    ).filter(ReadingActivityMonthly.user_id == user_id).all()
+
+    last_30_days_pages = db.session.query(
+        db.func.coalesce(db.func.sum(ReadingActivityDaily.pages_read), 0)
+    ).filter(
+        ReadingActivityDaily.user_id == user_id,
+        ReadingActivityDaily.day > today - timedelta(days=30)
+    ).scalar()
+
+    return {
+        'pages_total': sum(pages for _, _, pages in monthly),
+        'pages_last_month': last_30_days_pages,
+        'pages_last_year': sum(pages for month, _, pages in monthly if month >= year_ago_month),
+        'finished_this_year': sum(finished for month, finished, _ in monthly if month.year == today.year),
+        'finished_this_month': sum(finished for month, finished, _ in monthly if month == this_month)
+    }
+
+
+def rebuild():
+    """Odtwarza podsumowania z dat started_at/finished_at w bibliotekach."""
+    ReadingActivityDaily.query.delete(synchronize_session=False)
+    ReadingActivityMonthly.query.delete(synchronize_session=False)
+
+    daily = {}
+    entries = db.session.query(
+        UserLibrary.user_id, UserLibrary.started_at, UserLibrary.finished_at, Book.pages
+    ).join(Book, UserLibrary.book_id == Book.id).filter(
+        db.or_(UserLibrary.started_at.isnot(None), UserLibrary.finished_at.isnot(None))
+    )
+    for user_id, started_at, finished_at, pages in entries:
+        if started_at:
+            row = daily.setdefault((user_id, started_at.date()), [0, 0, 0])
+            row[0] += 1
+        if finished_at:
+            row = daily.setdefault((user_id, finished_at.date()), [0, 0, 0])
+            row[1] += 1
+            row[2] += pages or 0
+
+    monthly = {}
+    for (user_id, day), (started, finished, pages) in daily.items():
+        row = monthly.setdefault((user_id, day.replace(day=1)), [0, 0, 0])
+        row[0] += started
+        row[1] += finished
+        row[2] += pages
+
+    def rows(data, key_name):
+        return [{'user_id': user_id, key_name: key, 'books_started': started,
+                 'books_finished': finished, 'pages_read': pages}
+                for (user_id, key), (started, finished, pages) in data.items()]
+
+    if daily:
+        db.session.execute(db.insert(ReadingActivityDaily), rows(daily, 'day'))
+        db.session.execute(db.insert(ReadingActivityMonthly), rows(monthly, 'month'))
+    db.session.commit()
+    return len(daily)
@@ -0,0 +1,106 @@
+import heapq
+import math
+from collections import defaultdict
+from datetime import datetime
+from extensions import db
+from models import BookNeighbor, Review, UserLibrary
+
+LIBRARY_WEIGHT = 1.0
+RATING_WEIGHT = 0.5  # ocena 5 -> 2.0, ocena 1 -> bliżej zera
+MIN_WEIGHT = 0.1
+SHRINKAGE = 3  # tłumi podobieństwo opierające się na jednym-dwóch czytelnikach
+# użytkownicy z ogromnymi bibliotekami wnoszą kwadratowo dużo par i mało informacji
+MAX_USER_ITEMS = 500
+CHUNK = 500
+
+
+def _load_interactions():
+    """Macierz rzadka użytkownik x książka: obecność w bibliotece plus ocena."""
+    weights = defaultdict(dict)
+    for user_id, book_id in db.session.query(UserLibrary.user_id, UserLibrary.book_id):
+        weights[user_id][book_id] = LIBRARY_WEIGHT
+    for user_id, book_id, rating in db.session.query(Review.user_id, Review.book_id, Review.rating):
+        weights[user_id][book_id] = max(LIBRARY_WEIGHT + (rating - 3) * RATING_WEIGHT, MIN_WEIGHT)
+
+    user_items = {user_id: items for user_id, items in weights.items() if len(items) <= MAX_USER_ITEMS}
+    item_users = defaultdict(dict)
+    for user_id, items in user_items.items():
+        for book_id, weight in items.items():
+            item_users[book_id][user_id] = weight
+    norms = {book_id: math.sqrt(sum(w * w for w in users.values())) for book_id, users in item_users.items()}
+    return user_items, item_users, norms
+
+
+def _neighbors(book_id, user_items, item_users, norms, k):
+    dots = defaultdict(float)
+    common = defaultdict(int)
+    for user_id, weight in item_users[book_id].items():
+        for other_id, other_weight in user_items[user_id].items():
+            if other_id != book_id:
+                dots[other_id] += weight * other_weight
+                common[other_id] += 1
+    norm = norms[book_id]
+    scores = ((other_id, dot / (norm * norms[other_id]) * common[other_id] / (common[other_id] + SHRINKAGE))
+              for other_id, dot in dots.items())
+    return heapq.nlargest(k, scores, key=lambda item: item[1])
+
+
+def _store(book_ids, user_items, item_users, norms, k, computed_at):
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), CHUNK):
+        chunk = book_ids[start:start + CHUNK]
+        BookNeighbor.query.filter(BookNeighbor.book_id.in_(chunk)).delete(synchronize_session=False)
+        rows = [{'book_id': book_id, 'neighbor_id': neighbor_id, 'score': score, 'computed_at': computed_at}
+                for book_id in chunk if book_id in item_users
+                for neighbor_id, score in _neighbors(book_id, user_items, item_users, norms, k)]
+        if rows:
+            db.session.execute(db.insert(BookNeighbor), rows)
+    db.session.commit()
+
+
+def rebuild(k=20):
+    computed_at = datetime.utcnow()
+    user_items, item_users, norms = _load_interactions()
+    BookNeighbor.query.delete(synchronize_session=False)
+    _store(item_users, user_items, item_users, norms, k, computed_at)
+    return len(item_users)
+
+
+def refresh(k=20):
+    """Przelicza sąsiadów książek, których dotyczą nowe wpisy i recenzje.
+
+    Zmiana wektora książki zmienia jej podobieństwo do wszystkich książek
+    czytanych przez tych samych użytkowników, więc przeliczane są też one.
+    Usunięcia i edycje ocen nie zostawiają śladu w czasie - wyrównuje je
+    okresowy rebuild().
+    """
+    since = db.session.query(db.func.max(BookNeighbor.computed_at)).scalar()
+    if since is None:
+        return rebuild(k)
+
+    computed_at = datetime.utcnow()
+    changed = {book_id for book_id, in db.session.query(UserLibrary.book_id).filter(UserLibrary.added_at > since)}
+    changed |= {book_id for book_id, in db.session.query(Review.book_id).filter(Review.created_at > since)}
+    if not changed:
+        return 0
+
+    user_items, item_users, norms = _load_interactions()
+    affected = set(changed)
+    for book_id in changed:
+        for user_id in item_users.get(book_id, ()):
+            affected.update(user_items[user_id])
+    _store(affected, user_items, item_users, norms, k, computed_at)
+    return len(affected)
+
+
+def for_user(user_id, limit=5):
+    """Id polecanych książek: suma podobieństw do książek z biblioteki użytkownika."""
+    owned = db.session.query(UserLibrary.book_id).filter(UserLibrary.user_id == user_id)
+    rows = db.session.query(BookNeighbor.neighbor_id)\
+        .join(UserLibrary, UserLibrary.book_id == BookNeighbor.book_id)\
+        .filter(UserLibrary.user_id == user_id, BookNeighbor.neighbor_id.not_in(owned))\
+        .group_by(BookNeighbor.neighbor_id)\
+        .order_by(db.func.sum(BookNeighbor.score).desc(), BookNeighbor.neighbor_id)\
+        .limit(limit)
+    return [book_id for book_id, in rows]
+
@@ -0,0 +1,188 @@
+import re
+import unicodedata
+from extensions import db
+
+# znaki bez rozkładu w Unicode - samo NFKD ich nie sprowadzi do liter ASCII
+POLISH_FOLD = str.maketrans({'ł': 'l', 'Ł': 'l'})
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(text):
+    if not text:
+        return ''
+    text = text.translate(POLISH_FOLD).lower()
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text))
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _book_document(book):
+    return {
+        'title': book.title,
+        'author': book.author,
+        'description': book.description,
+        'tags': ' '.join(t.name for t in book.tags),
+        'genres': ' '.join(g.name for g in book.genres)
+    }
+
+
+def ensure_search_index():
+    """Tworzy indeks, jeśli go brakuje, i wypełnia go istniejącymi książkami."""
+    dialect = _dialect()
+    if dialect not in ('sqlite', 'postgresql'):
+        return
+    table = 'books_fts' if dialect == 'sqlite' else 'books_search'
+    created = not db.inspect(db.engine).has_table(table)
+
+    if dialect == 'sqlite':
+        db.session.execute(db.text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+            "title, author, description, tags, genres, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+    elif dialect == 'postgresql':
+        db.session.execute(db.text(
+            "CREATE TABLE IF NOT EXISTS books_search ("
+            "book_id INTEGER PRIMARY KEY REFERENCES books(id) ON DELETE CASCADE, "
+            "document TSVECTOR NOT NULL)"
+        ))
+        db.session.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS ix_books_search_document "
+            "ON books_search USING GIN (document)"
+        ))
+    db.session.commit()
+
+    if created:
+        rebuild_index()
+
+
+def index_book(book):
+    """Odświeża wpis książki w indeksie. Wymaga nadanego book.id (flush)."""
+    index_values(book.id, **_book_document(book))
+
+
+def index_values(book_id, title, author, description='', tags='', genres=''):
+    index_many([{
+        'id': book_id,
+        'title': title,
+        'author': author,
+        'description': description,
+        'tags': tags,
+        'genres': genres
+    }])
+
+
+def index_many(documents):
+    """documents: słowniki z kluczami id, title, author, description, tags, genres"""
+    params = [{
+        'id': document['id'],
+        'title': fold(document['title']),
+        'author': fold(document['author']),
+        'description': fold(document.get('description')),
+        'tags': fold(document.get('tags')),
+        'genres': fold(document.get('genres'))
+    } for document in documents]
+    if not params:
+        return
+
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        db.session.execute(db.text("DELETE FROM books_fts WHERE rowid = :id"),
+                           [{'id': p['id']} for p in params])
+        db.session.execute(db.text(
+            "INSERT INTO books_fts (rowid, title, author, description, tags, genres) "
+            "VALUES (:id, :title, :author, :description, :tags, :genres)"
+        ), params)
+    elif dialect == 'postgresql':
+        db.session.execute(db.text(
+            "INSERT INTO books_search (book_id, document) VALUES (:id, "
+            "setweight(to_tsvector('simple', :title), 'A') || "
+            "setweight(to_tsvector('simple', :author), 'A') || "
+            "setweight(to_tsvector('simple', :tags), 'B') || "
+            "setweight(to_tsvector('simple', :genres), 'B') || "
+            "setweight(to_tsvector('simple', :description), 'C')) "
+            "ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+
+
+def remove_book(book_id):
+    remove_books([book_id])
+
+
+def remove_books(book_ids):
+    params = [{'id': book_id} for book_id in book_ids]
+    if not params:
+        return
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        db.session.execute(db.text("DELETE FROM books_fts WHERE rowid = :id"), params)
+    elif dialect == 'postgresql':
+        db.session.execute(db.text("DELETE FROM books_search WHERE book_id = :id"), params)
+
+
+def rebuild_index(batch_size=500):
+    from models import Book
+
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        db.session.execute(db.text("DELETE FROM books_fts"))
+    elif dialect == 'postgresql':
+        db.session.execute(db.text("DELETE FROM books_search"))
+
+    indexed = 0
+    query = Book.query.options(
+        db.selectinload(Book.tags),
+        db.selectinload(Book.genres)
+    ).order_by(Book.id)
+    for book in query.yield_per(batch_size):
+        index_book(book)
+        indexed += 1
+    db.session.commit()
+    return indexed
+
+
+def match_subquery(search_query):
+    """Zwraca podzapytanie (book_id, rank) - niższy rank oznacza lepsze dopasowanie.
+
+    Dla baz bez indeksu pełnotekstowego zwraca None, a wywołujący
+    powinien użyć ilike_filter().
+    """
+    tokens = tokenize(search_query)
+    if not tokens:
+        return None
+
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        statement = db.text(
+            "SELECT rowid AS book_id, "
+            "bm25(books_fts, 10.0, 8.0, 1.0, 4.0, 4.0) AS rank "
+            "FROM books_fts WHERE books_fts MATCH :match"
+        ).bindparams(match=match)
+    elif dialect == 'postgresql':
+        match = ' & '.join(f'{token}:*' for token in tokens)
+        statement = db.text(
+            "SELECT book_id, -ts_rank(document, to_tsquery('simple', :match)) AS rank "
+            "FROM books_search WHERE document @@ to_tsquery('simple', :match)"
+        ).bindparams(match=match)
+    else:
+        return None
+
+    return statement.columns(
+        db.column('book_id', db.Integer),
+        db.column('rank', db.Float)
+    ).subquery('search_match')
+
+
+def ilike_filter(model, search_query):
+    return db.or_(
+        model.title.ilike(f'%{search_query}%'),
+        model.author.ilike(f'%{search_query}%')
+    )
@@ -0,0 +1,82 @@
+import multiprocessing
+import time
+from extensions import db
+import facets
+
+
+def default_workers():
+    # workery sync czekają na bazę, więc więcej procesów niż rdzeni
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def gunicorn_options(config):
+    """Ustawienia gunicorna z konfiguracji aplikacji - wspólne dla flask serve i gunicorn.conf.py."""
+    options = {
+        'bind': config['SERVER_BIND'],
+        'workers': config['SERVER_WORKERS'] or default_workers(),
+        'threads': config['SERVER_THREADS'],
+        'timeout': config['SERVER_TIMEOUT'],
+        'graceful_timeout': config['SERVER_GRACEFUL_TIMEOUT'],
+        'keepalive': config['SERVER_KEEPALIVE'],
+        'max_requests': config['SERVER_MAX_REQUESTS'],
+        'max_requests_jitter': config['SERVER_MAX_REQUESTS'] // 10,
+        # aplikacja jest już zaimportowana w procesie głównym (flask serve, gunicorn.conf.py)
+        'preload_app': True,
+        'accesslog': config['SERVER_ACCESS_LOG'],
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+    }
+    if config['SERVER_PIDFILE']:
+        options['pidfile'] = config['SERVER_PIDFILE']
+    return options
+
+
+def warm_up(app):
+    """Przed forkiem: szablony, indeks fasetek i pierwsze żądania w procesie głównym.
+
+    Workery dostają to wszystko jako współdzielone strony pamięci (copy-on-write)
+    zamiast budować od nowa. Połączenia z bazą są na koniec zamykane - każdy
+    worker otwiera własną pulę.
+    """
+    start = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.app_context():
+        facets.index.load()
+    client = app.test_client()
+    for url in app.config['SERVER_WARMUP_URLS']:
+        response = client.get(url)
+        if response.status_code != 200:
+            app.logger.warning(f'Rozgrzewka {url}: HTTP {response.status_code}')
+    with app.app_context():
+        db.engine.dispose()
+    return time.perf_counter() - start
+
+
+def when_ready(arbiter):
+    # proces główny, gniazdo już nasłuchuje, workerów jeszcze nie ma
+    from app import app
+    elapsed = warm_up(app)
+    arbiter.log.info(f'Aplikacja rozgrzana w {elapsed * 1000:.0f} ms')
+
+
+def post_fork(arbiter, worker):
+    from app import app
+    with app.app_context():
+        # close=False: połączenia procesu głównego zostają nietknięte, worker zaczyna z pustą pulą
+        db.engine.dispose(close=False)
+
+
+def run(app, **options):
+    """Prefork gunicorna w bieżącym procesie; kończy się po SIGTERM/SIGINT."""
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
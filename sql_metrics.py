@@ -0,0 +1,206 @@
+import re
+import threading
+import time
+from collections import Counter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# progi histogramu liczby zapytań na żądanie
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|:\w+|\$\d+)\s*,?)+\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(statement):
+    """Wzorzec zapytania: parametry są już placeholderami, zwijamy jeszcze listy IN."""
+    statement = WHITESPACE.sub(' ', statement).strip()
+    return IN_LIST.sub('IN (...)', statement)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.patterns = Counter()
+
+    def suspects(self, threshold):
+        """Te same SELECT-y powtórzone w jednym żądaniu - typowy ślad leniwego ładowania N+1."""
+        return {pattern: count for pattern, count in self.patterns.items()
+                if count >= threshold and pattern.upper().startswith('SELECT')}
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.duration = 0.0
+        self.buckets = [0] * len(QUERY_BUCKETS)
+        self.n_plus_one = 0
+        self.suspects = {}
+
+
+class SQLMetrics:
+    """Liczniki zapytań SQL na żądanie i na endpoint (zdarzenia silnika SQLAlchemy).
+
+    Żądanie, w którym ten sam SELECT powtarza się co najmniej
+    SQL_N_PLUS_ONE_THRESHOLD razy, jest oznaczane jako podejrzenie N+1
+    i logowane razem ze wzorcem zapytania.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 5
+        self.server_timing = False
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_METRICS_ENABLED', True)
+        app.config.setdefault('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('SQL_SERVER_TIMING', False)
+
+        self.enabled = app.config['SQL_METRICS_ENABLED']
+        self.threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+        self.server_timing = app.config['SQL_SERVER_TIMING']
+        if not self.enabled:
+            return
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.sql_stats = RequestStats()
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        duration = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unknown'
+        suspects = stats.suspects(self.threshold)
+
+        with self._lock:
+            totals = self.endpoints.setdefault(endpoint, EndpointStats())
+            totals.requests += 1
+            totals.queries += stats.queries
+            totals.db_time += stats.db_time
+            totals.duration += duration
+            for i, bound in enumerate(QUERY_BUCKETS):
+                if stats.queries <= bound:
+                    totals.buckets[i] += 1
+            if suspects:
+                totals.n_plus_one += 1
+                for pattern, count in suspects.items():
+                    totals.suspects[pattern] = max(count, totals.suspects.get(pattern, 0))
+
+        for pattern, count in suspects.items():
+            current_app.logger.warning(f'Possible N+1 in {endpoint}: {count}x {pattern[:200]}')
+
+        if self.server_timing:
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                f'app;dur={duration * 1000:.1f}'
+            )
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': totals.requests,
+                    'queries': totals.queries,
+                    'queries_per_request': totals.queries / totals.requests,
+                    'db_time': totals.db_time,
+                    'duration': totals.duration,
+                    'n_plus_one_requests': totals.n_plus_one,
+                    'suspects': sorted(totals.suspects.items(), key=lambda item: -item[1])
+                }
+                for endpoint, totals in self.endpoints.items()
+            }
+
+    def render_prometheus(self, extra=None):
+        """Format tekstowy Prometheusa (exposition format 0.0.4)."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {value}')
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            metric('czytelnia_http_requests_total', 'counter', 'Requests handled per endpoint.',
+                   [((('endpoint', e),), t.requests) for e, t in endpoints])
+            metric('czytelnia_http_request_duration_seconds_total', 'counter',
+                   'Time spent handling requests per endpoint.',
+                   [((('endpoint', e),), f'{t.duration:.6f}') for e, t in endpoints])
+            metric('czytelnia_sql_queries_total', 'counter', 'SQL statements executed per endpoint.',
+                   [((('endpoint', e),), t.queries) for e, t in endpoints])
+            metric('czytelnia_sql_duration_seconds_total', 'counter',
+                   'Time spent in SQL statements per endpoint.',
+                   [((('endpoint', e),), f'{t.db_time:.6f}') for e, t in endpoints])
+            metric('czytelnia_sql_n_plus_one_requests_total', 'counter',
+                   'Requests that repeated the same SELECT at least the N+1 threshold times.',
+                   [((('endpoint', e),), t.n_plus_one) for e, t in endpoints])
+
+            samples = []
+            for e, t in endpoints:
+                for bound, count in zip(QUERY_BUCKETS, t.buckets):
+                    samples.append(((('endpoint', e), ('le', str(bound))), count))
+                samples.append(((('endpoint', e), ('le', '+Inf')), t.requests))
+            lines.append('# HELP czytelnia_sql_queries_per_request SQL statements per request.')
+            lines.append('# TYPE czytelnia_sql_queries_per_request histogram')
+            for labels, value in samples:
+                lines.append(f'czytelnia_sql_queries_per_request_bucket{_labels(labels)} {value}')
+            for e, t in endpoints:
+                lines.append(f'czytelnia_sql_queries_per_request_sum{_labels([("endpoint", e)])} {t.queries}')
+                lines.append(f'czytelnia_sql_queries_per_request_count{_labels([("endpoint", e)])} {t.requests}')
+
+        for name, kind, help_text, value in extra or []:
+            metric(name, kind, help_text, [((), value)])
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f'{{{text}}}' if text else ''
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_stats' in g:
+        conn.info.setdefault('sql_metrics_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not (has_request_context() and 'sql_stats' in g):
+        return
+    starts = conn.info.get('sql_metrics_start')
+    if not starts:
+        return
+    stats = g.sql_stats
+    stats.db_time += time.perf_counter() - starts.pop()
+    stats.queries += 1
+    stats.patterns[normalize(statement)] += 1
+
+
+def _handle_error(context):
+    starts = context.connection.info.get('sql_metrics_start') if context.connection else None
+    if starts:
+        starts.pop()
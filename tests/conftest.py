@@ -0,0 +1,50 @@
+"""Wspólne fikstury: aplikacja na tymczasowej bazie SQLite i katalogu okładek.
+
+app.py czyta DATABASE_URL przy imporcie, więc zmienna jest ustawiana tutaj,
+zanim którykolwiek test zaimportuje aplikację - śledzona baza w instance/
+zostaje nietknięta.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEMP_DIR = tempfile.mkdtemp(prefix='czytelnia-tests-')
+DB_PATH = os.path.join(TEMP_DIR, 'czytelnia.db')
+UPLOAD_FOLDER = os.path.join(TEMP_DIR, 'covers')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, UPLOAD_FOLDER=UPLOAD_FOLDER)
+    return app
+
+
+@pytest.fixture(scope='module')
+def database(app):
+    """Pusta baza i katalog okładek dla każdego modułu testów; zwraca db."""
+    from app import init_database
+    from extensions import db, cache
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
+        shutil.rmtree(UPLOAD_FOLDER, ignore_errors=True)
+        os.makedirs(UPLOAD_FOLDER)
+        init_database()
+        cache.clear()
+    return db
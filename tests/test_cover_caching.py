@@ -0,0 +1,121 @@
+"""Okładki nie mogą wracać do Flaska przy ponownym wejściu na stronę.
+
+Klient testowy udaje przeglądarkę z cache'em HTTP: każda strona jest ładowana
+drugi raz z walidatorami z pierwszej odpowiedzi (If-None-Match) po upływie
+doby, a okładka jest pobierana tylko wtedy, gdy jej kopia jest już nieświeża
+według Cache-Control. Strona musi odpowiedzieć 304, a żadne żądanie okładki
+nie może dojść do Flaska.
+"""
+import io
+import re
+
+import pytest
+from flask import request, request_started
+
+BOOKS = 30
+PASSWORD = 'okladki123'
+# drugie wejście po dobie - krótki max-age (np. 60 s dla brakującej rendycji) już wygasł
+REVISIT_AFTER = 24 * 3600
+
+COVER_RE = re.compile(rb'(?:src|srcset)="(/uploads/covers/[^"]+)"')
+
+# (zalogowany użytkownik, url); {…} - id z wypełnionej bazy
+PAGES = [
+    (None, '/books'),
+    (None, '/books?page=2'),
+    (None, '/book/{first}'),
+    ('okladki', '/book/{second}'),
+]
+
+
+class Browser:
+    """Cache HTTP przeglądarki w uproszczeniu: świeżość z max-age, rewalidacja z ETag."""
+
+    def __init__(self, client):
+        self.client = client
+        self.now = 0
+        self.entries = {}  # url -> (etag, wygasa, treść)
+
+    def get(self, url):
+        """(status, treść); status None - odpowiedź z cache'u, bez żądania."""
+        etag, expires, body = self.entries.get(url, (None, None, None))
+        if expires is not None and self.now < expires:
+            return None, body
+        headers = {'If-None-Match': etag} if etag else {}
+        response = self.client.get(url, headers=headers)
+        if response.status_code == 200:
+            body = response.get_data()
+        cache_control = response.cache_control
+        if response.status_code in (200, 304) and not cache_control.no_store:
+            fresh_for = 0 if cache_control.no_cache else (cache_control.max_age or 0)
+            self.entries[url] = (response.headers.get('ETag', etag), self.now + fresh_for, body)
+        return response.status_code, body
+
+
+def cover_image(i):
+    from PIL import Image
+
+    data = io.BytesIO()
+    Image.new('RGB', (400, 600), (i * 7 % 256, i * 13 % 256, i * 29 % 256)).save(data, 'PNG')
+    return data.getvalue()
+
+
+@pytest.fixture(scope='module')
+def ids(app, database):
+    from werkzeug.datastructures import FileStorage
+    from app import seed_admin
+    import covers
+    import facets
+    import models
+
+    with app.app_context():
+        books = []
+        for i in range(BOOKS):
+            cover_url = covers.save_upload(app, FileStorage(io.BytesIO(cover_image(i)), filename=f'okladka{i}.png'))
+            books.append(models.Book(title=f'Książka {i:03d}', author=f'Autor {i % 7}', pages=200,
+                                     description='Opis', cover_url=cover_url))
+        database.session.add_all(books)
+        seed_admin('okladki', PASSWORD)
+        database.session.commit()
+        # rendycje od razu, a nie w tle - inaczej pierwsze wejście dostałoby oryginał na 60 s
+        covers.process_existing(app)
+        facets.index.load()
+        return {'first': books[0].id, 'second': books[1].id}
+
+
+@pytest.fixture
+def cover_requests(app):
+    """Ścieżki okładek, których żądania doszły do Flaska."""
+    paths = []
+
+    def record(sender, **extra):
+        if request.endpoint == 'uploaded_cover':
+            paths.append(request.path)
+
+    request_started.connect(record, app)
+    yield paths
+    request_started.disconnect(record, app)
+
+
+@pytest.mark.parametrize('username, url', PAGES, ids=[f'{username or "anonim"} {url}' for username, url in PAGES])
+def test_revisit_uses_browser_cache(app, ids, cover_requests, username, url):
+    url = url.format(**ids)
+    browser = Browser(app.test_client())
+    if username:
+        # przekierowanie zdejmuje komunikat flash - inaczej pierwsza strona nie dostałaby ETag
+        browser.client.post('/login', data={'username': username, 'password': PASSWORD},
+                            follow_redirects=True)
+    status, body = browser.get(url)
+    assert status == 200
+    covers_on_page = sorted(set(cover.decode() for cover in COVER_RE.findall(body)))
+    assert covers_on_page, 'brak okładek na stronie'
+    for cover in covers_on_page:
+        browser.get(cover)
+
+    browser.now += REVISIT_AFTER
+    del cover_requests[:]
+    status, body = browser.get(url)
+    for cover in COVER_RE.findall(body or b''):
+        browser.get(cover.decode())
+    assert status == 304, 'drugie wejście z If-None-Match'
+    assert not cover_requests, f'okładki doszły do Flaska: {sorted(set(cover_requests))}'
@@ -0,0 +1,158 @@
+"""Eksport katalogu i biblioteki w każdym formacie: wiersze zgodne z bazą,
+a wyeksportowany katalog wczytany importerem daje te same książki.
+
+Mała porcja eksportu (EXPORT_BATCH_SIZE) - dane idą kilkoma porcjami, ostatnia niepełna.
+"""
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+import exporter
+import importer
+
+FORMATS = ['csv', 'json', 'ndjson']
+BATCH_SIZE = 4
+GENRES = ['Fantastyka', 'Kryminał', 'Reportaż']
+TAGS = ['ekranizacja', 'klasyka', 'nagrodzone']
+SHELVES = ['Do przeczytania', 'Przeczytane', 'Ulubione']
+STARTED = datetime(2024, 3, 1, 12, 30)
+# kolumny katalogu, które importer wczytuje z powrotem
+BOOK_FIELDS = ['title', 'author', 'description', 'pages', 'isbn', 'genres', 'tags']
+
+
+def book_rows():
+    """Książki testowe: przecinki, cudzysłowy, nowe linie i puste pola - to, co psuje CSV."""
+    rows = []
+    for i in range(11):
+        rows.append({
+            'title': f'Książka {i}, tom "{i % 3}"',
+            'author': f'Żółkiewski {i % 4}',
+            'description': 'Pierwszy akapit, z przecinkiem.\n"Drugi" akapit' if i % 2 else '',
+            'pages': None if i % 5 == 0 else 100 + i,
+            'isbn': f'978{i:010d}' if i % 3 else '',
+            'genres': GENRES[:i % 4],
+            'tags': TAGS[i % 3:],
+        })
+    return rows
+
+
+def library_rows(book_ids):
+    """Pozycje biblioteki: (book_id, półka, dodano, ocena, recenzja) - co druga bez recenzji."""
+    return [(book_id, SHELVES[i % 3], STARTED + timedelta(days=i), (i % 5 + 1) if i % 2 == 0 else None,
+             f'Recenzja, "{i}"\nz drugą linią' if i % 2 == 0 else None)
+            for i, book_id in enumerate(book_ids[::2])]
+
+
+def plain(value):
+    """Wartość pola tak, jak wygląda w CSV - pozwala porównać wszystkie formaty jednakowo."""
+    if isinstance(value, list):
+        return '|'.join(value)
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    return '' if value is None else str(value)
+
+
+def parse(body, fmt):
+    """Rekordy z pliku eksportu, wczytane tak jak przy imporcie (BOM, nowe linie w polach)."""
+    records = []
+    for number, record in importer.iter_records(importer.open_text(io.BytesIO(body)), fmt):
+        assert isinstance(record, dict), f'wiersz {number}: {record}'
+        records.append(record)
+    return records
+
+
+def book(record):
+    return {field: plain(record[field]) for field in BOOK_FIELDS}
+
+
+@pytest.fixture(scope='module')
+def data(app, database):
+    from app import create_default_shelves
+    import facets
+    import models
+    import passwords
+
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    app.config['EXPORT_BATCH_SIZE'] = BATCH_SIZE
+    with app.app_context():
+        genres = {name: models.Genre(name=name) for name in GENRES}
+        tags = {name: models.Tag(name=name) for name in TAGS}
+        rows = book_rows()
+        books = [models.Book(title=row['title'], author=row['author'], description=row['description'],
+                             pages=row['pages'], isbn=row['isbn'],
+                             genres=[genres[name] for name in row['genres']],
+                             tags=[tags[name] for name in row['tags']])
+                 for row in rows]
+        moderator = models.User(username='eksport-moderator', password=passwords.hash_password('eksport123'),
+                                is_moderator=True)
+        reader = models.User(username='eksport-czytelnik', password=moderator.password)
+        database.session.add_all(books + [moderator, reader])
+        database.session.flush()
+        create_default_shelves(reader)
+        shelves = {shelf.name: shelf.id for shelf in models.Shelf.query.filter_by(user_id=reader.id)}
+
+        # kolejność id nie musi być kolejnością na liście - flush wstawia też przez relacje gatunków
+        books = {book.id: row for book, row in zip(books, rows)}
+        library = library_rows(sorted(books))
+        for book_id, shelf, added_at, rating, review in library:
+            database.session.add(models.UserLibrary(user_id=reader.id, book_id=book_id,
+                                                    shelf_id=shelves[shelf], added_at=added_at))
+            if rating:
+                database.session.add(models.Review(user_id=reader.id, book_id=book_id, rating=rating,
+                                                   text=review, created_at=added_at))
+        database.session.commit()
+        facets.index.load()
+        data = {'moderator': moderator.id, 'reader': reader.id, 'books': books, 'library': library}
+    # żądania poza kontekstem z fikstury - inaczej zalogowany użytkownik przechodzi między nimi przez g
+    yield data
+    app.config['EXPORT_BATCH_SIZE'] = batch_size
+
+
+@pytest.fixture(scope='module')
+def exports(app, data):
+    """Eksport katalogu w każdym formacie, pobrany zanim którykolwiek test coś zaimportuje."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(data['moderator'])
+    bodies = {}
+    for fmt in FORMATS:
+        response = client.get(f'/export/catalog.{fmt}')
+        assert response.status_code == 200
+        assert response.mimetype == exporter.MIMETYPES[fmt]
+        bodies[fmt] = response.get_data()
+    return bodies
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_catalog_export_rows(app, data, exports, fmt):
+    records = parse(exports[fmt], fmt)
+    assert [int(record['id']) for record in records] == sorted(data['books'])
+    assert [book(record) for record in records] == [book(data['books'][int(record['id'])]) for record in records]
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_catalog_round_trip(app, data, exports, fmt):
+    with app.app_context():
+        result = importer.import_books(importer.open_text(io.BytesIO(exports[fmt])), fmt, chunk_size=BATCH_SIZE)
+        imported = set(result.book_ids)
+        records = [record for batch in exporter.catalog_records() for record in batch if record['id'] in imported]
+    assert result.errors == []
+    assert [book(record) for record in records] == [book(data['books'][book_id]) for book_id in sorted(data['books'])]
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_library_export_rows(app, data, fmt):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(data['reader'])
+    response = client.get(f'/export/library.{fmt}')
+    assert response.status_code == 200
+
+    records = parse(response.get_data(), fmt)
+    fields = ['book_id', 'shelf', 'added_at', 'rating', 'review', 'reviewed_at']
+    assert [{field: plain(record[field]) for field in fields} for record in records] == [
+        dict(zip(fields, map(plain, (book_id, shelf, added_at, rating, review, rating and added_at))))
+        for book_id, shelf, added_at, rating, review in data['library']]
+    assert [record['title'] for record in records] == \
+        [data['books'][book_id]['title'] for book_id, *_ in data['library']]
@@ -0,0 +1,176 @@
+"""Maksymalna liczba zapytań SQL na trasę.
+
+Baza ma dane o realistycznych proporcjach, a każda trasa jest sprawdzana
+klientem testowym przy zimnym cache'u. Leniwe ładowanie dodane w szablonie
+zwiększa liczbę zapytań wraz z liczbą pozycji na stronie, więc przekracza budżet.
+"""
+import random
+
+import pytest
+from sqlalchemy import event
+
+from app import BOOK_SORT_ORDERS, LIBRARY_SORT_ORDERS
+
+# liczba zapytań nie może zależeć od liczby pozycji na stronie,
+# dlatego strony mają pełne 12 pozycji, a książka - wiele recenzji
+BOOKS = 240
+USERS = 25
+LIBRARY_SIZE = 60
+REVIEWS_PER_USER = 40
+PASSWORD = 'budzet123'
+READER = 'czytelnik0'
+
+# budżety dla zimnego cache'u; zalogowany użytkownik kosztuje dodatkowo load_user,
+# a /books i strona książki - zapytanie o wersję danych (ETag)
+BUDGETS = {
+    'home (anonim)': 3,
+    'home': 7,
+    'home (pusta biblioteka)': 7,
+    'books': 2,
+    'books: szukaj': 3,
+    'books: gatunek': 2,
+    'books: tag': 2,
+    'books: gatunki i tag': 2,
+    'books: strona 3': 3,
+    'book_details': 6,
+    'my_library': 5,
+    'my_library: półka': 5,
+    'my_library: szukaj': 5,
+    'my_shelves': 3,
+    'shelf_books': 4,
+    'profile': 9,
+}
+
+# (nazwa budżetu, zalogowany użytkownik, url); {…} - id z wypełnionej bazy
+ROUTES = [
+    ('home (anonim)', None, '/'),
+    ('home', READER, '/'),
+    ('home (pusta biblioteka)', 'nowy', '/'),
+    ('books: szukaj', None, '/books?search=ksiazka'),
+    ('books: gatunek', None, '/books?genre={genre}'),
+    ('books: tag', None, '/books?tag={tag}'),
+    ('books: gatunki i tag', None, '/books?genre={genre}&genre={other_genre}&tag={tag}'),
+    ('books: strona 3', None, '/books?page=3'),
+    ('book_details', READER, '/book/{book}'),
+    ('my_library: półka', READER, '/my_library?shelf={shelf}'),
+    ('my_library: szukaj', READER, '/my_library?search=ksiazka'),
+    ('my_shelves', READER, '/my_shelves'),
+    ('shelf_books', READER, '/shelf/{shelf}'),
+    ('profile', READER, '/profile'),
+]
+ROUTES += [('books', None, f'/books?sort_by={sort_by}') for sort_by in BOOK_SORT_ORDERS]
+ROUTES += [('my_library', READER, f'/my_library?sort_by={sort_by}') for sort_by in LIBRARY_SORT_ORDERS]
+
+
+def seed(db, models):
+    import passwords
+
+    rng = random.Random(42)
+    password = passwords.hash_password(PASSWORD)
+
+    genres = [models.Genre(name=f'Gatunek {i}') for i in range(12)]
+    tags = [models.Tag(name=f'tag{i}') for i in range(30)]
+    db.session.add_all(genres + tags)
+
+    books = []
+    for i in range(BOOKS):
+        book = models.Book(
+            title=f'Książka {i:04d}',
+            author=f'Autor {i % 40}',
+            description='Opis książki ' * 5,
+            pages=rng.randint(80, 900),
+            isbn=f'978{i:010d}',
+            genres=rng.sample(genres, 2),
+            tags=rng.sample(tags, 3)
+        )
+        books.append(book)
+    db.session.add_all(books)
+
+    users = [models.User(username=f'czytelnik{i}', password=password) for i in range(USERS)]
+    db.session.add_all(users)
+    db.session.flush()
+
+    for user in users:
+        shelves = [models.Shelf(user_id=user.id, name=name, is_default=is_default)
+                   for name, is_default in [('Do przeczytania', True), ('W trakcie czytania', True),
+                                            ('Przeczytane', True), ('Ulubione', False)]]
+        db.session.add_all(shelves)
+        db.session.flush()
+        for book in rng.sample(books, LIBRARY_SIZE):
+            db.session.add(models.UserLibrary(user_id=user.id, book_id=book.id,
+                                              shelf_id=rng.choice(shelves).id))
+        for book in [books[0]] + rng.sample(books[1:], REVIEWS_PER_USER - 1):
+            db.session.add(models.Review(user_id=user.id, book_id=book.id,
+                                         rating=rng.randint(1, 5), text='Recenzja'))
+    # użytkownik bez książek - inna gałąź strony głównej
+    db.session.add(models.User(username='nowy', password=password))
+    db.session.commit()
+
+    shelf = models.Shelf.query.filter_by(user_id=users[0].id, name='Przeczytane').first()
+    return {'book': books[0].id, 'genre': genres[0].id, 'other_genre': genres[1].id,
+            'tag': tags[0].id, 'shelf': shelf.id}
+
+
+@pytest.fixture(scope='module')
+def ids(app, database):
+    from app import recalculate_book_ratings
+    import models
+    import search
+    import library_stats
+    import recommendations
+    import facets
+
+    with app.app_context():
+        ids = seed(database, models)
+        search.rebuild_index()
+        library_stats.rebuild()
+        recommendations.rebuild()
+        recalculate_book_ratings()
+        # indeks fasetek wczytuje się raz na proces, nie w trakcie żądania
+        facets.index.load()
+    return ids
+
+
+@pytest.fixture(scope='module')
+def clients(app, ids):
+    """Klient testowy dla użytkownika (None - anonim), zalogowany raz na moduł."""
+    clients = {}
+
+    def get(username):
+        client = clients.get(username)
+        if client is None:
+            client = clients[username] = app.test_client()
+            if username:
+                client.post('/login', data={'username': username, 'password': PASSWORD})
+        return client
+    return get
+
+
+def count_queries(db, client, url):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return response.status_code, statements
+
+
+@pytest.mark.parametrize('name, username, url', ROUTES, ids=[f'{name} {url}' for name, _, url in ROUTES])
+def test_query_budget(app, database, ids, clients, name, username, url):
+    from extensions import cache
+
+    url = url.format(**ids)
+    client = clients(username)
+    # osobny kontekst aplikacji: inaczej g (i zalogowany użytkownik) przechodzi między żądaniami
+    with app.app_context():
+        cache.clear()
+        status, statements = count_queries(database, client, url)
+    assert status == 200
+    budget = BUDGETS[name]
+    assert len(statements) <= budget, f'{len(statements)} zapytań, budżet {budget}:\n' + '\n'.join(
+        f'    {" ".join(statement.split())[:160]}' for statement in statements)
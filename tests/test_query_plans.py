@@ -0,0 +1,42 @@
+"""Zapytania wykonywane przez trasy muszą korzystać z indeksów.
+
+To samo co flask check-query-plans, na małym zbiorze z dataset.generate():
+plany SQLite zależą od indeksów, a nie od liczby wierszy.
+"""
+import pytest
+
+import query_plans
+
+
+@pytest.fixture(scope='module')
+def queries(app, database):
+    import dataset
+    import facets
+
+    with app.app_context():
+        dataset.generate(books=500, users=30, library_size=20, genres=10, tags=40,
+                         neighbors=app.config['RECOMMENDATION_NEIGHBORS'])
+        facets.index.load()
+        yield [(name, statement, query_plans.explain(statement, parameters))
+               for name, statement, parameters in query_plans.hot_queries()]
+        database.session.rollback()
+
+
+def test_routes_use_indexes(queries):
+    names = {name.rsplit(' #', 1)[0] for name, _, _ in queries}
+    assert 'my_library: shelf' in names and 'book_details' in names
+
+    problems = []
+    for name, statement, plan in queries:
+        scans = query_plans.full_scans(plan)
+        if scans:
+            problems.append(f'{name}: pełny skan {", ".join(scans)}\n    {" ".join(statement.split())[:160]}\n'
+                            + '\n'.join(f'    {line}' for line in plan))
+    assert not problems, '\n'.join(problems)
+
+
+def test_full_scans():
+    plan = ['SCAN books', 'SEARCH reviews USING INDEX ix_reviews_book_id (book_id=?)',
+            'SCAN genres', 'SCAN user_library AS ul', 'USE TEMP B-TREE FOR ORDER BY']
+    assert query_plans.full_scans(plan) == ['books', 'user_library']
+    assert query_plans.full_scans(['  ->  Seq Scan on shelves  (cost=0.00..1.10 rows=1)']) == ['shelves']
@@ -0,0 +1,6 @@
+"""Wejście WSGI serwera produkcyjnego: gunicorn -c gunicorn.conf.py wsgi:app
+
+flask bez FLASK_APP też wczytuje ten moduł, więc nie ma tu żadnej pracy
+przy imporcie - rozgrzewkę przed forkiem robi hook when_ready (server.py).
+"""
+from app import app